@@ -0,0 +1,93 @@
+"""
+Concurrent throughput of the read endpoints under WSGI and ASGI.
+
+Every endpoint is hit with the same number of requests at the same concurrency through
+config.wsgi.application (requests run on a thread pool, like a threaded WSGI server) and
+through config.asgi.application (requests run as tasks on one event loop, like uvicorn).
+
+Usage:
+    python -m benchmarks.asgi_vs_wsgi [--comments 2000] [--requests 400] [--concurrency 32]
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import asgi_get, seed_thread, setup_django, wsgi_get
+
+
+def run_wsgi(application, path, query, requests, concurrency):
+    def one(_):
+        status, _body = wsgi_get(application, path, query)
+        assert status == 200, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return requests / (time.perf_counter() - started)
+
+
+def run_asgi(application, path, query, requests, concurrency):
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                status, _body = await asgi_get(application, path, query)
+                assert status == 200, status
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return requests / (time.perf_counter() - started)
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=2000, help='comments in the benchmark thread')
+    parser.add_argument('--requests', type=int, default=400, help='requests per endpoint and server')
+    parser.add_argument('--concurrency', type=int, default=32, help='requests in flight at once')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    setup_django()
+    discussion = seed_thread(args.comments)
+    first = discussion.comments.order_by('id').first()
+
+    from config.asgi import application as asgi_application
+    from config.wsgi import application as wsgi_application
+
+    # ?level/stream variants bypass the tree cache on purpose where noted, so the DB path is measured too
+    endpoints = [
+        ('discussion list', '/api/discussions/', ''),
+        ('discussion detail', f'/api/discussions/{discussion.id}/', ''),
+        ('comments (cached)', f'/api/discussions/{discussion.id}/comments/', ''),
+        ('comments (streamed)', f'/api/discussions/{discussion.id}/comments/', 'stream=true'),
+        ('replies (cached)', f'/api/discussions/{discussion.id}/comments/{first.id}/replies/', ''),
+    ]
+
+    results = []
+    for name, path, query in endpoints:
+        # warm up caches and imports outside the timed runs
+        wsgi_get(wsgi_application, path, query)
+        results.append({
+            'endpoint': name,
+            'wsgi_rps': run_wsgi(wsgi_application, path, query, args.requests, args.concurrency),
+            'asgi_rps': run_asgi(asgi_application, path, query, args.requests, args.concurrency),
+        })
+
+    if args.json:
+        print(json.dumps({'config': vars(args), 'results': results}, indent=2))
+        return
+
+    print(f"{args.comments} comments, {args.requests} requests per run, concurrency {args.concurrency}")
+    print(f"{'endpoint':<22}{'WSGI req/s':>12}{'ASGI req/s':>12}{'ASGI/WSGI':>11}")
+    for row in results:
+        ratio = row['asgi_rps'] / row['wsgi_rps']
+        print(f"{row['endpoint']:<22}{row['wsgi_rps']:>12.1f}{row['asgi_rps']:>12.1f}{ratio:>10.2f}x")
+
+
+if __name__ == '__main__':
+    main()
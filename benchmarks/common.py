@@ -0,0 +1,136 @@
+"""
+Shared setup for the benchmark scripts.
+
+Benchmarks run against a throwaway SQLite database, never the project's db.sqlite3, and
+call the real WSGI / ASGI applications in-process so no server has to be started.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from wsgiref.util import setup_testing_defaults
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(db_path=None, configure=None):
+    """
+    Configure Django for benchmarking and migrate a fresh database.
+
+    DEBUG is switched off so connection.queries doesn't grow for the whole run.
+    configure(settings), if given, can change more settings before Django is set up.
+
+    Returns:
+        str: The path of the SQLite database used.
+    """
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+    import django
+    from django.conf import settings
+
+    db_path = db_path or os.path.join(tempfile.mkdtemp(prefix='discussion-bench-'), 'bench.sqlite3')
+    settings.DATABASES['default']['NAME'] = db_path
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['localhost']
+    if configure:
+        configure(settings)
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return db_path
+
+
+def seed_thread(comments, fan_out=5, seed=0):
+    """
+    Create a discussion with `comments` comments, each attached to a random earlier comment.
+
+    Roughly one in fan_out comments is top level, which gives a bushy tree a few levels deep.
+
+    Returns:
+        Discussion
+    """
+    from discussion.seeding import seed_discussion
+
+    return seed_discussion(comments, 'random', max_depth=comments, fan_out=fan_out, seed=seed,
+                           title=f'Benchmark thread ({comments} comments)')
+
+
+def wsgi_get(application, path, query=''):
+    """Call a WSGI application with a GET request, returning (status code, body)."""
+    return wsgi_request(application, 'GET', path, query)
+
+
+def wsgi_request(application, method, path, query='', body=None):
+    """Call a WSGI application, with an optional JSON body, returning (status code, body)."""
+    environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_HOST': 'localhost', 'REQUEST_METHOD': method}
+    if body is not None:
+        data = json.dumps(body).encode()
+        environ.update({'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(data)), 'wsgi.input': io.BytesIO(data)})
+    setup_testing_defaults(environ)
+    status = []
+
+    def start_response(status_line, headers, exc_info=None):
+        status.append(int(status_line.split()[0]))
+
+    result = application(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return status[0], body
+
+
+async def asgi_get(application, path, query=''):
+    """Call an ASGI application with a GET request, returning (status code, body)."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'localhost')],
+        'client': ('127.0.0.1', 50000),
+        'server': ('localhost', 80),
+    }
+    request_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await disconnected.wait()  # the client stays connected until the response is done
+        return {'type': 'http.disconnect'}
+
+    status, chunks = None, []
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    await application(scope, receive, send)
+    disconnected.set()
+    return status, b''.join(chunks)
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
@@ -0,0 +1,102 @@
+"""
+Overhead of the request metrics: RequestMetricsMiddleware, the query recorder and timers.
+
+The same requests go through three WSGI handlers built in-process: without any
+instrumentation (middleware removed, query recorder uninstalled), with Server-Timing
+headers only (the default) and with the Prometheus histograms enabled as well. The
+variants run interleaved in several rounds, in a different order each round, and the
+median of the per round mean latency is reported, which keeps drift of the machine out of
+the comparison.
+
+Usage:
+    python -m benchmarks.instrumentation [--comments 500] [--requests 200] [--rounds 5]
+"""
+import argparse
+import json
+import statistics
+import time
+
+from .common import seed_thread, setup_django, wsgi_get
+
+MIDDLEWARE = 'discussion.middleware.RequestMetricsMiddleware'
+
+
+def mean_latency_ms(application, path, query, requests):
+    started = time.perf_counter()
+    for _ in range(requests):
+        status, _body = wsgi_get(application, path, query)
+        assert status == 200, status
+    return (time.perf_counter() - started) * 1000 / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=500, help='comments in the benchmark thread')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint, variant and round')
+    parser.add_argument('--rounds', type=int, default=5, help='interleaved rounds, the median counts')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+    from django.db.backends.signals import connection_created
+
+    from discussion.metrics import install_query_recorder, record_query
+
+    discussion = seed_thread(args.comments)
+    first = discussion.comments.order_by('id').first()
+
+    instrumented = WSGIHandler()
+    settings.MIDDLEWARE = [name for name in settings.MIDDLEWARE if name != MIDDLEWARE]
+    plain = WSGIHandler()
+
+    def set_variant(name):
+        settings.METRICS_ENABLED = name == 'histograms'
+        # the connection object outlives reconnects, so the recorder only needs adding/removing once
+        connection.ensure_connection()
+        if name == 'none':
+            connection_created.disconnect(dispatch_uid='request_metrics_query_recorder')
+            if record_query in connection.execute_wrappers:
+                connection.execute_wrappers.remove(record_query)
+            return plain
+        connection_created.connect(install_query_recorder, dispatch_uid='request_metrics_query_recorder')
+        install_query_recorder(None, connection)
+        return instrumented
+
+    endpoints = [
+        ('discussion detail', f'/api/discussions/{discussion.id}/', ''),
+        ('comments (cached)', f'/api/discussions/{discussion.id}/comments/', ''),
+        ('comments (streamed)', f'/api/discussions/{discussion.id}/comments/', 'stream=true'),
+        ('replies (level=1)', f'/api/discussions/{discussion.id}/comments/{first.id}/replies/', 'level=1'),
+    ]
+    variants = ('none', 'server-timing', 'histograms')
+
+    results = []
+    for name, path, query in endpoints:
+        rounds = {variant: [] for variant in variants}
+        for number in range(args.rounds):
+            # rotate the order every round so no variant always runs first
+            for variant in variants[number % 3:] + variants[:number % 3]:
+                application = set_variant(variant)
+                wsgi_get(application, path, query)  # warm up
+                rounds[variant].append(mean_latency_ms(application, path, query, args.requests))
+        medians = {variant: statistics.median(values) for variant, values in rounds.items()}
+        results.append({'endpoint': name, **{f'{variant}_ms': medians[variant] for variant in variants}})
+
+    if args.json:
+        print(json.dumps({'config': vars(args), 'results': results}, indent=2))
+        return
+
+    print(f"{args.comments} comments, {args.requests} requests x {args.rounds} rounds, mean latency per request")
+    print(f"{'endpoint':<22}{'none ms':>9}{'timing ms':>11}{'overhead':>10}{'histo ms':>10}{'overhead':>10}")
+    for row in results:
+        base = row['none_ms']
+        print(f"{row['endpoint']:<22}{base:>9.3f}"
+              f"{row['server-timing_ms']:>11.3f}{(row['server-timing_ms'] / base - 1) * 100:>9.1f}%"
+              f"{row['histograms_ms']:>10.3f}{(row['histograms_ms'] / base - 1) * 100:>9.1f}%")
+
+
+if __name__ == '__main__':
+    main()
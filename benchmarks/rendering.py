@@ -0,0 +1,84 @@
+"""
+Rows per second through the response serializers and JSON renderers, before and after.
+
+"before" is DRF's JSONRenderer and the ModelSerializers, "after" is FastJSONRenderer and
+the read only serializers the views use now. Every measurement is the best of --repeat
+runs over the same rows, outside of any request handling.
+
+Usage:
+    python -m benchmarks.rendering [--comments 5000] [--discussions 2000] [--repeat 5]
+"""
+import argparse
+import json
+import time
+
+from .common import seed_thread, setup_django
+
+
+def rows_per_second(function, rows, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return rows / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=5000, help='comments in the benchmark thread')
+    parser.add_argument('--discussions', type=int, default=2000, help='discussions serialized per run')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement, the best one counts')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+
+    from discussion import renderers
+    from discussion.models import Discussion
+    from discussion.renderers import FastJSONRenderer
+    from discussion.serializers import (DiscussionReadSerializer, DiscussionSerializer,
+                                        FlatCommentReadSerializer, FlatCommentSerializer)
+
+    discussion = seed_thread(args.comments)
+    Discussion.objects.bulk_create([Discussion(user='bench', title=f'Discussion {i}') for i in range(args.discussions - 1)])
+    tree = discussion.get_comments_flat()
+    discussions = list(Discussion.objects.all()[:args.discussions])
+    comments = list(discussion.comments.all())
+    old, new = JSONRenderer(), FastJSONRenderer()
+
+    cases = [
+        ('comment tree, render', len(tree),
+         lambda: old.render(tree),
+         lambda: new.render(tree)),
+        ('discussions, serialize + render', len(discussions),
+         lambda: old.render(DiscussionSerializer(discussions, many=True).data),
+         lambda: new.render(DiscussionReadSerializer(discussions, many=True).data)),
+        ('comments, serialize', len(comments),
+         lambda: [FlatCommentSerializer(comment).data for comment in comments],
+         lambda: [FlatCommentReadSerializer(comment).data for comment in comments]),
+    ]
+
+    results = []
+    for name, rows, before, after in cases:
+        results.append({
+            'case': name,
+            'rows': rows,
+            'before_rows_per_s': rows_per_second(before, rows, args.repeat),
+            'after_rows_per_s': rows_per_second(after, rows, args.repeat),
+        })
+
+    if args.json:
+        print(json.dumps({'config': vars(args), 'orjson': renderers.orjson is not None, 'results': results}, indent=2))
+        return
+
+    print(f"orjson {'installed' if renderers.orjson else 'missing, FastJSONRenderer uses the stdlib encoder'}")
+    print(f"{'case':<34}{'rows':>7}{'before rows/s':>15}{'after rows/s':>15}{'speedup':>9}")
+    for row in results:
+        speedup = row['after_rows_per_s'] / row['before_rows_per_s']
+        print(f"{row['case']:<34}{row['rows']:>7}{row['before_rows_per_s']:>15,.0f}{row['after_rows_per_s']:>15,.0f}{speedup:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
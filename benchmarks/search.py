@@ -0,0 +1,113 @@
+"""
+First page of search results with the FTS5 index, against icontains scans.
+
+Seeds --comments comments (a million by default, in threads of --per-discussion) whose text
+comes from the Zipf distributed vocabulary of discussion.seeding, then times a first page
+of results for a common, a middling and a rare word and a two word query:
+
+- icontains: Comment.content__icontains / Discussion.title__icontains for every word,
+  newest first, which is what finding anything took before the index.
+- fts: discussion.search.search(), ranked by bm25, the query behind GET /api/search/.
+
+Seeding a million comments takes several minutes, pass --db to keep the database and
+reuse it on the next run.
+
+Usage:
+    python -m benchmarks.search [--comments 1000000] [--per-discussion 10000] [--repeat 5]
+        [--db path/to/bench.sqlite3]
+"""
+import argparse
+import json
+import os
+import time
+
+from .common import percentile, setup_django
+
+
+def timings(function, repeat):
+    """Latencies in ms of `repeat` calls, after a warm up call, and the last result."""
+    result = function()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        durations.append((time.perf_counter() - started) * 1000)
+    return durations, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=1_000_000, help='comments to seed')
+    parser.add_argument('--per-discussion', type=int, default=10_000, help='comments per discussion')
+    parser.add_argument('--page-size', type=int, default=20, help='results per page')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per query')
+    parser.add_argument('--db', help='SQLite file to use, seeded only if it has no comments yet')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    db_path = setup_django(args.db)
+    from django.db.models import Q
+
+    from discussion.models import Comment, Discussion
+    from discussion.search import match_expression, search
+    from discussion.seeding import SHAPES, VOCABULARY, seed_discussion
+
+    seeded_in = None
+    if not Comment.objects.exists():
+        started = time.perf_counter()
+        for number in range(0, args.comments, args.per_discussion):
+            shape = SHAPES[number // args.per_discussion % len(SHAPES)]
+            seed_discussion(min(args.per_discussion, args.comments - number), shape, seed=number)
+        seeded_in = time.perf_counter() - started
+    total = Comment.objects.count()
+
+    def icontains(text):
+        words = text.split()
+        comments = Comment.objects.filter(*[Q(content__icontains=word) for word in words])
+        discussions = Discussion.objects.filter(*[Q(title__icontains=word) for word in words])
+        return [*comments.order_by('-created_at')[:args.page_size],
+                *discussions.order_by('-created_at')[:args.page_size]][:args.page_size]
+
+    def fts(text):
+        return search(text, limit=args.page_size)
+
+    queries = [
+        ('common word', VOCABULARY[0]),
+        ('middling word', VOCABULARY[100]),
+        ('rare word', VOCABULARY[4000]),
+        ('two words', f'{VOCABULARY[20]} {VOCABULARY[300]}'),
+    ]
+    results = []
+    for name, text in queries:
+        matches = count_matches(match_expression(text))
+        for method, function in [('icontains', icontains), ('fts', fts)]:
+            durations, page = timings(lambda: function(text), args.repeat)
+            results.append({
+                'query': name, 'text': text, 'matching_comments': matches, 'method': method,
+                'results': len(page),
+                'p50_ms': percentile(durations, 0.5), 'p95_ms': percentile(durations, 0.95),
+            })
+
+    if args.json:
+        print(json.dumps({'config': vars(args), 'comments': total, 'results': results}, indent=2))
+        return
+
+    print(f"{total} comments in {db_path} ({os.path.getsize(db_path) / 2**20:.0f} MiB)"
+          + (f", seeded in {seeded_in:.0f} s" if seeded_in else ""))
+    print(f"{'query':<15}{'text':<18}{'matches':>9}{'method':>11}{'results':>9}{'p50 ms':>10}{'p95 ms':>10}")
+    for row in results:
+        print(f"{row['query']:<15}{row['text']:<18}{row['matching_comments']:>9}{row['method']:>11}"
+              f"{row['results']:>9}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}")
+
+
+def count_matches(query):
+    """Number of comments matching an FTS5 query, to report how selective it is."""
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT count(*) FROM discussion_comment_search WHERE discussion_comment_search MATCH %s", [query])
+        return cursor.fetchone()[0]
+
+
+if __name__ == '__main__':
+    main()
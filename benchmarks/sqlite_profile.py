@@ -0,0 +1,163 @@
+"""
+Mixed read/write load against SQLite with and without the tuned connection profile.
+
+Each profile runs in its own process on a fresh database file:
+
+- default: what Django does out of the box, rollback journal, SQLite's default PRAGMAs,
+  deferred transactions and a new connection per request.
+- tuned: the project settings, WAL and the other SQLITE_PRAGMAS, IMMEDIATE transactions
+  and persistent connections (CONN_MAX_AGE).
+
+Worker processes, each with a few threads like the workers of a WSGI server, send
+requests through config.wsgi.application for a fixed time. Each
+request is a comment create with probability --write-ratio, otherwise a streamed read of
+a discussion's tree (streaming bypasses the tree cache, so every read hits the database).
+Reported are completed requests per second, read and write latencies and the number of
+failed requests (e.g. 500s from "database is locked").
+
+Usage:
+    python -m benchmarks.sqlite_profile [--processes 4] [--threads 4] [--seconds 10] [--write-ratio 0.2]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from .common import percentile, seed_thread, setup_django, wsgi_get, wsgi_request
+
+PROFILES = ('default', 'tuned')
+
+
+def configure_profile(profile):
+    def configure(settings):
+        if profile == 'default':
+            settings.DATABASES['default'].update({'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': {}})
+            settings.SQLITE_PRAGMAS = {}
+        # request metrics off, they'd be the same in both profiles
+        settings.MIDDLEWARE = [name for name in settings.MIDDLEWARE if not name.startswith('discussion.')]
+    return configure
+
+
+def run_load(targets, args, seed):
+    """Send requests from args.threads threads until the deadline, returning (read ms, write ms, failures)."""
+    from django.db import connections
+
+    from config.wsgi import application
+
+    reads, writes, failures = [], [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def worker(number):
+        rng = random.Random(seed * 1000 + number)
+        own_reads, own_writes, own_failures = [], [], 0
+        while time.perf_counter() < deadline:
+            discussion_id, comment_ids = rng.choice(targets)
+            started = time.perf_counter()
+            if rng.random() < args.write_ratio:
+                status, _body = wsgi_request(application, 'POST', f'/api/discussions/{discussion_id}/comments/',
+                                             body={'user': 'bench', 'content': 'Load test', 'parent': rng.choice(comment_ids)})
+                ok, latencies = status == 201, own_writes
+            else:
+                status, _body = wsgi_get(application, f'/api/discussions/{discussion_id}/comments/', 'stream=true')
+                ok, latencies = status == 200, own_reads
+            if ok:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                own_failures += 1
+        connections.close_all()
+        with lock:
+            reads.extend(own_reads)
+            writes.extend(own_writes)
+            failures.append(own_failures)
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return reads, writes, sum(failures)
+
+
+def run_profile(profile, args):
+    """Seed a database and put it under load from args.processes processes, returning the results."""
+    setup_django(configure=configure_profile(profile))
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)  # failed requests are counted instead
+    from django.db import connection, connections
+
+    discussions = [seed_thread(args.comments, seed=number) for number in range(args.discussions)]
+    targets = [(discussion.id, list(discussion.comments.values_list('id', flat=True))) for discussion in discussions]
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        journal_mode = cursor.fetchone()[0]
+    connections.close_all()  # nothing open crosses the fork
+
+    # processes like the workers of a WSGI server, each with its own threads and connections
+    context = multiprocessing.get_context('fork')
+    started = time.perf_counter()
+    with context.Pool(args.processes) as pool:
+        loads = pool.starmap(run_load, [(targets, args, number) for number in range(args.processes)])
+    elapsed = time.perf_counter() - started
+
+    reads = [latency for load in loads for latency in load[0]]
+    writes = [latency for load in loads for latency in load[1]]
+    return {
+        'profile': profile,
+        'journal_mode': journal_mode,
+        'requests_per_s': (len(reads) + len(writes)) / elapsed,
+        'reads': len(reads),
+        'writes': len(writes),
+        'failed': sum(load[2] for load in loads),
+        'read_p50_ms': percentile(reads, 0.50),
+        'read_p95_ms': percentile(reads, 0.95),
+        'write_p50_ms': percentile(writes, 0.50),
+        'write_p95_ms': percentile(writes, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4, help='server processes sending requests')
+    parser.add_argument('--threads', type=int, default=4, help='concurrent clients per process')
+    parser.add_argument('--seconds', type=float, default=10, help='duration of the load per profile')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='share of requests that create a comment')
+    parser.add_argument('--discussions', type=int, default=8, help='discussions the load is spread over')
+    parser.add_argument('--comments', type=int, default=300, help='comments per discussion before the run')
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--worker', choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_profile(args.worker, args)))
+        return
+
+    results = []
+    for profile in args.profiles:
+        # a process per profile, settings and the database file start from scratch
+        command = [sys.executable, '-m', 'benchmarks.sqlite_profile', '--worker', profile] + [
+            f'--{name}={getattr(args, name.replace("-", "_"))}'
+            for name in ('processes', 'threads', 'seconds', 'write-ratio', 'discussions', 'comments')
+        ]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps({'config': vars(args), 'results': results}, indent=2))
+        return
+
+    print(f"{args.processes} processes x {args.threads} threads for {args.seconds:g}s, "
+          f"{args.write_ratio:.0%} writes, {args.discussions} discussions")
+    print(f"{'profile':<9}{'journal':>8}{'req/s':>9}{'failed':>8}{'read p50':>10}{'read p95':>10}{'write p50':>11}{'write p95':>11}")
+    for row in results:
+        print(f"{row['profile']:<9}{row['journal_mode']:>8}{row['requests_per_s']:>9.1f}{row['failed']:>8}"
+              f"{row['read_p50_ms']:>10.1f}{row['read_p95_ms']:>10.1f}{row['write_p50_ms']:>11.1f}{row['write_p95_ms']:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
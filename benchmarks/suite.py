@@ -0,0 +1,193 @@
+"""
+Latency, queries and memory of the comment tree code paths for each synthetic tree shape.
+
+For every shape in discussion.seeding (random, deep, wide, power-law) a thread is seeded and
+these are measured:
+
+- get_comments_flat / get_replies_flat: the model methods, called directly.
+- discussion_comments / replies: GET through config.wsgi.application, with the comment
+  tree cache invalidated (untimed) before every request so the database path is measured.
+- discussion_comments_most_replies / discussion_comments_collapsed: the same GET with
+  ?sort=most_replies and with ?children=3.
+- create: POST of a reply to the deepest comment.
+
+Each one reports p50/p95/p99 latency, queries per request and the peak memory allocated
+by a single call (measured in a separate tracemalloc run, so tracing doesn't skew the
+latencies).
+
+Results can be written as JSON with --output and compared to an earlier file with
+--baseline. The run exits with status 1 when a p95 latency or peak memory grew by more
+than --threshold (and by more than --min-delta-ms for latencies, to ignore noise on
+sub-millisecond calls) or when a call makes more queries than it used to.
+
+Usage:
+    python -m benchmarks.suite [--comments 2000] [--requests 50] [--shapes random deep]
+        [--output results.json] [--baseline previous.json] [--threshold 0.25]
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from .common import percentile, setup_django, wsgi_get, wsgi_request
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries run while it's installed."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(call, requests, prepare=None):
+    """Time `requests` calls of call(), returning latencies (ms), queries per call and peak KiB."""
+    from django.db import connection
+
+    for _ in range(3):  # warm up imports and the statement cache
+        prepare and prepare()
+        call()
+
+    latencies, queries = [], []
+    for _ in range(requests):
+        prepare and prepare()
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            call()
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+
+    prepare and prepare()
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'queries': max(queries),
+        'peak_kib': peak / 1024,
+    }
+
+
+def benchmark_shape(shape, args):
+    from config.wsgi import application
+    from discussion.cache import comment_tree_cache
+    from discussion.seeding import seed_discussion
+
+    discussion = seed_discussion(args.comments, shape, args.max_depth, args.fan_out)
+    # the top level comment with the biggest subtree, and the deepest comment
+    busiest = discussion.comments.filter(depth=0).order_by('-descendant_count', 'id').first()
+    deepest = discussion.comments.order_by('-depth', 'id').first()
+    comments_path = f'/api/discussions/{discussion.id}/comments/'
+    replies_path = f'{comments_path}{busiest.id}/replies/'
+
+    def get(path, query=''):
+        def call():
+            status, _body = wsgi_get(application, path, query)
+            assert status == 200, (path, status)
+        return call
+
+    def create():
+        status, _body = wsgi_request(application, 'POST', comments_path,
+                                     body={'user': 'bench', 'content': 'Benchmark reply', 'parent': deepest.id})
+        assert status == 201, status
+
+    def invalidate():
+        comment_tree_cache.bump(discussion.id)
+
+    endpoints = [
+        ('get_comments_flat', discussion.get_comments_flat, None),
+        ('get_replies_flat', busiest.get_replies_flat, None),
+        ('discussion_comments', get(comments_path), invalidate),
+        ('discussion_comments_most_replies', get(comments_path, 'sort=most_replies'), invalidate),
+        ('discussion_comments_collapsed', get(comments_path, 'children=3'), invalidate),
+        ('replies', get(replies_path), invalidate),
+        ('create', create, None),
+    ]
+    return [
+        {'shape': shape, 'endpoint': name, **measure(call, args.requests, prepare)}
+        for name, call, prepare in endpoints
+    ]
+
+
+def find_regressions(results, baseline, threshold, min_delta_ms):
+    """Compare results to a baseline run, returning a description of every regression."""
+    previous = {(row['shape'], row['endpoint']): row for row in baseline['results']}
+    regressions = []
+    for row in results:
+        before = previous.get((row['shape'], row['endpoint']))
+        if before is None:
+            continue
+        name = f"{row['shape']} {row['endpoint']}"
+        if (row['p95_ms'] > before['p95_ms'] * (1 + threshold)
+                and row['p95_ms'] - before['p95_ms'] > min_delta_ms):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f} ms -> {row['p95_ms']:.2f} ms")
+        if row['queries'] > before['queries']:
+            regressions.append(f"{name}: {before['queries']} -> {row['queries']} queries per request")
+        if row['peak_kib'] > before['peak_kib'] * (1 + threshold):
+            regressions.append(f"{name}: peak memory {before['peak_kib']:.0f} KiB -> {row['peak_kib']:.0f} KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=2000, help='comments per thread')
+    parser.add_argument('--requests', type=int, default=50, help='timed calls per endpoint')
+    parser.add_argument('--shapes', nargs='+', default=None, help='tree shapes to run (default: all)')
+    parser.add_argument('--max-depth', type=int, default=50, help='deepest comment level of the threads')
+    parser.add_argument('--fan-out', type=int, default=5, help='roughly one in FAN_OUT comments is top level')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative growth (0.25 is 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore p95 growth smaller than this')
+    args = parser.parse_args()
+
+    setup_django()
+    from discussion.seeding import SHAPES
+
+    shapes = args.shapes or list(SHAPES)
+    unknown = set(shapes) - set(SHAPES)
+    if unknown:
+        parser.error(f"unknown shapes: {', '.join(sorted(unknown))} (expected {', '.join(SHAPES)})")
+
+    results = []
+    for shape in shapes:
+        results.extend(benchmark_shape(shape, args))
+
+    print(f"{args.comments} comments per thread, {args.requests} requests per endpoint")
+    print(f"{'shape':<11}{'endpoint':<34}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak KiB':>10}")
+    for row in results:
+        print(f"{row['shape']:<11}{row['endpoint']:<34}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+              f"{row['p99_ms']:>9.2f}{row['queries']:>9}{row['peak_kib']:>10.0f}")
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'config': config, 'results': results}, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if (baseline['config']['comments'], baseline['config']['max_depth']) != (args.comments, args.max_depth):
+            print("warning: the baseline was run with different --comments / --max-depth", file=sys.stderr)
+        regressions = find_regressions(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
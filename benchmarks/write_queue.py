@@ -0,0 +1,157 @@
+"""
+Comment creation throughput with and without the group commit write queue.
+
+Each mode runs in its own process on a fresh database file, with the project's tuned
+SQLite settings (--synchronous full makes every commit sync the WAL to disk):
+
+- direct: every POST writes its comment in its own transaction (COMMENT_WRITE_QUEUE off).
+- queued: POSTs hand their comment to the process's writer thread, which commits the
+  comments of concurrent requests together (COMMENT_WRITE_QUEUE on).
+
+Worker processes, each with a few threads like the workers of a WSGI server, create
+comments through config.wsgi.application for a fixed time, replying to random comments
+of a few discussions. Reported are committed comments (201s) per second, request
+latencies, failed requests (e.g. 500s from "database is locked") and, for the queue, the
+average number of comments per transaction.
+
+Usage:
+    python -m benchmarks.write_queue [--processes 4] [--threads 8] [--seconds 10]
+        [--batch-delay-ms 2] [--batch-size 200] [--synchronous normal|full]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import random
+import subprocess
+import sys
+import threading
+import time
+
+from .common import percentile, seed_thread, setup_django, wsgi_request
+
+MODES = ('direct', 'queued')
+
+
+def configure_mode(mode, args):
+    def configure(settings):
+        settings.COMMENT_WRITE_QUEUE = mode == 'queued'
+        settings.COMMENT_WRITE_BATCH_SIZE = args.batch_size
+        settings.COMMENT_WRITE_BATCH_DELAY_MS = args.batch_delay_ms
+        settings.SQLITE_PRAGMAS = {**settings.SQLITE_PRAGMAS, 'synchronous': args.synchronous}
+        # request metrics off, they'd be the same in both modes
+        settings.MIDDLEWARE = [name for name in settings.MIDDLEWARE if not name.startswith('discussion.')]
+    return configure
+
+
+def run_load(targets, args, seed):
+    """Create comments from args.threads threads until the deadline, returning (latencies ms, failures, batches, comments)."""
+    from django.db import connections
+
+    from config.wsgi import application
+    from discussion.write_queue import comment_write_queue
+
+    latencies, failures = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def worker(number):
+        rng = random.Random(seed * 1000 + number)
+        own_latencies, own_failures = [], 0
+        while time.perf_counter() < deadline:
+            discussion_id, comment_ids = rng.choice(targets)
+            started = time.perf_counter()
+            status, _body = wsgi_request(application, 'POST', f'/api/discussions/{discussion_id}/comments/',
+                                         body={'user': 'bench', 'content': 'Load test', 'parent': rng.choice(comment_ids)})
+            if status == 201:
+                own_latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                own_failures += 1
+        connections.close_all()
+        with lock:
+            latencies.extend(own_latencies)
+            failures.append(own_failures)
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    comment_write_queue.stop()
+    return latencies, sum(failures), comment_write_queue.batches, comment_write_queue.comments
+
+
+def run_mode(mode, args):
+    """Seed a database and create comments from args.processes processes, returning the results."""
+    setup_django(configure=configure_mode(mode, args))
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)  # failed requests are counted instead
+    from django.db import connections
+
+    discussions = [seed_thread(args.comments, seed=number) for number in range(args.discussions)]
+    targets = [(discussion.id, list(discussion.comments.values_list('id', flat=True))) for discussion in discussions]
+    connections.close_all()  # nothing open crosses the fork
+
+    context = multiprocessing.get_context('fork')
+    started = time.perf_counter()
+    with context.Pool(args.processes) as pool:
+        loads = pool.starmap(run_load, [(targets, args, number) for number in range(args.processes)])
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for load in loads for latency in load[0]]
+    batches = sum(load[2] for load in loads)
+    return {
+        'mode': mode,
+        'commits_per_s': len(latencies) / elapsed,
+        'created': len(latencies),
+        'failed': sum(load[1] for load in loads),
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'comments_per_transaction': sum(load[3] for load in loads) / batches if batches else 1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4, help='server processes sending requests')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent clients per process')
+    parser.add_argument('--seconds', type=float, default=10, help='duration of the load per mode')
+    parser.add_argument('--discussions', type=int, default=8, help='discussions the comments are spread over')
+    parser.add_argument('--comments', type=int, default=300, help='comments per discussion before the run')
+    parser.add_argument('--batch-size', type=int, default=200, help='COMMENT_WRITE_BATCH_SIZE')
+    parser.add_argument('--batch-delay-ms', type=float, default=2, help='COMMENT_WRITE_BATCH_DELAY_MS')
+    parser.add_argument('--synchronous', choices=('normal', 'full'), default='normal',
+                        help='SQLite synchronous PRAGMA, full syncs the WAL on every commit')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--worker', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_mode(args.worker, args)))
+        return
+
+    results = []
+    for mode in args.modes:
+        # a process per mode, settings and the database file start from scratch
+        command = [sys.executable, '-m', 'benchmarks.write_queue', '--worker', mode] + [
+            f'--{name}={getattr(args, name.replace("-", "_"))}'
+            for name in ('processes', 'threads', 'seconds', 'discussions', 'comments', 'batch-size', 'batch-delay-ms', 'synchronous')
+        ]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps({'config': vars(args), 'results': results}, indent=2))
+        return
+
+    print(f"{args.processes} processes x {args.threads} threads for {args.seconds:g}s, "
+          f"batches of up to {args.batch_size} waiting {args.batch_delay_ms:g} ms, synchronous={args.synchronous}")
+    print(f"{'mode':<8}{'commits/s':>11}{'failed':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'per txn':>9}")
+    for row in results:
+        print(f"{row['mode']:<8}{row['commits_per_s']:>11.1f}{row['failed']:>8}{row['p50_ms']:>9.1f}"
+              f"{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['comments_per_transaction']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,14 +3,37 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Requests are resolved against config/urls_asgi.py, which serves the read endpoints with
+native async views instead of running the DRF views in a worker thread.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+
+class AsyncReadRequest(ASGIRequest):
+    # Django resolves a request against its own urlconf when it has one
+    urlconf = 'config.urls_asgi'
+
+
+class AsyncReadASGIHandler(ASGIHandler):
+    request_class = AsyncReadRequest
+
+
+def apply_asgi_database_settings():
+    """Use ASGI_CONN_MAX_AGE for every database, before any connection is opened."""
+    from django.conf import settings
+    for database in settings.DATABASES.values():
+        database['CONN_MAX_AGE'] = settings.ASGI_CONN_MAX_AGE
+
+
+apply_asgi_database_settings()
+django.setup(set_prefix=False)
+application = AsyncReadASGIHandler()
@@ -43,6 +43,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so its Server-Timing total covers the rest of the stack
+    'discussion.middleware.RequestMetricsMiddleware',
+    # before anything that queries the database
+    'discussion.db_routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,9 +84,91 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # keep connections open across requests under WSGI, the PRAGMAs below then run once
+        # per connection (config/asgi.py uses ASGI_CONN_MAX_AGE instead)
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # take the write lock when a transaction starts: a deferred transaction that has to
+            # upgrade from read to write fails with "database is locked" instead of waiting
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# CONN_MAX_AGE of every database when serving through config/asgi.py. Persistent connections
+# belong to a thread, and under ASGI sync ORM calls don't run on the same threads from one
+# request to the next, so connections kept open would never be reused and pile up until
+# they time out. 0 closes them at the end of each request, as Django advises for ASGI.
+ASGI_CONN_MAX_AGE = 0
+
+# Read replicas (discussion/db_routers.py)
+# Safe requests read from these aliases of DATABASES, {alias: weight}. Empty means everything
+# uses 'default'. To try it locally with SQLite files, add e.g.
+#     DATABASES['replica1'] = {**DATABASES['default'], 'NAME': BASE_DIR / 'db-replica1.sqlite3', 'TEST': {'MIRROR': 'default'}}
+#     DATABASE_REPLICAS = {'replica1': 1}
+# and copy the primary into it with `python manage.py sync_replicas`.
+DATABASE_ROUTERS = ['discussion.db_routers.ReplicaRouter']
+DATABASE_REPLICAS = {}
+DATABASE_REPLICA_SELECTION = 'round-robin'  # or 'weighted', random in proportion to the weights
+# After a write, the client's reads stay on the primary this long (cookie), so it sees its own writes
+DATABASE_PRIMARY_STICKY_SECONDS = 10
+
+# Applied in order to every new SQLite connection (discussion/sqlite.py), {} keeps SQLite's defaults
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',  # readers don't block the writer and the writer doesn't block readers
+    'synchronous': 'normal',  # fsync at checkpoints only, safe with WAL (a crash can lose the last commits, not corrupt)
+    'busy_timeout': 5000,  # ms to wait for the write lock before "database is locked"
+    'cache_size': -64000,  # page cache per connection, negative is KiB (64 MB)
+    'mmap_size': 256 * 1024 * 1024,  # read the first 256 MB of the file through mmap
+    'temp_store': 'memory',  # temp tables and sort spills in memory
+}
+
+# Group commit of new comments (discussion/write_queue.py), off by default
+# On, a writer thread per process inserts the comments of concurrent create requests in one
+# transaction, each request still returns its 201 only once its comment is committed.
+COMMENT_WRITE_QUEUE = False
+COMMENT_WRITE_BATCH_SIZE = 200  # comments per transaction at most
+COMMENT_WRITE_BATCH_DELAY_MS = 2  # how long a batch waits for more comments after its first one
+COMMENT_WRITE_TIMEOUT = 10  # s a request waits for the writer to take its comment before a 503
+
+# Live comment stream over Server-Sent Events (discussion/events.py), ASGI only
+# The in-process backend reaches the streams of the same process, with several processes
+# point this at a backend over a shared broker.
+COMMENT_EVENTS_BACKEND = 'discussion.events.InProcessBackend'
+COMMENT_STREAM_BUFFER = 256  # events buffered per client, a client further behind is disconnected
+COMMENT_STREAM_HEARTBEAT_SECONDS = 15  # idle streams get a comment line this often, so proxies keep them open
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# 'comment_trees' holds serialized flat comment trees, versioned per discussion (see discussion/cache.py).
+# Point it at any Django cache backend, e.g. Redis or Memcached when running several processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'comment_trees': {
+        'BACKEND': 'discussion.cache.CountingLocMemCache',
+        'LOCATION': 'comment-trees',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,  # LRU bound, least recently read trees are evicted first
+            'CULL_FREQUENCY': 10,  # evict a tenth of the entries when full
+        },
+    },
+}
+
+COMMENT_TREE_CACHE_ALIAS = 'comment_trees'
+
+
+# Request metrics (discussion/metrics.py)
+# Server-Timing response headers with SQL, serialization and render times of each request
+SERVER_TIMING = True
+# Per endpoint histograms served in the Prometheus text format at /metrics, off by default
+METRICS_ENABLED = False
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -128,5 +214,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny', # no authentication
-    ]
+    ],
+    # keyset pagination on (created_at, id), clients can ask for up to 100 per page with ?page_size=
+    'DEFAULT_PAGINATION_CLASS': 'discussion.pagination.CreatedAtCursorPagination',
+    'PAGE_SIZE': 20,
+    # orjson backed JSON when installed, same bytes as DRF's JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': [
+        'discussion.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
\ No newline at end of file
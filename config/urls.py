@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 
 from rest_framework import permissions
+from discussion.metrics import metrics_view
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
@@ -38,5 +39,7 @@ urlpatterns = [
     path('swagger.json', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    # 404 unless settings.METRICS_ENABLED
+    path('metrics', metrics_view, name='metrics'),
     ]
 
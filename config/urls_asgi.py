@@ -0,0 +1,14 @@
+"""
+URL configuration used when serving through config/asgi.py.
+
+Identical to config/urls.py except that the API is routed through discussion/urls_asgi.py,
+whose read endpoints are native async views.
+"""
+from django.urls import path, include
+
+from .urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('api/', include('discussion.urls_asgi')),
+    *wsgi_urlpatterns,
+]
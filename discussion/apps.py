@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class DiscussionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'discussion'
+
+    def ready(self):
+        from .metrics import install_query_recorder
+        from .sqlite import apply_sqlite_pragmas
+        from .signals import comment_deleted, comment_deleting, comment_saved, discussion_saved
+        from .models import Comment, Discussion
+
+        # keep change markers and the comment tree cache in step with writes made anywhere, not just the API
+        post_save.connect(discussion_saved, sender=Discussion, dispatch_uid='discussion_tree_cache_saved')
+        post_save.connect(comment_saved, sender=Comment, dispatch_uid='comment_tree_cache_saved')
+        pre_delete.connect(comment_deleting, sender=Comment, dispatch_uid='comment_tree_cache_deleting')
+        post_delete.connect(comment_deleted, sender=Comment, dispatch_uid='comment_tree_cache_deleted')
+
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='sqlite_connection_profile')
+        # count and time the queries of every request without relying on DEBUG / connection.queries
+        connection_created.connect(install_query_recorder, dispatch_uid='request_metrics_query_recorder')
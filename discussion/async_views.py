@@ -0,0 +1,319 @@
+"""
+Native async versions of the read endpoints.
+
+config/asgi.py routes requests through config/urls_asgi.py, where these views serve GET
+requests for JSON clients with Django's async ORM instead of running the DRF views in a
+worker thread. Anything else (writes, HEAD/OPTIONS, the browsable API, errors raised by
+DRF) is handed to the regular DRF view, so every URL answers exactly as it does under WSGI.
+
+The live comment stream (comment_stream) exists only here: it holds its connection open,
+which an async view does for the price of a coroutine rather than a worker thread.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .cache import comment_tree_cache
+from .conditional import discussion_validators, not_modified_response, set_validators
+from .db_routers import read_from_primary
+from .events import format_event, get_backend
+from .metrics import timed
+from .models import Comment, Discussion
+from .pagination import CommentTreePagination
+from .renderers import stream_json_array
+from .serializers import DiscussionReadSerializer
+from .views import (COMMENT_FIELDS, DISCUSSION_FIELDS, SINCE_MAX_COMMENTS, CommentViewSet, DiscussionViewSet, delta_response,
+                    discussion_columns, parse_children, parse_fields, parse_level, parse_ordering, parse_since, parse_sort,
+                    wants_stream, with_stub_cursors, with_sync_token)
+
+
+def default_response_headers(viewset, actions):
+    """The Allow / Vary headers DRF adds to every response of viewset.as_view(actions)."""
+    view = viewset()
+    view.action_map = actions
+    for method, action in {'head': actions['get'], **actions}.items():
+        setattr(view, method, getattr(view, action))
+    return view.default_response_headers
+
+
+def async_read_view(viewset, actions, read):
+    """
+    Build an async view serving GET with `read` and everything else with the DRF view.
+
+    Args:
+        viewset: The DRF viewset class behind the URL.
+        actions (dict): The method to action mapping the URL uses, as passed to as_view.
+        read: Async callable read(request, **kwargs) getting a DRF Request and returning a
+            Response or HttpResponse, or None to leave the request to the DRF view.
+    """
+    sync_view = viewset.as_view(dict(actions))
+    headers = default_response_headers(viewset, actions)
+    negotiator = viewset.content_negotiation_class()
+    renderers = [renderer() for renderer in viewset.renderer_classes]
+
+    async def view(request, *args, **kwargs):
+        drf_request = negotiate(request) if request.method == 'GET' else None
+        if drf_request is None:
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        try:
+            response = await read(drf_request, *args, **kwargs)
+        except APIException:
+            response = None
+        if response is None:
+            # let DRF build the (error) response it would have sent
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+        return finalize(drf_request, response)
+
+    def negotiate(request):
+        """Wrap the request like DRF does, or return None when the client wants something other than JSON."""
+        drf_request = Request(request, negotiator=negotiator)
+        try:
+            renderer, media_type = negotiator.select_renderer(drf_request, renderers)
+        except APIException:
+            return None
+        if renderer.format != 'json':
+            return None
+        drf_request.accepted_renderer, drf_request.accepted_media_type = renderer, media_type
+        return drf_request
+
+    def finalize(drf_request, response):
+        """Render a DRF Response here, so Django doesn't hop to a thread to do it, and add DRF's headers."""
+        if isinstance(response, Response):
+            response.accepted_renderer = drf_request.accepted_renderer
+            response.accepted_media_type = drf_request.accepted_media_type
+            response.renderer_context = {'request': drf_request, 'args': (), 'kwargs': {}}
+            with timed('render'):
+                response.render()
+            response = HttpResponse(response.content, status=response.status_code, headers=dict(response.items()))
+        if 'Vary' in headers:
+            patch_vary_headers(response, [headers['Vary']])
+        response['Allow'] = headers['Allow']
+        return response
+
+    view.__name__ = view.__qualname__ = f"async_{viewset.__name__}_{actions['get']}"
+    return csrf_exempt(view)
+
+
+async def read_discussion_list(request):
+    error = parse_ordering(request)
+    if error:
+        return error
+    fields, error = parse_fields(request, DISCUSSION_FIELDS)
+    if error:
+        return error
+    queryset = DiscussionViewSet.queryset.all()
+    if fields is not None:
+        queryset = discussion_columns(queryset, fields)
+    paginator = DiscussionViewSet.pagination_class()
+    page = await paginator.apaginate_queryset(queryset, request)
+    serializer = DiscussionReadSerializer(page, many=True, context={'request': request, 'fields': fields})
+    return paginator.get_paginated_response(serializer.data)
+
+
+async def read_discussion_detail(request, pk=None):
+    fields, error = parse_fields(request, DISCUSSION_FIELDS)
+    if error:
+        return error
+    queryset = Discussion.objects.all()
+    if fields is not None:
+        queryset = discussion_columns(queryset, fields)
+    try:
+        discussion = await queryset.aget(pk=pk)
+    except (Discussion.DoesNotExist, ValueError, TypeError, ValidationError):
+        return None  # DRF's get_object builds the 404
+
+    etag, last_modified = discussion_validators(request, discussion)
+    not_modified = not_modified_response(request, etag, last_modified)
+    if not_modified:
+        return not_modified
+
+    serializer = DiscussionReadSerializer(discussion, context={'request': request, 'fields': fields})
+    return set_validators(Response(serializer.data), etag, last_modified)
+
+
+async def read_discussion_comments(request, discussion_id=None):
+    discussion = await Discussion.objects.filter(id=discussion_id).afirst()
+    if not discussion:
+        return Response({"error": "Discussion not found"}, status=404)
+
+    max_level, error = parse_level(request)
+    if error:
+        return error
+    sort, error = parse_sort(request)
+    if error:
+        return error
+    since, error = parse_since(request, discussion)
+    if error:
+        return error
+    fields, error = parse_fields(request, COMMENT_FIELDS)
+    if error:
+        return error
+
+    etag, last_modified = discussion_validators(request, discussion)
+    not_modified = not_modified_response(request, etag, last_modified)
+    if not_modified:
+        return not_modified
+
+    if since is not None:
+        comments = await discussion.aget_comments_since(since, max_level=max_level, limit=SINCE_MAX_COMMENTS + 1, fields=fields)
+        return set_validators(delta_response(discussion, since, comments), etag, last_modified)
+
+    paginator = CommentTreePagination()
+    if 'children' in request.query_params:
+        children, after, error = parse_children(request, paginator)
+        if error:
+            return error
+
+        async def abuild():
+            return with_stub_cursors(await discussion.aget_comments_collapsed(children, max_level=max_level, after=after, fields=fields), paginator)
+
+        comments = await comment_tree_cache.aget_or_build(discussion.id, ('collapsed', children, max_level, after, fields), abuild)
+        return set_validators(Response(comments), etag, last_modified)
+
+    if paginator.is_requested(request):
+        async def afetch_page(after, limit):
+            async def abuild():
+                return await discussion.aget_comments_flat(max_level=max_level, after=after, limit=limit, fields=fields)
+            return await comment_tree_cache.aget_or_build(discussion.id, ('comments', max_level, after, limit, fields), abuild)
+
+        try:
+            page = await paginator.apaginate_tree(afetch_page, request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return set_validators(paginator.get_paginated_response(page), etag, last_modified)
+
+    if wants_stream(request):
+        response = stream_json_array(discussion.aiter_comments_flat(max_level=max_level, fields=fields), request.accepted_renderer)
+        return set_validators(response, etag, last_modified)
+
+    flat_comments = await comment_tree_cache.aget_or_build(
+        discussion.id,
+        ('comments', max_level, sort, fields),
+        lambda: discussion.aget_comments_flat(max_level=max_level, sort=sort, fields=fields)
+    )
+    response = with_sync_token(Response(flat_comments), discussion, flat_comments)
+    return set_validators(response, etag, last_modified)
+
+
+async def read_comment_replies(request, discussion_id=None, comment_id=None):
+    max_level, error = parse_level(request)
+    if error:
+        return error
+    sort, error = parse_sort(request)
+    if error:
+        return error
+    fields, error = parse_fields(request, COMMENT_FIELDS)
+    if error:
+        return error
+
+    try:
+        comment = await Comment.objects.select_related('discussion').aget(pk=comment_id, discussion_id=discussion_id)
+    except Comment.DoesNotExist:
+        return Response({"error": "Comment not found"}, status=404)
+    since, error = parse_since(request, comment.discussion)
+    if error:
+        return error
+
+    etag, last_modified = discussion_validators(request, comment.discussion)
+    not_modified = not_modified_response(request, etag, last_modified)
+    if not_modified:
+        return not_modified
+
+    if since is not None:
+        replies = await comment.aget_replies_since(since, max_level=max_level, limit=SINCE_MAX_COMMENTS + 1, fields=fields)
+        return set_validators(delta_response(comment.discussion, since, replies), etag, last_modified)
+
+    if wants_stream(request):
+        response = stream_json_array(comment.aiter_replies_flat(max_level=max_level, fields=fields), request.accepted_renderer)
+        return set_validators(response, etag, last_modified)
+
+    descendants = await comment_tree_cache.aget_or_build(
+        comment.discussion_id,
+        ('replies', comment.id, max_level, sort, fields),
+        lambda: comment.aget_replies_flat(max_level=max_level, sort=sort, fields=fields)
+    )
+    response = with_sync_token(Response(descendants), comment.discussion, descendants)
+    return set_validators(response, etag, last_modified)
+
+
+# How long an EventSource waits before reconnecting after the stream ends
+STREAM_RETRY_MS = 3000
+
+
+@require_GET
+async def comment_stream(request, discussion_id=None):
+    """
+    Server-Sent Events of the comments created in a discussion from now on.
+
+    Each `comment` event carries the new comment as in the flat comment lists (with
+    level and path) and its id as the event id. A client reconnecting with the
+    Last-Event-ID header (or ?last_event_id=) first gets the comments it missed, from
+    the database; more than SINCE_MAX_COMMENTS of them and it gets a `reset` event
+    instead, telling it to fetch the list again, with the id to resume from.
+    """
+    if not await Discussion.objects.filter(id=discussion_id).aexists():
+        return JsonResponse({"error": "Discussion not found"}, status=404)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return JsonResponse({"error": "Last-Event-ID must be a comment id"}, status=400)
+
+    response = StreamingHttpResponse(comment_events(discussion_id, last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx would hold the events back in its buffer
+    return response
+
+
+async def comment_events(discussion_id, last_event_id):
+    """The SSE messages of comment_stream, until the client disconnects or falls too far behind."""
+    heartbeat = getattr(settings, 'COMMENT_STREAM_HEARTBEAT_SECONDS', 15)
+    # subscribed before the backfill is read, so no comment falls between the two
+    subscription = get_backend().subscribe(discussion_id, getattr(settings, 'COMMENT_STREAM_BUFFER', 256))
+    try:
+        yield f'retry: {STREAM_RETRY_MS}\n\n'.encode()
+        sent_up_to = 0
+        if last_event_id is not None:
+            sent_up_to = last_event_id
+            discussion = Discussion(id=discussion_id)
+            # a replica may lag behind the events the client already has
+            with read_from_primary():
+                missed = await discussion.aget_comments_since(last_event_id, limit=SINCE_MAX_COMMENTS + 1)
+                too_many = len(missed) > SINCE_MAX_COMMENTS
+                if too_many:
+                    missed = []
+                    sent_up_to = await (Comment.objects.filter(discussion_id=discussion_id)
+                                        .order_by('-id').values_list('id', flat=True).afirst())
+            if too_many:
+                yield format_event({'last_event_id': sent_up_to}, event_id=sent_up_to, event='reset')
+            for comment in missed:
+                yield format_event(comment, event_id=comment['id'])
+                sent_up_to = comment['id']
+
+        while True:
+            message = await subscription.get(heartbeat)
+            if message is None:
+                yield b': heartbeat\n\n'
+                continue
+            comment_id, event = message
+            if comment_id > sent_up_to:  # not already sent by the backfill
+                yield event
+    except BufferError:
+        return  # too slow, the client reconnects and catches up from the database
+    finally:
+        subscription.close()
+
+
+discussion_list = async_read_view(DiscussionViewSet, {'get': 'list', 'post': 'create'}, read_discussion_list)
+discussion_detail = async_read_view(DiscussionViewSet, {'get': 'retrieve'}, read_discussion_detail)
+discussion_comments = async_read_view(CommentViewSet, {'get': 'discussion_comments', 'post': 'create'}, read_discussion_comments)
+comment_replies = async_read_view(CommentViewSet, {'get': 'replies'}, read_comment_replies)
@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from .db_routers import read_from_primary
+
+# Evictions per LocMem cache name, shared by the per thread backend instances the same
+# way LocMemCache shares its storage
+_evictions = {}
+
+
+class CountingLocMemCache(LocMemCache):
+    """
+    Local memory cache that counts the entries it evicts.
+
+    LocMemCache is already an LRU bounded by the MAX_ENTRIES option: reads move keys
+    to the front and culling drops the least recently used ones. This only records
+    how many entries were dropped so the tree cache can report it.
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._name = name
+        _evictions.setdefault(name, 0)
+
+    def _cull(self):
+        # always called with self._lock held
+        size = len(self._cache)
+        super()._cull()
+        _evictions[self._name] += size - len(self._cache)
+
+    @property
+    def evictions(self):
+        return _evictions[self._name]
+
+
+class CommentTreeCache:
+    """
+    Cache of serialized flat comment trees, versioned per discussion.
+
+    Every cached tree is stored under the current version of its discussion. Writing a
+    comment bumps the version, which makes all trees cached for that discussion
+    unreachable at once (they age out of the LRU), so readers never get a stale tree
+    and nothing has to enumerate the keys to delete.
+
+    The backend is the Django cache named by the COMMENT_TREE_CACHE_ALIAS setting.
+    """
+
+    def __init__(self, alias=None):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias or getattr(settings, 'COMMENT_TREE_CACHE_ALIAS', 'default')]
+
+    def version_key(self, discussion_id):
+        return f"discussion:{discussion_id}:tree-version"
+
+    def get_version(self, discussion_id):
+        version = self.cache.get(self.version_key(discussion_id))
+        if version is None:
+            # A lost counter must not restart at a number older trees were cached under,
+            # so new counters start from the clock
+            self.cache.add(self.version_key(discussion_id), time.time_ns(), timeout=None)
+            version = self.cache.get(self.version_key(discussion_id))
+        return version
+
+    async def aget_version(self, discussion_id):
+        """Async version of get_version."""
+        version = await self.cache.aget(self.version_key(discussion_id))
+        if version is None:
+            await self.cache.aadd(self.version_key(discussion_id), time.time_ns(), timeout=None)
+            version = await self.cache.aget(self.version_key(discussion_id))
+        return version
+
+    def bump(self, discussion_id):
+        """Invalidate every tree cached for the discussion."""
+        try:
+            self.cache.incr(self.version_key(discussion_id))
+        except ValueError:
+            self.cache.set(self.version_key(discussion_id), time.time_ns(), timeout=None)
+
+    def tree_key(self, discussion_id, version, variant):
+        # variant can hold cursors of any length, hash it to keep keys memcached safe
+        digest = hashlib.md5(repr(variant).encode(), usedforsecurity=False).hexdigest()
+        return f"discussion:{discussion_id}:tree:{version}:{digest}"
+
+    def get_or_build(self, discussion_id, variant, build):
+        """
+        Return the cached tree for (discussion_id, variant), building and caching it on a miss.
+
+        Args:
+            discussion_id (int): The discussion the tree belongs to.
+            variant (tuple): Everything else that makes this tree different, e.g. the
+                endpoint, comment id and query parameters.
+            build (callable): Returns the tree when it isn't cached.
+        """
+        key = self.tree_key(discussion_id, self.get_version(discussion_id), variant)
+        tree = self.cache.get(key)
+        if tree is not None:
+            self._count(hit=True)
+            return tree
+
+        self._count(hit=False)
+        # A replica that hasn't caught up with the write that bumped the version would
+        # leave an old tree cached under the new version, so trees are built from the primary
+        with read_from_primary():
+            tree = build()
+        self.cache.set(key, tree)
+        return tree
+
+    async def aget_or_build(self, discussion_id, variant, abuild):
+        """Async version of get_or_build, abuild is an async callable returning the tree."""
+        key = self.tree_key(discussion_id, await self.aget_version(discussion_id), variant)
+        tree = await self.cache.aget(key)
+        if tree is not None:
+            self._count(hit=True)
+            return tree
+
+        self._count(hit=False)
+        with read_from_primary():
+            tree = await abuild()
+        await self.cache.aset(key, tree)
+        return tree
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """Hit, miss and eviction counters for monitoring. Evictions are None if the backend can't tell."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': getattr(self.cache, 'evictions', None),
+        }
+
+
+comment_tree_cache = CommentTreeCache()
@@ -0,0 +1,55 @@
+import hashlib
+
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def discussion_validators(request, discussion):
+    """
+    Strong ETag and Last-Modified for a response built from a discussion and its comments.
+
+    Both come from discussion.changed_at, which moves on every write to the discussion or
+    its comments, so they can be checked before any tree is queried or rendered. The
+    ETag also covers the path, query string and rendered format, since each of those
+    gives a different body for the same discussion state.
+
+    Last-Modified only has whole seconds, while changed_at moves by microseconds: a write
+    later in the same second would leave it unchanged and If-Modified-Since would answer
+    304 to a stale copy. So it is left out until changed_at's second is over, and only
+    the ETag validates in the meantime.
+
+    Returns:
+        tuple: (etag, last_modified) where last_modified is a Unix timestamp in seconds,
+        or None while changed_at is in the current second.
+    """
+    variant = f"{request.get_full_path()}|{request.accepted_renderer.format}"
+    digest = hashlib.md5(variant.encode(), usedforsecurity=False).hexdigest()[:16]
+    changed_at_us = int(discussion.changed_at.timestamp() * 1_000_000)
+    etag = quote_etag(f"{discussion.id}-{changed_at_us}-{digest}")
+    last_modified = int(discussion.changed_at.timestamp())
+    if last_modified >= int(timezone.now().timestamp()):
+        last_modified = None
+    return etag, last_modified
+
+
+def set_validators(response, etag, last_modified):
+    """Add the ETag and (when there is one) Last-Modified headers to a response."""
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def not_modified_response(request, etag, last_modified):
+    """
+    Evaluate If-None-Match / If-Modified-Since (and the If-Match preconditions).
+
+    Returns:
+        HttpResponse: A 304 (or 412) response carrying the validators when the client's
+        copy is current, or None when the full response should be sent.
+    """
+    validators = set_validators(HttpResponse(), etag, last_modified)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified, response=validators)
+    return None if response is validators else response
@@ -0,0 +1,196 @@
+"""
+Read replica routing.
+
+ReplicaRoutingMiddleware decides per request whether reads may go to a replica: only
+for safe methods (GET, HEAD, OPTIONS), and not for a client that wrote within the last
+DATABASE_PRIMARY_STICKY_SECONDS (remembered in a cookie). The decision lives in a context
+variable, so it follows the request into sync_to_async threads and streamed bodies.
+ReplicaRouter then sends those reads to one of DATABASE_REPLICAS, and every write, and
+every read after a write in the same request, to the primary ('default').
+
+Outside of requests (management commands, shells, tests) everything uses the primary.
+"""
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PRIMARY = 'default'
+STICKY_COOKIE = 'db_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+routing_state = ContextVar('replica_routing', default=None)
+
+
+class RoutingState:
+    """Replica routing of one request."""
+
+    def __init__(self, use_replicas):
+        self.use_replicas = use_replicas
+        self.wrote = False
+
+
+@contextmanager
+def read_from_primary():
+    """Send the reads in the block to the primary, e.g. to fill a cache that writes invalidate."""
+    state = routing_state.get()
+    if state is None or not state.use_replicas:
+        yield
+        return
+    token = routing_state.set(RoutingState(use_replicas=False))
+    try:
+        yield
+    finally:
+        routing_state.reset(token)
+
+
+def record_write():
+    """Note a write made for the current request elsewhere (e.g. by the comment write queue's thread)."""
+    state = routing_state.get()
+    if state is not None:
+        state.wrote = True
+
+
+class ReplicaSelector:
+    """Picks a replica alias per DATABASE_REPLICAS and DATABASE_REPLICA_SELECTION."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._config = None
+        self._cycle = None
+
+    def choose(self):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', {})
+        if not replicas:
+            return PRIMARY
+        aliases, weights = list(replicas), list(replicas.values())
+        if getattr(settings, 'DATABASE_REPLICA_SELECTION', 'round-robin') == 'weighted':
+            return random.choices(aliases, weights=weights)[0]
+        with self._lock:
+            if self._config != replicas:
+                # settings changed (e.g. in tests), start a new cycle
+                self._config = dict(replicas)
+                self._cycle = itertools.cycle(aliases)
+            return next(self._cycle)
+
+
+class ReplicaRouter:
+    """
+    Database router sending reads to replicas when the current request allows it.
+
+    Replicas are copies of the primary, so relations across aliases are allowed and
+    every alias gets the same migrations (which is what lets local SQLite replica files
+    be created with migrate --database).
+    """
+
+    def __init__(self):
+        self.selector = ReplicaSelector()
+
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if state is None or not state.use_replicas or state.wrote:
+            return PRIMARY
+        return self.selector.choose()
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Set up replica routing for each request and pin writers to the primary for a while.
+
+    A request that wrote gets a cookie keeping the client's reads on the primary for
+    DATABASE_PRIMARY_STICKY_SECONDS, so it reads its own writes while replicas catch up.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.state_for(request)
+        token = routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        state = self.state_for(request)
+        token = routing_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        return self.finish(response, state)
+
+    def state_for(self, request):
+        pinned_until = request.COOKIES.get(STICKY_COOKIE, '')
+        pinned = pinned_until.isdigit() and int(pinned_until) > time.time()
+        return RoutingState(use_replicas=request.method in SAFE_METHODS and not pinned)
+
+    def finish(self, response, state):
+        if state.wrote:
+            window = getattr(settings, 'DATABASE_PRIMARY_STICKY_SECONDS', 10)
+            if window > 0:
+                response.set_cookie(STICKY_COOKIE, str(int(time.time() + window)), max_age=window, httponly=True, samesite='Lax')
+        if response.streaming:
+            # streamed bodies read from the database after this returns, keep routing them the same way
+            response.streaming_content = with_routing_state(response.streaming_content, state)
+        return response
+
+
+def with_routing_state(content, state):
+    """Wrap a (sync or async) iterator so each step runs with `state` as the routing state."""
+    if hasattr(content, '__aiter__'):
+        async def aiterate():
+            iterator = aiter(content)
+            try:
+                while True:
+                    token = routing_state.set(state)
+                    try:
+                        chunk = await anext(iterator)
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        routing_state.reset(token)
+                    yield chunk
+            finally:
+                # closed early (the client went away), let the wrapped generator clean up too
+                if hasattr(iterator, 'aclose'):
+                    await iterator.aclose()
+        return aiterate()
+
+    def iterate():
+        iterator = iter(content)
+        while True:
+            token = routing_state.set(state)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                routing_state.reset(token)
+            yield chunk
+    return iterate()
@@ -0,0 +1,152 @@
+"""
+Live comment events for the Server-Sent Events stream.
+
+New comments are published once their transaction commits (see signals.py) to the
+backend named by COMMENT_EVENTS_BACKEND, and the stream endpoint (async_views.py)
+subscribes to the backend for one discussion. The default InProcessBackend only
+reaches streams served by the same process, a backend over a shared broker (e.g. Redis
+pub/sub) implements the same methods for deployments with several processes:
+subscribe(discussion_id, buffer_size) returning an object with `async get(timeout)` and
+`close()`, and publish(discussion_id, comment).
+
+Every subscriber has a buffer of at most COMMENT_STREAM_BUFFER events. A client that
+reads slower than comments arrive fills it, its subscription is then dropped and its
+stream ends, and the client's reconnect resumes from its Last-Event-ID out of the
+database. Memory per client stays bounded however far behind it falls.
+"""
+import asyncio
+import threading
+from collections import deque
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import FLAT_COMMENT_FIELDS, to_flat_comment
+from .renderers import FastJSONRenderer
+
+
+def flat_comment(comment):
+    """A saved Comment as the flat comment dict of the comment lists, level and path from the discussion."""
+    row = {field: getattr(comment, field) for field in FLAT_COMMENT_FIELDS}
+    row.update(depth=comment.depth, tree_path=comment.tree_path)
+    return to_flat_comment(row)
+
+
+def format_event(data, event_id=None, event='comment'):
+    """One SSE message, `data` rendered as JSON on a single line."""
+    lines = [f'id: {event_id}\n'.encode()] if event_id is not None else []
+    lines.append(f'event: {event}\n'.encode())
+    lines.append(b'data: ' + FastJSONRenderer().render(data) + b'\n\n')
+    return b''.join(lines)
+
+
+def publish_comments(comments):
+    """Publish new comments to the stream subscribers of their discussions once the transaction commits."""
+    comments = list(comments)
+    if not comments:
+        return
+
+    def publish():
+        backend = get_backend()
+        for comment in comments:
+            backend.publish(comment.discussion_id, comment)
+    # a subscriber problem must not fail the write, which is already committed
+    transaction.on_commit(publish, robust=True)
+
+
+class Subscription:
+    """
+    Bounded buffer of the SSE messages for one client, read from its event loop.
+
+    push() may be called from any thread, the messages are handed over to the loop the
+    subscription was made on.
+    """
+
+    def __init__(self, backend, discussion_id, buffer_size):
+        self.backend = backend
+        self.discussion_id = discussion_id
+        self.buffer_size = buffer_size
+        self.loop = asyncio.get_running_loop()
+        self.messages = deque()
+        self.overflowed = False
+        self._ready = asyncio.Event()
+
+    def push(self, message):
+        self.loop.call_soon_threadsafe(self._push, message)
+
+    def _push(self, message):
+        if len(self.messages) >= self.buffer_size:
+            # the client can't keep up, drop it instead of buffering without bound
+            self.overflowed = True
+            self.messages.clear()
+            self.close()
+        else:
+            self.messages.append(message)
+        self._ready.set()
+
+    async def get(self, timeout):
+        """
+        The next (comment id, SSE message), waiting up to `timeout` seconds.
+
+        Returns None on timeout, raises BufferError once the subscription overflowed.
+        """
+        if not self.messages and not self.overflowed:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if self.overflowed:
+            raise BufferError('Subscriber buffer overflowed')
+        return self.messages.popleft()
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+
+class InProcessBackend:
+    """Delivers events to the subscribers in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # discussion id -> set of Subscription
+
+    def subscribe(self, discussion_id, buffer_size):
+        """Start buffering the events of a discussion, must be called from the event loop of the reader."""
+        subscription = Subscription(self, discussion_id, buffer_size)
+        with self._lock:
+            self._subscribers.setdefault(discussion_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.discussion_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.discussion_id, None)
+
+    def publish(self, discussion_id, comment):
+        """Send a new comment to every subscriber of its discussion, rendered once for all of them."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(discussion_id, ()))
+        if not subscribers:
+            return
+        message = (comment.id, format_event(flat_comment(comment), event_id=comment.id))
+        for subscription in subscribers:
+            subscription.push(message)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+@lru_cache
+def load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    """The event backend instance for COMMENT_EVENTS_BACKEND, one per process."""
+    return load_backend(getattr(settings, 'COMMENT_EVENTS_BACKEND', 'discussion.events.InProcessBackend'))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Database maintenance for SQLite: PRAGMA optimize (refreshes query planner statistics "
+        "where they are stale), or a full ANALYZE, and optionally a WAL checkpoint. "
+        "Meant to be run periodically, e.g. hourly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias (default: default)')
+        parser.add_argument('--analyze', action='store_true',
+                            help='Run a full ANALYZE instead of PRAGMA optimize, e.g. after bulk imports')
+        parser.add_argument('--checkpoint', action='store_true',
+                            help='Also checkpoint the WAL and truncate the -wal file')
+
+    def handle(self, *args, database, analyze, checkpoint, **options):
+        connection = connections[database]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"Database '{database}' is {connection.vendor}, this command only maintains SQLite")
+
+        statements = ['ANALYZE' if analyze else 'PRAGMA optimize']
+        if checkpoint:
+            statements.append('PRAGMA wal_checkpoint(TRUNCATE)')
+
+        with connection.cursor() as cursor:
+            for statement in statements:
+                started = time.perf_counter()
+                cursor.execute(statement)
+                result = cursor.fetchall()
+                self.stdout.write(f"{statement}: {(time.perf_counter() - started) * 1000:.1f} ms"
+                                  + (f" {result[0]}" if result else ""))
+            cursor.execute("SELECT count(*) FROM sqlite_master WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone()[0]:
+                cursor.execute("SELECT count(*) FROM sqlite_stat1")
+                self.stdout.write(f"sqlite_stat1 holds statistics for {cursor.fetchone()[0]} indexes")
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from discussion.search import rebuild_index, search_available
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the full text search indexes of discussion titles and comment content from "
+        "the tables. Triggers keep them current, this is for repairs, e.g. after rows were "
+        "changed with the triggers dropped, or a restore of only the model tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--optimize', action='store_true',
+                            help='Also merge each index into a single segment, for faster queries after bulk loads')
+
+    def handle(self, *args, optimize, **options):
+        if not search_available():
+            raise CommandError("Search indexes need SQLite FTS5")
+        started = time.perf_counter()
+        for index, count in rebuild_index(optimize=optimize):
+            self.stdout.write(f"{index}: {count} rows indexed")
+        self.stdout.write(f"Done in {(time.perf_counter() - started) * 1000:.1f} ms")
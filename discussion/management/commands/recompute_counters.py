@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from discussion.models import Comment, Discussion, tree_path_ids
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute comment_count, participant_count, last_activity_at, reply_count and descendant_count from the "
+        "comment trees and fix any that drifted, e.g. after raw SQL writes or restored backups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--discussion', type=int, action='append', dest='discussions',
+                            help='Only check this discussion id (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without writing')
+
+    def handle(self, *args, discussions=None, dry_run=False, **options):
+        queryset = Discussion.objects.order_by('id')
+        if discussions:
+            queryset = queryset.filter(id__in=discussions)
+            missing = set(discussions) - set(queryset.values_list('id', flat=True))
+            if missing:
+                raise CommandError(f"Discussion not found: {', '.join(map(str, sorted(missing)))}")
+
+        drifted_discussions = drifted_comments = 0
+        for discussion in queryset.iterator():
+            with transaction.atomic():
+                discussion_drifted, comment_drift = self.recompute(discussion, dry_run)
+            drifted_discussions += discussion_drifted
+            drifted_comments += comment_drift
+
+        verb = 'Found' if dry_run else 'Fixed'
+        self.stdout.write(f"{verb} drift in {drifted_discussions} discussion(s) and {drifted_comments} comment(s)")
+
+    def recompute(self, discussion, dry_run):
+        """Check one discussion and its comments, returning (discussion drifted, drifted comment count)."""
+        comments = list(Comment.objects.filter(discussion_id=discussion.id)
+                        .only('id', 'user', 'parent_id', 'tree_path', 'reply_count', 'descendant_count'))
+        counts = {comment.id: [0, 0] for comment in comments}
+        for comment in comments:
+            for ancestor_id in tree_path_ids(comment.tree_path)[:-1]:
+                counts[ancestor_id][1] += 1
+                if ancestor_id == comment.parent_id:
+                    counts[ancestor_id][0] += 1
+
+        drifted = []
+        for comment in comments:
+            replies, descendants = counts[comment.id]
+            if (comment.reply_count, comment.descendant_count) != (replies, descendants):
+                self.stdout.write(
+                    f"comment {comment.id}: reply_count {comment.reply_count} -> {replies}, "
+                    f"descendant_count {comment.descendant_count} -> {descendants}"
+                )
+                comment.reply_count, comment.descendant_count = replies, descendants
+                drifted.append(comment)
+
+        last_activity_at = (Comment.objects.filter(discussion_id=discussion.id).aggregate(newest=Max('created_at'))['newest']
+                            or discussion.created_at)
+        participants = len({comment.user for comment in comments})
+        discussion_drifted = ((discussion.comment_count, discussion.participant_count, discussion.last_activity_at)
+                              != (len(comments), participants, last_activity_at))
+        if discussion_drifted:
+            self.stdout.write(
+                f"discussion {discussion.id}: comment_count {discussion.comment_count} -> {len(comments)}, "
+                f"participant_count {discussion.participant_count} -> {participants}, "
+                f"last_activity_at {discussion.last_activity_at.isoformat()} -> {last_activity_at.isoformat()}"
+            )
+
+        if not dry_run:
+            Comment.objects.bulk_update(drifted, ['reply_count', 'descendant_count'], batch_size=500)
+            if discussion_drifted:
+                # update() rather than save(): counters are not a change to the discussion's content
+                Discussion.objects.filter(pk=discussion.id).update(
+                    comment_count=len(comments), participant_count=participants, last_activity_at=last_activity_at
+                )
+        return discussion_drifted, len(drifted)
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from discussion.seeding import SHAPES, seed_discussion
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate discussions with synthetic comment threads (random, deep chains, wide flat "
+        "threads or power-law trees) for load testing and benchmarks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--discussions', type=int, default=1, help='Discussions to create per shape')
+        parser.add_argument('--comments', type=int, default=1000, help='Comments per discussion')
+        parser.add_argument('--shape', choices=SHAPES + ('all',), default='random',
+                            help="Shape of the comment trees, 'all' seeds every shape")
+        parser.add_argument('--max-depth', type=int, default=50, help='Deepest comment level (0 is top level)')
+        parser.add_argument('--fan-out', type=int, default=5, help='Roughly one in FAN_OUT comments is top level')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same arguments give the same threads')
+
+    def handle(self, *args, discussions, comments, shape, max_depth, fan_out, seed, **options):
+        if discussions < 1 or comments < 0 or max_depth < 0 or fan_out < 1:
+            raise CommandError("--discussions and --fan-out must be positive, --comments and --max-depth non-negative")
+
+        shapes = SHAPES if shape == 'all' else (shape,)
+        for shape in shapes:
+            for number in range(discussions):
+                discussion = seed_discussion(comments, shape, max_depth, fan_out, seed=seed + number)
+                deepest = discussion.comments.order_by('-depth').values_list('depth', flat=True).first()
+                self.stdout.write(
+                    f"discussion {discussion.id}: {shape}, {discussion.comment_count} comments, "
+                    f"deepest level {deepest if deepest is not None else '-'}"
+                )
@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database into the replica files of DATABASE_REPLICAS with "
+        "SQLite's online backup API. Stands in for replication when trying the replica "
+        "router locally; run it again whenever the replicas should catch up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help='Replica aliases to refresh (default: all of DATABASE_REPLICAS)')
+        parser.add_argument('--database', default='default', help='Alias of the primary (default: default)')
+
+    def handle(self, *args, aliases, database, **options):
+        aliases = aliases or list(getattr(settings, 'DATABASE_REPLICAS', {}))
+        if not aliases:
+            raise CommandError("No replicas: DATABASE_REPLICAS is empty and no alias was given")
+        primary = connections[database]
+        for alias in [database, *aliases]:
+            if alias not in connections.databases:
+                raise CommandError(f"Unknown database alias '{alias}'")
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f"Database '{alias}' is {connections[alias].vendor}, this command only copies SQLite")
+            if alias != database and connections[alias].settings_dict['NAME'] == primary.settings_dict['NAME']:
+                raise CommandError(f"Replica '{alias}' uses the primary's file")
+
+        primary.ensure_connection()
+        for alias in aliases:
+            replica = connections[alias]
+            # close Django's handle on the replica so the backup can replace its pages
+            replica.close()
+            replica.ensure_connection()
+            started = time.perf_counter()
+            primary.connection.backup(replica.connection)
+            self.stdout.write(f"{alias}: copied {primary.settings_dict['NAME']} "
+                              f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+            replica.close()
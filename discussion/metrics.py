@@ -0,0 +1,173 @@
+"""
+Per request timings (SQL, serialization, rendering) and per endpoint histograms.
+
+RequestMetricsMiddleware opens a RequestMetrics for every request in a context variable.
+Queries are counted and timed by a database execute wrapper installed on every connection
+(see DiscussionConfig.ready), so nothing depends on DEBUG or connection.queries, and the
+context variable follows the request into sync_to_async threads. Serialization and
+rendering are timed with timed(), called by the serializers and around response rendering.
+
+Histograms are kept per process, like the comment tree cache counters, and exported in the
+Prometheus text format by metrics_view when the METRICS_ENABLED setting is on.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+# Latency buckets in seconds, and query count buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+PHASES = ('sql', 'serialize', 'render')
+
+current_metrics = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """What one request spent where, in seconds."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        # nesting depth per phase, so a phase timed at several levels is counted once
+        self._open = dict.fromkeys(PHASES, 0)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        """Value of the Server-Timing header, durations in milliseconds."""
+        parts = [f'sql;dur={self.durations["sql"] * 1000:.2f};desc="{self.queries} queries"']
+        parts += [f'{phase};dur={self.durations[phase] * 1000:.2f}' for phase in PHASES[1:]]
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block to `phase` of the current request, if there is one."""
+    metrics = current_metrics.get()
+    if metrics is None or metrics._open[phase]:
+        yield
+        return
+    metrics._open[phase] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.durations[phase] += time.perf_counter() - started
+        metrics._open[phase] -= 1
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper counting and timing queries run for the current request."""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.durations['sql'] += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver adding record_query to every new database connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations, like a Prometheus histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Per endpoint histograms of the request metrics, safe to update from several threads."""
+
+    # metric name -> (help text, buckets)
+    METRICS = {
+        'discussion_request_duration_seconds': ('Total time spent handling the request', DURATION_BUCKETS),
+        'discussion_request_sql_duration_seconds': ('Time spent executing SQL queries', DURATION_BUCKETS),
+        'discussion_request_serialize_duration_seconds': ('Time spent in serializers', DURATION_BUCKETS),
+        'discussion_request_render_duration_seconds': ('Time spent rendering the response body', DURATION_BUCKETS),
+        'discussion_request_sql_queries': ('SQL queries executed per request', QUERY_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (metric name, view, method) -> Histogram
+
+    def observe(self, view, method, metrics, total):
+        values = {
+            'discussion_request_duration_seconds': total,
+            'discussion_request_sql_duration_seconds': metrics.durations['sql'],
+            'discussion_request_serialize_duration_seconds': metrics.durations['serialize'],
+            'discussion_request_render_duration_seconds': metrics.durations['render'],
+            'discussion_request_sql_queries': metrics.queries,
+        }
+        with self._lock:
+            for name, value in values.items():
+                key = (name, view, method)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram(self.METRICS[name][1])
+                self._histograms[key].observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """All histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, (help_text, buckets) in self.METRICS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, view, method), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    labels = f'view="{escape_label(view)}",method="{method}"'
+                    for bound, count in zip(buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {count}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+def metrics_view(request):
+    """
+    Request histograms in the Prometheus text format.
+
+    Off unless the METRICS_ENABLED setting is true (404 otherwise). Expose it only to the
+    scraper, e.g. by allowing the path on the internal network only at the proxy.
+    """
+    if not getattr(settings, 'METRICS_ENABLED', False):
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,65 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+
+from .metrics import RequestMetrics, current_metrics, registry, timed
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure every request and report it in a Server-Timing header and the metrics registry.
+
+    The header lists SQL time (with the query count), serialization, rendering and total
+    time. Histograms are only recorded when METRICS_ENABLED is on, and the header can be
+    switched off with SERVER_TIMING = False. Put it first in MIDDLEWARE so the total
+    covers the other middleware too. Streamed bodies are produced after the headers are
+    sent, so their rendering isn't included.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered by the handler after the view returns, time that here
+        render = response.render
+
+        def timed_render():
+            with timed('render'):
+                return render()
+
+        response.render = timed_render
+        return response
+
+    def finish(self, request, response, metrics):
+        total = metrics.elapsed()
+        if getattr(settings, 'SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing(total)
+        if getattr(settings, 'METRICS_ENABLED', False):
+            resolver_match = getattr(request, 'resolver_match', None)
+            view = resolver_match.view_name if resolver_match else '<unresolved>'
+            registry.observe(view or '<unnamed>', request.method, metrics, total)
+        return response
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:18
+
+from django.db import migrations, models
+
+PATH_SEGMENT_WIDTH = 10
+BATCH_SIZE = 1000
+
+
+def backfill_tree_path(apps, schema_editor):
+    """
+    Fill in tree_path and depth for existing comments.
+
+    Comments are visited in id order, which normally reaches a parent before its
+    replies. Anything whose parent hasn't been placed yet is retried on the next pass.
+    """
+    Comment = apps.get_model('discussion', 'Comment')
+    positions = {}  # comment id -> (tree_path, depth)
+    pending = list(Comment.objects.order_by('id').values_list('id', 'parent_id'))
+
+    while pending:
+        unresolved = []
+        for comment_id, parent_id in pending:
+            segment = str(comment_id).zfill(PATH_SEGMENT_WIDTH)
+            if parent_id is None:
+                positions[comment_id] = (segment, 0)
+            elif parent_id in positions:
+                parent_path, parent_depth = positions[parent_id]
+                positions[comment_id] = (parent_path + segment, parent_depth + 1)
+            else:
+                unresolved.append((comment_id, parent_id))
+        if len(unresolved) == len(pending):
+            raise RuntimeError(f"Comments with unreachable parents: {[c for c, _ in unresolved]}")
+        pending = unresolved
+
+    updated = []
+    for comment_id, (tree_path, depth) in positions.items():
+        updated.append(Comment(id=comment_id, tree_path=tree_path, depth=depth))
+        if len(updated) >= BATCH_SIZE:
+            Comment.objects.bulk_update(updated, ['tree_path', 'depth'])
+            updated = []
+    Comment.objects.bulk_update(updated, ['tree_path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussion', '0003_alter_comment_content_alter_comment_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Nesting level of the comment (0 for top level comments)'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='tree_path',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Materialized path of zero padded ancestor ids (including this comment), sortable in tree order'),
+        ),
+        migrations.RunPython(backfill_tree_path, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['discussion', 'tree_path'], name='comment_discussion_path_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussion', '0004_comment_tree_path'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['discussion', 'depth', 'tree_path'], name='comment_disc_depth_path_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussion', '0005_comment_depth_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='discussion',
+            index=models.Index(fields=['created_at', 'id'], name='discussion_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussion', '0006_discussion_created_id_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='discussion',
+            field=models.ForeignKey(db_index=False, help_text='The discussion this comment belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='discussion.discussion'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, db_index=False, help_text='Foreign key of the parent comment (if it is a reply to another comment), null if it is a top level comment', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='discussion.comment'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['parent', 'created_at'], name='comment_parent_created_idx'),
+        ),
+    ]
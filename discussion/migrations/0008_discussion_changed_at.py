@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:24
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_changed_at(apps, schema_editor):
+    """Start existing discussions at their latest comment, or their creation time if they have none."""
+    Discussion = apps.get_model('discussion', 'Discussion')
+    Comment = apps.get_model('discussion', 'Comment')
+    latest_comment = (Comment.objects
+                      .filter(discussion_id=OuterRef('pk'))
+                      .values('discussion_id')
+                      .annotate(latest=Max('created_at'))
+                      .values('latest'))
+    Discussion.objects.update(changed_at=Coalesce(Subquery(latest_comment), 'created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussion', '0007_comment_access_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discussion',
+            name='changed_at',
+            field=models.DateTimeField(auto_now=True, help_text='Last time the discussion or any of its comments changed, used for ETag/Last-Modified'),
+        ),
+        migrations.RunPython(backfill_changed_at, migrations.RunPython.noop),
+    ]
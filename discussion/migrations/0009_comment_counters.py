@@ -0,0 +1,58 @@
+# Generated by Django 5.1.6 on 2026-10-17 05:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    """Count existing comments from their tree paths, one discussion at a time."""
+    Discussion = apps.get_model('discussion', 'Discussion')
+    Comment = apps.get_model('discussion', 'Comment')
+    for discussion in Discussion.objects.iterator():
+        comments = list(Comment.objects.filter(discussion=discussion).only('id', 'parent_id', 'tree_path', 'created_at'))
+        by_id = {comment.id: comment for comment in comments}
+        for comment in comments:
+            comment.reply_count = comment.descendant_count = 0
+        for comment in comments:
+            # tree_path is 10 digit id segments, the last one being the comment itself
+            for start in range(0, len(comment.tree_path) - 10, 10):
+                ancestor = by_id[int(comment.tree_path[start:start + 10])]
+                ancestor.descendant_count += 1
+                if ancestor.id == comment.parent_id:
+                    ancestor.reply_count += 1
+        Comment.objects.bulk_update(comments, ['reply_count', 'descendant_count'], batch_size=500)
+        discussion.comment_count = len(comments)
+        discussion.last_activity_at = max([c.created_at for c in comments], default=discussion.created_at)
+        discussion.save(update_fields=['comment_count', 'last_activity_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussion', '0008_discussion_changed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='descendant_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of replies at any level below this comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of direct replies'),
+        ),
+        migrations.AddField(
+            model_name='discussion',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of comments in the discussion, at any level'),
+        ),
+        migrations.AddField(
+            model_name='discussion',
+            name='last_activity_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, help_text='Creation time of the newest comment, or of the discussion if it has none'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.6 on 2026-10-17 03:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_closure(apps, schema_editor):
+    """Write the closure rows of existing comments from their tree paths."""
+    Comment = apps.get_model('discussion', 'Comment')
+    CommentClosure = apps.get_model('discussion', 'CommentClosure')
+    rows = []
+    for comment_id, tree_path in Comment.objects.values_list('id', 'tree_path').iterator(chunk_size=2000):
+        # tree_path is 10 digit id segments, root first, the last one being the comment itself
+        ancestor_ids = [int(tree_path[start:start + 10]) for start in range(0, len(tree_path), 10)]
+        rows += [
+            CommentClosure(ancestor_id=ancestor_id, descendant_id=comment_id, depth=len(ancestor_ids) - 1 - index)
+            for index, ancestor_id in enumerate(ancestor_ids)
+        ]
+        if len(rows) >= 2000:
+            CommentClosure.objects.bulk_create(rows, batch_size=500)
+            rows = []
+    CommentClosure.objects.bulk_create(rows, batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussion', '0009_comment_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField(help_text='Levels between ancestor and descendant (1 for a direct reply)')),
+                ('ancestor', models.ForeignKey(db_index=False, help_text='The ancestor, or the comment itself when depth is 0', on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='discussion.comment')),
+                ('descendant', models.ForeignKey(db_index=False, help_text='The descendant, or the comment itself when depth is 0', on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='discussion.comment')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ancestor', 'depth', 'descendant'], name='closure_ancestor_depth_idx')],
+                'constraints': [models.UniqueConstraint(fields=('descendant', 'ancestor'), name='closure_descendant_ancestor_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_closure, migrations.RunPython.noop),
+    ]
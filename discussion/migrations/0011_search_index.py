@@ -0,0 +1,58 @@
+from django.db import migrations
+
+# External content FTS5 tables: the text stays in the model tables, the index only holds
+# the terms, and the triggers keep it in step with every INSERT, UPDATE and DELETE
+# (including bulk_create and cascading deletes, which skip model signals).
+SEARCH_TABLES = [
+    # (index table, content table, indexed column)
+    ('discussion_discussion_search', 'discussion_discussion', 'title'),
+    ('discussion_comment_search', 'discussion_comment', 'content'),
+]
+
+TOKENIZER = 'porter unicode61 remove_diacritics 2'
+
+
+def create_statements(index, table, column):
+    return [
+        f"CREATE VIRTUAL TABLE {index} USING fts5({column}, content='{table}', content_rowid='id', tokenize='{TOKENIZER}')",
+        f"""CREATE TRIGGER {index}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {index} (rowid, {column}) VALUES (new.id, new.{column});
+        END""",
+        f"""CREATE TRIGGER {index}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {index} ({index}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+        END""",
+        f"""CREATE TRIGGER {index}_update AFTER UPDATE OF {column} ON {table} BEGIN
+            INSERT INTO {index} ({index}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+            INSERT INTO {index} (rowid, {column}) VALUES (new.id, new.{column});
+        END""",
+        # index the rows already there
+        f"INSERT INTO {index} ({index}) VALUES ('rebuild')",
+    ]
+
+
+def drop_statements(index, table, column):
+    return [f"DROP TRIGGER IF EXISTS {index}_{event}" for event in ('insert', 'delete', 'update')] + [
+        f"DROP TABLE IF EXISTS {index}",
+    ]
+
+
+def run(statements_for):
+    def operation(apps, schema_editor):
+        # FTS5 is SQLite only, other backends keep working without the search endpoint
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for index, table, column in SEARCH_TABLES:
+            for statement in statements_for(index, table, column):
+                schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussion', '0010_comment_closure'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(create_statements), run(drop_statements)),
+    ]
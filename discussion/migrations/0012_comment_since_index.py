@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-17 04:46
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_index = import_module('discussion.migrations.0011_search_index')
+
+
+def restore_search_triggers(apps, schema_editor):
+    """
+    Re-create the triggers of the discussion search index.
+
+    SQLite can't add a NOT NULL column in place, Django rebuilds discussion_discussion
+    instead, and dropping the old table drops its triggers with it. The index itself
+    is untouched (the rows keep their ids). Dropping the column again is done in place,
+    so the triggers may still be there.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for index, table, column in search_index.SEARCH_TABLES:
+        if table == 'discussion_discussion':
+            # the trigger statements, without the index table itself and the rebuild
+            statements = (search_index.drop_statements(index, table, column)[:-1]
+                          + search_index.create_statements(index, table, column)[1:-1])
+            for statement in statements:
+                schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussion', '0011_search_index'),
+    ]
+
+    operations = [
+        # runs last when migrating backwards, after RemoveField rebuilt the table again
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='discussion',
+            name='rewrite_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of times comments of the discussion were edited or deleted, delta sync tokens from before the last one are refused'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['discussion', 'id'], name='comment_discussion_id_idx'),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.6 on 2026-10-17 04:57
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+since_index = import_module('discussion.migrations.0012_comment_since_index')
+
+
+def backfill_participants(apps, schema_editor):
+    """Count the distinct comment authors of every discussion, in one UPDATE."""
+    Discussion = apps.get_model('discussion', 'Discussion')
+    Comment = apps.get_model('discussion', 'Comment')
+    participants = (Comment.objects.filter(discussion_id=OuterRef('pk')).values('discussion_id')
+                    .annotate(participants=Count('user', distinct=True)).values('participants'))
+    Discussion.objects.update(participant_count=Coalesce(Subquery(participants), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('discussion', '0012_comment_since_index'),
+    ]
+
+    operations = [
+        # adding and removing participant_count rebuild discussion_discussion, see 0012
+        migrations.RunPython(migrations.RunPython.noop, since_index.restore_search_triggers),
+        migrations.AddField(
+            model_name='discussion',
+            name='participant_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of distinct users who commented in the discussion'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['discussion', 'user'], name='comment_discussion_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='discussion',
+            index=models.Index(fields=['last_activity_at', 'id'], name='discussion_activity_id_idx'),
+        ),
+        migrations.RunPython(backfill_participants, migrations.RunPython.noop),
+        migrations.RunPython(since_index.restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,208 @@
-from django.db import models, connection
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Max, OuterRef, Subquery, Value, When, Window
+from django.db.models.functions import Coalesce, Greatest, RowNumber
+from django.utils import timezone
+
+# Width of each zero-padded id segment in Comment.tree_path. Fixed width keeps the
+# stored path sortable as a plain string ('0000000002' < '0000000010') and lets us
+# decode it without a separator.
+PATH_SEGMENT_WIDTH = 10
+
+
+def encode_path_segment(comment_id):
+    """Encode a single comment id as a fixed width tree_path segment."""
+    return str(comment_id).zfill(PATH_SEGMENT_WIDTH)
+
+
+def decode_tree_path(tree_path, skip_segments=0):
+    """
+    Convert a stored tree_path into the public comma separated path of ids.
+
+    Args:
+        tree_path (str): The stored fixed width path, e.g. '00000000010000000003'.
+        skip_segments (int): Number of leading ancestors to drop, used to make paths
+            relative to a comment when listing its replies.
+
+    Returns:
+        str: The path as exposed by the API, e.g. '1,3'.
+    """
+    start = skip_segments * PATH_SEGMENT_WIDTH
+    return ','.join(
+        str(int(tree_path[i:i + PATH_SEGMENT_WIDTH]))
+        for i in range(start, len(tree_path), PATH_SEGMENT_WIDTH)
+    )
+
+
+def tree_path_ids(tree_path):
+    """The comment ids in a stored tree_path, root first."""
+    return [int(tree_path[i:i + PATH_SEGMENT_WIDTH]) for i in range(0, len(tree_path), PATH_SEGMENT_WIDTH)]
+
+
+def encode_tree_path(path):
+    """Inverse of decode_tree_path: turn a public path such as '1,3' back into a tree_path."""
+    return ''.join(encode_path_segment(comment_id) for comment_id in path.split(','))
+
+
+def subtree_filter(tree_path):
+    """
+    Lookup kwargs selecting every descendant of the comment stored at tree_path.
+
+    Equivalent to `tree_path LIKE 'prefix%'` minus the node itself, but expressed as a
+    range so SQLite can use the index (its LIKE is case insensitive and skips indexes).
+    Paths only contain digits, so ':' (the character after '9') closes the range.
+    """
+    return {'tree_path__gt': tree_path, 'tree_path__lt': tree_path + ':'}
+
+
+# Above this many levels limit_depth stops probing the index one depth at a time
+# (SQLite caps compound selects at 500 arms) and filters the range scan instead
+MAX_DEPTH_PROBES = 32
+
+
+def limit_depth(rows, min_depth, max_depth):
+    """
+    Restrict a comment queryset to depths min_depth..max_depth, ordered by tree_path.
+
+    Every depth is its own probe on the (discussion, depth, tree_path) index, merged
+    with UNION ALL. SQLite then only visits rows that are actually returned, instead of
+    walking the whole subtree and discarding the deeper comments afterwards.
+    """
+    if max_depth - min_depth >= MAX_DEPTH_PROBES:
+        return rows.filter(depth__gte=min_depth, depth__lte=max_depth).order_by('tree_path')
+
+    probes = [rows.filter(depth=depth).order_by() for depth in range(min_depth, max_depth + 1)]
+    if len(probes) == 1:
+        return probes[0].order_by('tree_path')
+    return probes[0].union(*probes[1:], all=True).order_by('tree_path')
+
+
+# Rows fetched per round trip when streaming a tree
+STREAM_CHUNK_SIZE = 500
+
+
+# Columns returned for each row of the flat tree methods
+FLAT_COMMENT_FIELDS = ('id', 'discussion_id', 'user', 'parent_id', 'content', 'created_at', 'reply_count', 'descendant_count')
+
+# Fields of a flat comment that are always returned, they hold the tree together
+FLAT_COMMENT_TREE_FIELDS = ('id', 'parent_id', 'level', 'path')
+
+
+def flat_comment_columns(fields=None):
+    """
+    The values() columns to select for flat comments with the given fields.
+
+    Args:
+        fields (iterable, optional): Names of flat comment fields, None for all of them.
+            The tree fields are selected either way (level and path from depth and
+            tree_path), the reads order and paginate by them.
+    """
+    if fields is None:
+        return (*FLAT_COMMENT_FIELDS, 'depth', 'tree_path')
+    return (*(field for field in FLAT_COMMENT_FIELDS if field in fields or field in FLAT_COMMENT_TREE_FIELDS), 'depth', 'tree_path')
+
+
+def to_flat_comment(row, base_depth=0, skip_segments=0):
+    """Turn a values() row with depth and tree_path into the public flat comment dict, with the fields the row has."""
+    comment = {field: row[field] for field in FLAT_COMMENT_FIELDS if field in row}
+    comment['level'] = row['depth'] - base_depth
+    comment['path'] = decode_tree_path(row['tree_path'], skip_segments)
+    return comment
+
+
+# Order of sibling comments per ?sort= mode. 'oldest' is plain tree_path order (ids grow
+# with creation time), which the indexes return without sorting.
+SIBLING_ORDERINGS = {
+    'oldest': None,
+    'newest': ('-created_at', '-id'),
+    'most_replies': ('-reply_count', 'id'),
+}
+
+
+def sibling_sort(sort, fields=None):
+    """
+    The values() columns and order_by() terms of a sibling ordering, for rows with `fields`.
+
+    A UNION (see limit_depth) can only be ordered by columns it selects. Sort columns a
+    ?fields= list leaves out are selected under a 'sort_' alias, which to_flat_comment
+    doesn't copy into the comment.
+
+    Returns:
+        tuple: ({alias: expression} to pass to values(), the order_by() terms).
+    """
+    selected = flat_comment_columns(fields)
+    columns, ordering = {}, []
+    for term in SIBLING_ORDERINGS[sort]:
+        descending, name = term.startswith('-'), term.lstrip('-')
+        if name not in selected:
+            columns[f'sort_{name}'] = F(name)
+            name = f'sort_{name}'
+        ordering.append(f'-{name}' if descending else name)
+    return columns, ordering
+
+
+def depth_first(rows, root_id=None):
+    """
+    Arrange tree rows in depth-first order, keeping the relative order of siblings.
+
+    The query sorts the rows by the sibling ordering alone. Grouping them by parent and
+    walking down from root_id then puts every comment right after its parent, ahead of
+    its next sibling, in one pass. Comments whose parent isn't among the rows are left out.
+    """
+    children = {}
+    for row in rows:
+        children.setdefault(row['parent_id'], []).append(row)
+    stack = children.get(root_id, [])[::-1]
+    while stack:
+        row = stack.pop()
+        yield row
+        stack.extend(reversed(children.get(row['id'], ())))
+
+
+def collapse_thread(rows, children, root_path):
+    """
+    Turn ranked rows of a tree into flat comments plus "load more" stubs.
+
+    Args:
+        rows: values() rows in tree order with depth, tree_path, sibling_rank and
+            sibling_count, already cut to sibling_rank <= children.
+        children (int): Replies kept per parent.
+        root_path (str): tree_path of the comment whose replies are listed, '' for the
+            top level of the discussion.
+
+    Rows whose parent was cut are dropped. Each stub follows the last shown reply of its
+    parent (and that reply's subtree), with the number of hidden replies and the
+    tree_path of the last shown one, to continue from.
+    """
+    result = []
+    visible = set()
+    # open parents, innermost last: [tree_path, depth, stub or None]
+    stack = [[root_path, len(root_path) // PATH_SEGMENT_WIDTH - 1, None]]
+    for row in rows:
+        parent_path = row['tree_path'][:-PATH_SEGMENT_WIDTH]
+        if parent_path != root_path and parent_path not in visible:
+            continue
+        while stack[-1][1] >= row['depth']:
+            close_parent(stack.pop(), result)
+        visible.add(row['tree_path'])
+        result.append(to_flat_comment(row))
+        if row['sibling_rank'] == children and row['sibling_count'] > children:
+            stack[-1][2] = {
+                'type': 'more',
+                'parent': row['parent_id'],
+                'level': row['depth'],
+                'hidden_count': row['sibling_count'] - children,
+                'after': row['tree_path'],
+            }
+        stack.append([row['tree_path'], row['depth'], None])
+    while stack:
+        close_parent(stack.pop(), result)
+    return result
+
+
+def close_parent(entry, result):
+    if entry[2] is not None:
+        result.append(entry[2])
+
 
 class Discussion(models.Model):
     """
@@ -9,6 +213,11 @@ class Discussion(models.Model):
     user = models.CharField(max_length=100, null=False, blank=False, help_text="Author of the discussion")
     title = models.CharField(max_length=280, null=False, blank=False, help_text="The actual discussion topic or title") # to match twitter's character count as an example
     created_at = models.DateTimeField(auto_now_add=True, help_text="Auto-generated timestamp of creation time")
+    changed_at = models.DateTimeField(auto_now=True, help_text="Last time the discussion or any of its comments changed, used for ETag/Last-Modified")
+    comment_count = models.PositiveIntegerField(default=0, editable=False, help_text="Number of comments in the discussion, at any level")
+    last_activity_at = models.DateTimeField(auto_now_add=True, help_text="Creation time of the newest comment, or of the discussion if it has none")
+    rewrite_count = models.PositiveIntegerField(default=0, editable=False, help_text="Number of times comments of the discussion were edited or deleted, delta sync tokens from before the last one are refused")
+    participant_count = models.PositiveIntegerField(default=0, editable=False, help_text="Number of distinct users who commented in the discussion")
 
     # In case we need to add the ability to delete or close disucssions
     # STATUS_CHOICES = [
@@ -19,68 +228,183 @@ class Discussion(models.Model):
     # status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
 
 
-    def get_comments_flat(self, max_level=None):
-        # Will use recursive common table expression to to get comments in a flat tree structure
+    def get_comments_flat(self, max_level=None, after=None, limit=None, sort='oldest', fields=None):
+        # Reads the persisted tree_path, so the whole tree is a single range scan
+        # on the (discussion, tree_path) index instead of a recursive query
         """
         Get all comments for this discussion in a flat tree structure.
         
         Args:
             max_level (int, optional): If provided, only returns comments up to this nesting level.
             None returns all levels.
+            after (str, optional): A stored tree_path, only comments sorting after it are
+            returned. Used for keyset pagination.
+            limit (int, optional): Maximum number of comments to return.
+            sort (str, optional): Order of siblings, a key of SIBLING_ORDERINGS. The list
+            stays depth-first whatever the order. Only 'oldest' supports after and limit.
+            fields (iterable, optional): Fields of each comment to return, None for all.
+            The tree fields (FLAT_COMMENT_TREE_FIELDS) are always returned. Only the
+            columns behind them are read, see flat_comment_columns.
         
         Returns:
             list: A list of dictionaries representing comments with level and path information.
         """
-        with connection.cursor() as cursor:
-            sql_query = """
-                WITH RECURSIVE comment_tree AS (
-                    -- Base case: Get all top-level comments for the discussion
-                    SELECT 
-                        c.id, 
-                        c.discussion_id, 
-                        c.user, 
-                        c.parent_id, 
-                        c.content, 
-                        c.created_at, 
-                        0 AS level, 
-                        CAST(c.id AS VARCHAR(1000)) AS path
-                    FROM discussion_comment c
-                    WHERE c.discussion_id = %s AND c.parent_id IS NULL
-                    
-                    UNION ALL
-                    
-                    -- Recursive case: Get all replies to comments already in our result
-                    SELECT 
-                        c.id, 
-                        c.discussion_id, 
-                        c.user, 
-                        c.parent_id, 
-                        c.content, 
-                        c.created_at, 
-                        ct.level + 1 AS level, 
-                        CONCAT(ct.path, ',', c.id) AS path
-                    FROM discussion_comment c
-                    JOIN comment_tree ct ON c.parent_id = ct.id
-                )
-                SELECT * FROM comment_tree
-            """
-
-            # Add level filter if specified
-            if max_level is not None:
-                sql_query += " WHERE level <= %s"
-                cursor.execute(sql_query + " ORDER BY path;", [self.id, max_level])
-            else:
-                cursor.execute(sql_query + " ORDER BY path;", [self.id])
-            
-            columns = [col[0] for col in cursor.description]
-            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        rows = self.comments_flat_rows(max_level, after, limit, sort, fields)
+        if sort != 'oldest':
+            rows = depth_first(rows)
+        return [to_flat_comment(row) for row in rows]
+
+    def iter_comments_flat(self, max_level=None, chunk_size=STREAM_CHUNK_SIZE, fields=None):
+        """
+        Same comments as get_comments_flat, yielded one at a time.
+
+        Rows are fetched from the database in batches of chunk_size, so memory use does not
+        depend on the size of the tree.
+        """
+        for row in self.comments_flat_rows(max_level, fields=fields).iterator(chunk_size=chunk_size):
+            yield to_flat_comment(row)
+
+    async def aget_comments_flat(self, max_level=None, after=None, limit=None, sort='oldest', fields=None):
+        """Async version of get_comments_flat, for the ASGI read views."""
+        rows = [row async for row in self.comments_flat_rows(max_level, after, limit, sort, fields)]
+        if sort != 'oldest':
+            rows = depth_first(rows)
+        return [to_flat_comment(row) for row in rows]
+
+    async def aiter_comments_flat(self, max_level=None, chunk_size=STREAM_CHUNK_SIZE, fields=None):
+        """Async version of iter_comments_flat."""
+        async for row in self.comments_flat_rows(max_level, fields=fields).aiterator(chunk_size=chunk_size):
+            yield to_flat_comment(row)
+
+    def get_comments_collapsed(self, children, max_level=None, after=None, fields=None):
+        """
+        Get the comments with at most `children` replies shown under each comment.
+
+        The first replies of every comment (and the first top level comments) are kept in
+        tree order. After the last reply kept under a comment with more, a stub such as
+        {'type': 'more', 'parent': 3, 'level': 1, 'hidden_count': 7, 'after': <tree_path>}
+        stands for the rest. Passing its 'after' back continues with the next replies of
+        that parent, collapsed the same way.
+
+        One query ranks every comment among its siblings with window functions, so the
+        cost doesn't depend on how many comments are collapsed.
+
+        Args:
+            children (int): Replies kept per comment (and top level comments kept).
+            max_level (int, optional): Only include comments up to this nesting level.
+            after (str, optional): A stored tree_path from a stub, lists the following
+                siblings of that comment and their replies.
+            fields (iterable, optional): Fields of each comment, as for get_comments_flat.
+
+        Returns:
+            list: Flat comments, as returned by get_comments_flat, and stubs.
+        """
+        root_path = after[:-PATH_SEGMENT_WIDTH] if after else ''
+        return collapse_thread(self.comments_collapsed_rows(children, max_level, after, fields), children, root_path)
+
+    async def aget_comments_collapsed(self, children, max_level=None, after=None, fields=None):
+        """Async version of get_comments_collapsed."""
+        root_path = after[:-PATH_SEGMENT_WIDTH] if after else ''
+        rows = [row async for row in self.comments_collapsed_rows(children, max_level, after, fields)]
+        return collapse_thread(rows, children, root_path)
+
+    def comments_collapsed_rows(self, children, max_level=None, after=None, fields=None):
+        """Queryset of ranked tree rows behind get_comments_collapsed."""
+        rows = Comment.objects.filter(discussion_id=self.id)
+        if after is not None:
+            # the siblings after `after`, skipping its own subtree (':' sorts after every digit)
+            rows = rows.filter(tree_path__gt=after + ':')
+            root_path = after[:-PATH_SEGMENT_WIDTH]
+            if root_path:
+                rows = rows.filter(tree_path__lt=root_path + ':')
+        if max_level is not None:
+            rows = rows.filter(depth__lte=max_level)
+        siblings = {'partition_by': [F('parent_id')]}
+        return (rows
+                .annotate(sibling_rank=Window(RowNumber(), order_by=F('tree_path').asc(), **siblings),
+                          sibling_count=Window(Count('id'), **siblings))
+                .filter(sibling_rank__lte=children)
+                .values(*flat_comment_columns(fields), 'sibling_rank', 'sibling_count')
+                .order_by('tree_path'))
+
+    def comments_flat_rows(self, max_level=None, after=None, limit=None, sort='oldest', fields=None):
+        """
+        Queryset of raw tree rows (including depth and tree_path) behind get_comments_flat.
+
+        In tree order for 'oldest', otherwise in the sibling order of `sort`, to be passed
+        through depth_first.
+        """
+        sort_columns, sort_ordering = sibling_sort(sort, fields) if sort != 'oldest' else ({}, None)
+        rows = Comment.objects.filter(discussion_id=self.id).values(*flat_comment_columns(fields), **sort_columns)
+        if after is not None:
+            rows = rows.filter(tree_path__gt=after)
+        if max_level is not None:
+            rows = limit_depth(rows, 0, max_level)
+        else:
+            rows = rows.order_by('tree_path')
+        if sort != 'oldest':
+            rows = rows.order_by(*sort_ordering)
+        if limit is not None:
+            rows = rows[:limit]
+        return rows
     
+    def get_comments_since(self, last_id, max_level=None, limit=None, fields=None):
+        """
+        Get the comments added to this discussion after the comment with id last_id.
+
+        Ids are assigned in commit order (SQLite has a single writer and AUTOINCREMENT
+        never reuses them), so these are exactly the comments a reader that saw every
+        comment up to last_id hasn't seen yet. A range on the (discussion, id) index,
+        the cost depends on the number of new comments, not on the size of the tree.
+
+        Args:
+            last_id (int): Id of the newest comment the caller has.
+            max_level (int, optional): Only return comments up to this nesting level.
+            limit (int, optional): Maximum number of comments to return.
+            fields (iterable, optional): Fields of each comment, as for get_comments_flat.
+
+        Returns:
+            list: Flat comments with level and path like get_comments_flat, in the order
+            they were created.
+        """
+        return [to_flat_comment(row) for row in self.comments_since_rows(last_id, max_level, limit, fields)]
+
+    async def aget_comments_since(self, last_id, max_level=None, limit=None, fields=None):
+        """Async version of get_comments_since."""
+        return [to_flat_comment(row) async for row in self.comments_since_rows(last_id, max_level, limit, fields)]
+
+    def comments_since_rows(self, last_id, max_level=None, limit=None, fields=None):
+        """Queryset of raw tree rows behind get_comments_since, in id order."""
+        rows = Comment.objects.filter(discussion_id=self.id, id__gt=last_id)
+        if max_level is not None:
+            rows = rows.filter(depth__lte=max_level)
+        rows = rows.values(*flat_comment_columns(fields)).order_by('id')
+        if limit is not None:
+            rows = rows[:limit]
+        return rows
+
+    @staticmethod
+    def mark_changed(discussion_id):
+        """
+        Move the change marker of a discussion after one of its comments was edited.
+
+        Also counts the edit in rewrite_count: a delta of new comments can't carry it,
+        so delta sync tokens from before it stop being accepted.
+        """
+        Discussion.objects.filter(pk=discussion_id).update(changed_at=timezone.now(), rewrite_count=F('rewrite_count') + 1)
+
     def __str__(self):
         return self.title
     
     class Meta:
         ordering = ['-created_at']  # Order by newest first
-        # indexes = [models.Index(fields=['user'])]  # TODO Verify if we need this
+        indexes = [
+            # backs the (created_at, id) keyset pagination of the discussion list
+            models.Index(fields=['created_at', 'id'], name='discussion_created_id_idx'),
+            # the same for ?ordering=active, most recently active first
+            models.Index(fields=['last_activity_at', 'id'], name='discussion_activity_id_idx'),
+        ]
+        # No index on user: nothing filters or sorts discussions by author
 
 
 class Comment(models.Model):
@@ -90,58 +414,374 @@ class Comment(models.Model):
     Comments can be top-level (directly on a discussion) or replies to other comments,
     forming a tree structure.
     """
-    discussion = models.ForeignKey(Discussion, on_delete=models.CASCADE, related_name='comments', help_text="The discussion this comment belongs to")
+    # The FK indexes are left out on purpose, the composite indexes in Meta start with these
+    # columns and serve the same lookups (including cascading deletes)
+    discussion = models.ForeignKey(Discussion, on_delete=models.CASCADE, db_index=False, related_name='comments', help_text="The discussion this comment belongs to")
     user = models.CharField(max_length=100, null=False, blank=False, help_text="Author of the Comment")
-    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies', help_text="Foreign key of the parent comment (if it is a reply to another comment), null if it is a top level comment")
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, db_index=False, related_name='replies', help_text="Foreign key of the parent comment (if it is a reply to another comment), null if it is a top level comment")
     content = models.TextField(null=False, blank=False, help_text="Body of the comment")
     created_at = models.DateTimeField(auto_now_add=True, help_text="Time stamp of comment creation")
+    reply_count = models.PositiveIntegerField(default=0, editable=False, help_text="Number of direct replies")
+    descendant_count = models.PositiveIntegerField(default=0, editable=False, help_text="Number of replies at any level below this comment")
+    tree_path = models.TextField(default='', blank=True, editable=False, help_text="Materialized path of zero padded ancestor ids (including this comment), sortable in tree order")
+    depth = models.PositiveIntegerField(default=0, editable=False, help_text="Nesting level of the comment (0 for top level comments)")
+
+    def save(self, *args, **kwargs):
+        """
+        Save the comment, filling in tree_path and depth on insert.
+
+        The path includes the comment's own id, so it can only be built once the row
+        exists. Both writes happen in the same transaction so readers never see a
+        comment without its position in the tree.
+        """
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.set_tree_position()
+            Comment.objects.filter(pk=self.pk).update(tree_path=self.tree_path, depth=self.depth)
+            self.count_insert()
+            CommentClosure.objects.bulk_create(self.closure_rows())
+
+    def ancestor_ids(self):
+        """Ids of every comment above this one, read from tree_path."""
+        return tree_path_ids(self.tree_path)[:-1]
+
+    def closure_rows(self):
+        """Unsaved CommentClosure rows linking this comment to itself and every ancestor, from tree_path."""
+        return [
+            CommentClosure(ancestor_id=ancestor_id, descendant_id=self.pk, depth=self.depth - index)
+            for index, ancestor_id in enumerate(tree_path_ids(self.tree_path))
+        ]
 
-    def get_replies_flat(self):
+    def count_insert(self):
+        """
+        Add this new comment to the counters of its ancestors and its discussion.
+
+        One UPDATE covers every ancestor (descendant_count, plus reply_count on the
+        parent) and one the discussion, which also moves its change marker. The author
+        counts as a new participant unless the discussion has another comment of theirs.
+        """
+        ancestor_ids = self.ancestor_ids()
+        if ancestor_ids:
+            Comment.objects.filter(id__in=ancestor_ids).update(
+                descendant_count=F('descendant_count') + 1,
+                reply_count=F('reply_count') + Case(When(id=self.parent_id, then=Value(1)), default=Value(0)),
+            )
+        new_participant = not Comment.objects.filter(discussion_id=self.discussion_id, user=self.user).exclude(pk=self.pk).exists()
+        Discussion.objects.filter(pk=self.discussion_id).update(
+            comment_count=F('comment_count') + 1,
+            participant_count=F('participant_count') + int(new_participant),
+            last_activity_at=Greatest(F('last_activity_at'), Value(self.created_at)),
+            changed_at=timezone.now(),
+        )
+
+    def subtree_stats(self):
+        """Number of comments in this comment's subtree (itself included) and the newest created_at among them."""
+        stats = self.descendant_links.aggregate(count=Count('descendant_id'), newest=Max('descendant__created_at'))
+        return stats['count'], stats['newest']
+
+    def count_delete(self, deleted=1, newest=None):
+        """
+        Remove this deleted comment from the counters of its ancestors and its discussion.
+
+        Runs after the whole cascade is gone, so only surviving ancestors are updated.
+        For a comment deleted with its replies, `deleted` is the size of the subtree and
+        `newest` its newest created_at (see subtree_stats), and this is called once for
+        the whole subtree. Comments deleted one row at a time (queryset deletes) are
+        counted one by one with the defaults.
+        """
+        newest = newest or self.created_at
+        ancestor_ids = self.ancestor_ids()
+        if ancestor_ids:
+            Comment.objects.filter(id__in=ancestor_ids).update(
+                descendant_count=F('descendant_count') - deleted,
+                reply_count=F('reply_count') - Case(When(id=self.parent_id, then=Value(1)), default=Value(0)),
+            )
+        Discussion.objects.filter(pk=self.discussion_id).update(
+            comment_count=F('comment_count') - deleted,
+            # deletions can't be sent as a delta either, see Discussion.mark_changed
+            rewrite_count=F('rewrite_count') + 1,
+            changed_at=timezone.now(),
+        )
+        # Only when the newest comment went away does last_activity_at need the (indexed) lookup
+        remaining = Comment.objects.filter(discussion_id=OuterRef('pk')).values('discussion_id').annotate(newest=Max('created_at')).values('newest')
+        Discussion.objects.filter(pk=self.discussion_id, last_activity_at__lte=newest).update(
+            last_activity_at=Coalesce(Subquery(remaining), F('created_at'))
+        )
+        # Recounted rather than decremented: several of the deleted comments may share an
+        # author, and they are all gone by now
+        if deleted > 1 or not Comment.objects.filter(discussion_id=self.discussion_id, user=self.user).exists():
+            Discussion.objects.filter(pk=self.discussion_id).update(participant_count=Coalesce(Subquery(
+                Comment.objects.filter(discussion_id=OuterRef('pk')).values('discussion_id')
+                .annotate(participants=Count('user', distinct=True)).values('participants')
+            ), 0))
+
+    @classmethod
+    def bulk_create_tree(cls, discussion_id, items, existing_parents, batch_size=500):
+        """
+        Insert a batch of comments, which may reply to each other, in one transaction.
+
+        Comments are inserted in generations: first the ones whose parent already exists,
+        then replies to those, and so on, so every parent has its id before its replies
+        are written. Each generation is a bulk INSERT, followed by a bulk UPDATE filling
+        in tree_path, depth and the counters of the new comments, and a bulk INSERT of
+        their closure rows. Existing ancestors and the discussion get their counters
+        moved by a couple of set based UPDATEs.
+        save() and the post_save signal are skipped, so callers must invalidate cached
+        trees of the discussion themselves.
+
+        Args:
+            discussion_id (int): The discussion all comments belong to.
+            items (list): Validated dicts with 'user', 'content' and optionally 'parent'
+                (id of an existing comment) or 'parent_index' (position of an earlier item).
+            existing_parents (dict): {comment id: (tree_path, depth)} for every 'parent' used.
+            batch_size (int): Rows per INSERT / UPDATE statement.
+
+        Returns:
+            list: The created comments, in the order of items, with tree_path and depth set.
+        """
+        comments = [
+            cls(discussion_id=discussion_id, user=item['user'], content=item['content'], parent_id=item.get('parent'))
+            for item in items
+        ]
+
+        generation_of = []
+        generations = []
+        for index, item in enumerate(items):
+            parent_index = item.get('parent_index')
+            generation = 0 if parent_index is None else generation_of[parent_index] + 1
+            generation_of.append(generation)
+            if generation == len(generations):
+                generations.append([])
+            generations[generation].append(index)
+
+        with transaction.atomic():
+            for generation in generations:
+                for index in generation:
+                    parent_index = items[index].get('parent_index')
+                    if parent_index is not None:
+                        comments[index].parent_id = comments[parent_index].pk
+                cls.objects.bulk_create([comments[index] for index in generation], batch_size=batch_size)
+
+                for index in generation:
+                    comment = comments[index]
+                    parent_index = items[index].get('parent_index')
+                    if parent_index is not None:
+                        parent_path, parent_depth = comments[parent_index].tree_path, comments[parent_index].depth
+                    elif comment.parent_id is not None:
+                        parent_path, parent_depth = existing_parents[comment.parent_id]
+                    else:
+                        parent_path, parent_depth = '', -1
+                    comment.tree_path = parent_path + encode_path_segment(comment.pk)
+                    comment.depth = parent_depth + 1
+
+            # Count every new comment in its ancestors, new ones in memory, existing ones as deltas
+            created = {comment.pk: comment for comment in comments}
+            existing_deltas = {}  # comment id -> [reply_count delta, descendant_count delta]
+            for comment in comments:
+                for ancestor_id in comment.ancestor_ids():
+                    is_parent = 1 if ancestor_id == comment.parent_id else 0
+                    if ancestor_id in created:
+                        created[ancestor_id].descendant_count += 1
+                        created[ancestor_id].reply_count += is_parent
+                    else:
+                        delta = existing_deltas.setdefault(ancestor_id, [0, 0])
+                        delta[0] += is_parent
+                        delta[1] += 1
+
+            cls.objects.bulk_update(comments, ['tree_path', 'depth', 'reply_count', 'descendant_count'], batch_size=batch_size)
+            CommentClosure.objects.bulk_create([row for comment in comments for row in comment.closure_rows()], batch_size=batch_size)
+            deltas = list(existing_deltas.items())
+            for start in range(0, len(deltas), batch_size):
+                batch = deltas[start:start + batch_size]
+                cls.objects.filter(id__in=[comment_id for comment_id, _ in batch]).update(
+                    reply_count=F('reply_count') + Case(*[When(id=comment_id, then=Value(replies)) for comment_id, (replies, _) in batch], default=Value(0)),
+                    descendant_count=F('descendant_count') + Case(*[When(id=comment_id, then=Value(descendants)) for comment_id, (_, descendants) in batch], default=Value(0)),
+                )
+            # authors already in the discussion, from the comments older than this batch (ids
+            # grow in commit order), counted in the same UPDATE
+            users = {comment.user for comment in comments}
+            known_users = (cls.objects.filter(discussion_id=OuterRef('pk'), user__in=users, id__lt=min(comment.pk for comment in comments))
+                           .values('discussion_id').annotate(known=Count('user', distinct=True)).values('known'))
+            Discussion.objects.filter(pk=discussion_id).update(
+                comment_count=F('comment_count') + len(comments),
+                participant_count=F('participant_count') + len(users) - Coalesce(Subquery(known_users), 0),
+                last_activity_at=Greatest(F('last_activity_at'), Value(max(comment.created_at for comment in comments))),
+                changed_at=timezone.now(),
+            )
+        return comments
+
+    def set_tree_position(self):
+        """Compute tree_path and depth from the parent comment. Requires self.pk."""
+        if self.parent_id is None:
+            self.tree_path = encode_path_segment(self.pk)
+            self.depth = 0
+        else:
+            self.tree_path = self.parent.tree_path + encode_path_segment(self.pk)
+            self.depth = self.parent.depth + 1
+
+    def get_replies_flat(self, max_level=None, sort='oldest', fields=None):
         """
         Get all replies of this comment in a flat tree structure with path and level.
+
+        Args:
+            max_level (int, optional): If provided, only returns replies up to this nesting level
+            (0 for direct replies only). None returns all levels.
+            sort (str, optional): Order of siblings, a key of SIBLING_ORDERINGS. The list
+            stays depth-first whatever the order.
+            fields (iterable, optional): Fields of each reply, as for Discussion.get_comments_flat.
         
         Returns:        
         list: A list of dictionaries representing reply comments with level and path information.
         """
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                WITH RECURSIVE comment_tree AS (
-                    -- Base case: Start with the current comment's direct replies
-                    SELECT 
-                        c.id, 
-                        c.discussion_id, 
-                        c.user, 
-                        c.parent_id, 
-                        c.content, 
-                        c.created_at, 
-                        0 AS level, 
-                        CAST(c.id AS VARCHAR(1000)) AS path
-                    FROM discussion_comment c
-                    WHERE c.parent_id = %s
-                    
-                    UNION ALL
-                    
-                    -- Recursive case: Get replies to those replies
-                    SELECT 
-                        c.id, 
-                        c.discussion_id, 
-                        c.user, 
-                        c.parent_id, 
-                        c.content, 
-                        c.created_at, 
-                        ct.level + 1 AS level, 
-                        CONCAT(ct.path, ',', c.id) AS path
-                    FROM discussion_comment c
-                    JOIN comment_tree ct ON c.parent_id = ct.id
-                )
-                SELECT * FROM comment_tree ORDER BY path;
-            """, [self.id])
-            
-            columns = [col[0] for col in cursor.description]
-            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        rows = self.replies_flat_rows(max_level, sort, fields)
+        if sort != 'oldest':
+            rows = depth_first(rows, self.id)
+        return [self.to_reply(row) for row in rows]
+
+    def iter_replies_flat(self, max_level=None, chunk_size=STREAM_CHUNK_SIZE, fields=None):
+        """Same replies as get_replies_flat, yielded one at a time from batches of chunk_size rows."""
+        for row in self.replies_flat_rows(max_level, fields=fields).iterator(chunk_size=chunk_size):
+            yield self.to_reply(row)
+
+    async def aget_replies_flat(self, max_level=None, sort='oldest', fields=None):
+        """Async version of get_replies_flat, for the ASGI read views."""
+        rows = [row async for row in self.replies_flat_rows(max_level, sort, fields)]
+        if sort != 'oldest':
+            rows = depth_first(rows, self.id)
+        return [self.to_reply(row) for row in rows]
+
+    async def aiter_replies_flat(self, max_level=None, chunk_size=STREAM_CHUNK_SIZE, fields=None):
+        """Async version of iter_replies_flat."""
+        async for row in self.replies_flat_rows(max_level, fields=fields).aiterator(chunk_size=chunk_size):
+            yield self.to_reply(row)
+
+    def replies_flat_rows(self, max_level=None, sort='oldest', fields=None):
+        """Queryset of raw tree rows behind get_replies_flat, ordered like comments_flat_rows."""
+        sort_columns, sort_ordering = sibling_sort(sort, fields) if sort != 'oldest' else ({}, None)
+        rows = (Comment.objects
+                .filter(discussion_id=self.discussion_id, **subtree_filter(self.tree_path))
+                .values(*flat_comment_columns(fields), **sort_columns))
+        if max_level is not None:
+            rows = limit_depth(rows, self.depth + 1, self.depth + 1 + max_level)
+        else:
+            rows = rows.order_by('tree_path')
+        if sort != 'oldest':
+            rows = rows.order_by(*sort_ordering)
+        return rows
+
+    def get_replies_since(self, last_id, max_level=None, limit=None, fields=None):
+        """
+        Get the replies of this comment added after the comment with id last_id.
+
+        Like Discussion.get_comments_since, for the subtree of this comment, with levels
+        and paths relative to it like get_replies_flat.
+        """
+        return [self.to_reply(row) for row in self.replies_since_rows(last_id, max_level, limit, fields)]
+
+    async def aget_replies_since(self, last_id, max_level=None, limit=None, fields=None):
+        """Async version of get_replies_since."""
+        return [self.to_reply(row) async for row in self.replies_since_rows(last_id, max_level, limit, fields)]
+
+    def replies_since_rows(self, last_id, max_level=None, limit=None, fields=None):
+        """
+        Queryset of raw tree rows behind get_replies_since, in id order.
+
+        Unlike the other subtree reads, the subtree is matched with LIKE, which SQLite
+        can't serve from an index, so it walks the (discussion, id) range of new comments
+        rather than the whole subtree. Replies are newer than the comment, so the id
+        bound also leaves the comment itself out.
+        """
+        rows = Comment.objects.filter(discussion_id=self.discussion_id, id__gt=max(last_id, self.id),
+                                      tree_path__startswith=self.tree_path)
+        if max_level is not None:
+            rows = rows.filter(depth__lte=self.depth + 1 + max_level)
+        rows = rows.values(*flat_comment_columns(fields)).order_by('id')
+        if limit is not None:
+            rows = rows[:limit]
+        return rows
+
+    def to_reply(self, row):
+        # Levels and paths are relative to this comment, direct replies are level 0
+        return to_flat_comment(row, base_depth=self.depth + 1, skip_segments=self.depth + 1)
+
+    def get_context_flat(self, levels):
+        """
+        Get this comment in context: its ancestors, itself and a few levels of its replies.
+
+        Reads the closure table, so both lists are an index lookup on CommentClosure
+        joined to comments by primary key, however deep the comment sits.
+
+        Args:
+            levels (int): Levels of replies to include (0 for none, 1 for direct replies only).
+
+        Returns:
+            dict: 'ancestors' (root first), 'comment' and 'replies' (in tree order), each a
+            flat comment with level and path relative to the discussion, like get_comments_flat.
+        """
+        chain = [to_flat_comment(row) for row in self.ancestors_flat_rows()]
+        replies = [to_flat_comment(row) for row in self.descendants_flat_rows(levels)] if levels > 0 else []
+        return {'ancestors': chain[:-1], 'comment': chain[-1], 'replies': replies}
+
+    def ancestors_flat_rows(self):
+        """Queryset of raw tree rows of every ancestor and this comment, root first."""
+        return (Comment.objects
+                .filter(descendant_links__descendant_id=self.pk)
+                .values(*FLAT_COMMENT_FIELDS, 'depth', 'tree_path')
+                .order_by('depth'))
+
+    def descendants_flat_rows(self, levels):
+        """Queryset of raw tree rows of the replies up to `levels` levels below this comment, in tree order."""
+        return (Comment.objects
+                .filter(ancestor_links__ancestor_id=self.pk, ancestor_links__depth__range=(1, levels))
+                .values(*FLAT_COMMENT_FIELDS, 'depth', 'tree_path')
+                .order_by('tree_path'))
     
     def __str__(self):
         return f"Comment by {self.user} on {self.discussion.title}"
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # whole tree and subtree reads: discussion_id = ? ORDER BY tree_path / tree_path range
+            models.Index(fields=['discussion', 'tree_path'], name='comment_discussion_path_idx'),
+            # level limited reads, one probe per depth. (discussion, depth=0) is also the
+            # "top level comments of a discussion" lookup, same rows as parent IS NULL
+            models.Index(fields=['discussion', 'depth', 'tree_path'], name='comment_disc_depth_path_idx'),
+            # direct replies of a comment in creation order (comment.replies.all())
+            models.Index(fields=['parent', 'created_at'], name='comment_parent_created_idx'),
+            # comments added since a delta sync token: discussion_id = ? AND id > ? ORDER BY id
+            models.Index(fields=['discussion', 'id'], name='comment_discussion_id_idx'),
+            # whether a user already commented in a discussion, for its participant_count
+            models.Index(fields=['discussion', 'user'], name='comment_discussion_user_idx'),
+        ]
+
+
+class CommentClosure(models.Model):
+    """
+    Closure table of the comment tree: one row per (ancestor, descendant) pair.
+
+    Every comment has a row linking it to itself (depth 0) and one per ancestor, with
+    the number of levels between them as depth. Rows are written with the comment
+    (Comment.save, Comment.bulk_create_tree) and go away with it through the foreign
+    keys. A comment at depth d has d + 1 rows, so the table grows with the depth of
+    threads, not just their size.
+    """
+    ancestor = models.ForeignKey(Comment, on_delete=models.CASCADE, db_index=False, related_name='descendant_links', help_text="The ancestor, or the comment itself when depth is 0")
+    descendant = models.ForeignKey(Comment, on_delete=models.CASCADE, db_index=False, related_name='ancestor_links', help_text="The descendant, or the comment itself when depth is 0")
+    depth = models.PositiveIntegerField(help_text="Levels between ancestor and descendant (1 for a direct reply)")
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+    class Meta:
+        constraints = [
+            # also the "ancestors of a comment" lookup: descendant_id = ?
+            models.UniqueConstraint(fields=['descendant', 'ancestor'], name='closure_descendant_ancestor_uniq'),
+        ]
+        indexes = [
+            # descendants of a comment a limited number of levels down: ancestor_id = ? AND depth BETWEEN ? AND ?
+            models.Index(fields=['ancestor', 'depth', 'descendant'], name='closure_ancestor_depth_idx'),
+        ]
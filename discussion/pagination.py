@@ -0,0 +1,301 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .models import encode_tree_path
+
+
+class CommentTreePagination(BasePagination):
+    """
+    Keyset pagination over a flat comment tree, in tree order.
+
+    The cursor is an opaque token holding the tree_path of the last comment sent, the
+    next page resumes with the comments sorting right after it. Pages never use OFFSET,
+    so every page is a single index seek no matter how far into the thread it is.
+
+    Pagination is opt-in: it only applies when a 'limit' or 'cursor' query parameter is
+    given, otherwise the endpoint keeps returning the whole tree as a plain list.
+    """
+    page_size = 200
+    max_page_size = 1000
+    limit_query_param = 'limit'
+    cursor_query_param = 'cursor'
+
+    def is_requested(self, request):
+        """Whether the client asked for a paginated response."""
+        params = request.query_params
+        return self.limit_query_param in params or self.cursor_query_param in params
+
+    def get_limit(self, request):
+        limit_param = request.query_params.get(self.limit_query_param, None)
+        if limit_param is None:
+            return self.page_size
+        try:
+            limit = int(limit_param)
+        except ValueError:
+            raise ValueError("Limit must be a valid integer")
+        if limit < 1:
+            raise ValueError("Limit must be a positive integer")
+        return min(limit, self.max_page_size)
+
+    def decode_cursor(self, request):
+        """Return the tree_path encoded in the cursor parameter, or None for the first page."""
+        cursor = request.query_params.get(self.cursor_query_param, None)
+        if not cursor:
+            return None
+        try:
+            tree_path = urlsafe_b64decode(cursor.encode('ascii')).decode('ascii')
+        except (Base64Error, UnicodeError, ValueError):
+            raise ValueError("Invalid cursor")
+        if not tree_path.isdigit():
+            raise ValueError("Invalid cursor")
+        return tree_path
+
+    def encode_cursor(self, tree_path):
+        return urlsafe_b64encode(tree_path.encode('ascii')).decode('ascii')
+
+    def paginate_tree(self, fetch_page, request):
+        """
+        Fetch one page of a flat comment tree.
+
+        Args:
+            fetch_page (callable): fetch_page(after, limit) returning up to limit flat
+                comments sorting after the tree_path `after` (None for the start).
+            request: The current request, read for the limit and cursor parameters.
+
+        Returns:
+            list: The comments on this page.
+
+        Raises:
+            ValueError: If the limit or cursor parameters are invalid.
+        """
+        after = self.start_page(request)
+        # One extra row tells us whether there is a next page without a COUNT query
+        return self.finish_page(fetch_page(after, self.limit + 1), after)
+
+    async def apaginate_tree(self, afetch_page, request):
+        """Async version of paginate_tree, afetch_page is an async callable."""
+        after = self.start_page(request)
+        return self.finish_page(await afetch_page(after, self.limit + 1), after)
+
+    def start_page(self, request):
+        self.request = request
+        self.limit = self.get_limit(request)
+        return self.decode_cursor(request)
+
+    def finish_page(self, rows, after):
+        self.has_next = len(rows) > self.limit
+        rows = rows[:self.limit]
+        self.last_tree_path = encode_tree_path(rows[-1]['path']) if rows else after
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last_tree_path))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class CreatedAtCursorPagination(BasePagination):
+    """
+    Keyset pagination for model lists ordered newest first, keyed on (created_at, id).
+
+    The cursor holds the created_at and id of the last item on the page. The next page
+    continues strictly after that pair, so ties on created_at are broken by id without
+    an OFFSET, and page N is the same index seek as page 1. The
+    ('created_at', 'id') index on the model backs the seek.
+
+    Subclasses can key the pages on another datetime field with position_field, backed
+    by a (position_field, id) index in the same way.
+
+    Clients pick the page size with 'page_size', capped at max_page_size.
+    """
+    position_field = 'created_at'
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Async version of paginate_queryset."""
+        return self.finish_page([instance async for instance in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        """The queryset of the requested page, plus one row to detect a next page."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        field = self.position_field
+        queryset = queryset.order_by(f'-{field}', '-id')
+        if position is not None:
+            value, pk = position
+            # (field, id) < position. The first term is an index range the second
+            # only needs to trim the rows sharing the field's value with the cursor.
+            queryset = queryset.filter(
+                Q(**{f'{field}__lte': value}) & (Q(**{f'{field}__lt': value}) | Q(id__lt=pk))
+            )
+
+        # One extra row tells us whether there is a next page without a COUNT query
+        return queryset[:self.page_size + 1]
+
+    def finish_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        """Return the (position_field value, id) position in the cursor parameter, or None for the first page."""
+        cursor = request.query_params.get(self.cursor_query_param, None)
+        if not cursor:
+            return None
+        try:
+            created_at, pk = json.loads(urlsafe_b64decode(cursor.encode('ascii')))
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (Base64Error, UnicodeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+    def encode_cursor(self, instance):
+        position = [getattr(instance, self.position_field).isoformat(), instance.pk]
+        return urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results to return per page (at most {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class DiscussionPagination(CreatedAtCursorPagination):
+    """
+    Pagination of the discussion list, in the order picked with 'ordering'.
+
+    'newest' (the default) pages on (created_at, id), 'active' on (last_activity_at, id),
+    most recently commented first, each backed by its index on Discussion. A discussion
+    that gets a comment while a client pages through the active list moves to the
+    front, so the client won't see it again further on.
+    """
+    ordering_query_param = 'ordering'
+    orderings = {'newest': 'created_at', 'active': 'last_activity_at'}
+
+    def page_queryset(self, queryset, request):
+        ordering = request.query_params.get(self.ordering_query_param, 'newest')
+        self.position_field = self.orderings.get(ordering, self.orderings['newest'])
+        return super().page_queryset(queryset, request)
+
+
+class SearchPagination(CreatedAtCursorPagination):
+    """
+    Keyset pagination of search results, keyed on (rank, type, id).
+
+    The cursor holds the position of the last result on the page, search() continues
+    strictly after it. An invalid cursor raises ValueError rather than NotFound, the
+    search view answers it with a 400 like the comment tree does.
+    """
+    max_page_size = 50
+
+    def paginate_search(self, search, request):
+        """
+        Fetch one page of results.
+
+        Args:
+            search (callable): search(after, limit) returning up to limit results
+                ordered after the (rank, type, id) position `after` (None for the start).
+            request: The current request, read for the page size and cursor parameters.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        # One extra row tells us whether there is a next page without a COUNT query
+        return self.finish_page(search(self.decode_cursor(request), self.page_size + 1))
+
+    def decode_cursor(self, request):
+        """Return the (rank, type, id) position in the cursor parameter, or None for the first page."""
+        cursor = request.query_params.get(self.cursor_query_param, None)
+        if not cursor:
+            return None
+        try:
+            rank, result_type, pk = json.loads(urlsafe_b64decode(cursor.encode('ascii')))
+            position = float(rank), str(result_type), int(pk)
+        except (Base64Error, UnicodeError, TypeError, ValueError):
+            raise ValueError(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, result):
+        position = [result['rank'], result['type'], result['id']]
+        return urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+
+    def get_paginated_response(self, data):
+        # the rank is only needed for the cursor
+        return super().get_paginated_response([
+            {key: value for key, value in result.items() if key != 'rank'} for result in data
+        ])
@@ -0,0 +1,86 @@
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional, FastJSONRenderer falls back to the stdlib encoder
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson when it is installed.
+
+    The body is the one JSONRenderer produces with the default settings (compact,
+    unicode, UTC datetimes ending in 'Z', U+2028/U+2029 escaped), just encoded in C.
+    Types orjson doesn't know go through DRF's encoder. Anything outside that fast path
+    (indented output, non default JSON settings, values orjson rejects such as integers
+    over 64 bits) is rendered by JSONRenderer itself, as is everything when orjson is
+    missing.
+    """
+    options = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+    default = staticmethod(JSONEncoder().default)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or not self.compact or self.ensure_ascii
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same javascript-subset escaping as JSONRenderer
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def stream_json_array(items, renderer, batch_size=500):
+    """
+    Stream an iterable as a JSON array, one element at a time.
+
+    Each element goes through the same renderer a normal response would use, and the
+    compact array separators match its output, so the streamed body is byte for byte the
+    body the renderer would produce for list(items). Only one batch of encoded elements
+    is held in memory at a time.
+
+    Async iterables are streamed with an async generator, for ASGI responses.
+
+    Args:
+        items (iterable): The elements of the array, e.g. a generator of flat comments.
+        renderer: The negotiated DRF renderer (request.accepted_renderer), must be JSON.
+        batch_size (int): Number of elements encoded per chunk sent to the client.
+
+    Returns:
+        StreamingHttpResponse
+    """
+    def chunks():
+        yield b'['
+        separator = b''
+        batch = []
+        for item in items:
+            batch.append(renderer.render(item))
+            if len(batch) >= batch_size:
+                yield separator + b','.join(batch)
+                separator = b','
+                batch = []
+        if batch:
+            yield separator + b','.join(batch)
+        yield b']'
+
+    async def achunks():
+        yield b'['
+        separator = b''
+        batch = []
+        async for item in items:
+            batch.append(renderer.render(item))
+            if len(batch) >= batch_size:
+                yield separator + b','.join(batch)
+                separator = b','
+                batch = []
+        if batch:
+            yield separator + b','.join(batch)
+        yield b']'
+
+    streaming_content = achunks() if hasattr(items, '__aiter__') else chunks()
+    content_type = f"{renderer.media_type}; charset={renderer.charset}" if renderer.charset else renderer.media_type
+    return StreamingHttpResponse(streaming_content, content_type=content_type)
@@ -0,0 +1,137 @@
+"""
+Full text search over discussion titles and comment content.
+
+Both are indexed by SQLite FTS5 tables created in migration 0011 and kept in step by
+triggers, so every write path (save, bulk_create_tree, cascading deletes) updates the
+index. Results of both kinds are ranked together by bm25 (lower is better) and paged
+with a keyset on (rank, type, id), so a page never needs an OFFSET.
+"""
+import re
+from html import escape
+
+from django.db import connection
+
+from .models import Comment, Discussion, decode_tree_path
+
+# index table, model and indexed column for each result type, in keyset order
+SEARCH_TYPES = {
+    'comment': ('discussion_comment_search', Comment, 'content'),
+    'discussion': ('discussion_discussion_search', Discussion, 'title'),
+}
+
+# Terms looked up per query, longer queries are cut to keep the cost bounded
+MAX_QUERY_TERMS = 16
+# Tokens of context around the matches in a snippet
+SNIPPET_TOKENS = 24
+
+# snippet() wraps matches in these, replaced by <mark> tags once the text is escaped
+MATCH_START, MATCH_END = '\x02', '\x03'
+
+
+def search_available():
+    """Whether the database has the FTS5 search tables (only SQLite does)."""
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(text):
+    """
+    Turn free text into an FTS5 query matching documents that contain every word.
+
+    Each word is quoted, so operators and punctuation in the text are taken literally
+    instead of being parsed as FTS5 query syntax. Returns None when there is no word.
+    """
+    terms = re.findall(r'\w+', text)[:MAX_QUERY_TERMS]
+    return ' '.join(f'"{term}"' for term in terms) or None
+
+
+def highlight(snippet):
+    """HTML escape a snippet and mark the matched terms with <mark> tags."""
+    return escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def search(text, after=None, limit=20, types=tuple(SEARCH_TYPES)):
+    """
+    Find discussions and comments matching every word of `text`, best matches first.
+
+    Args:
+        text (str): The search text.
+        after (tuple, optional): (rank, type, id) of the last result of the previous page.
+        limit (int): Maximum number of results.
+        types (tuple): Result types to include, keys of SEARCH_TYPES.
+
+    Returns:
+        list: Results ordered by (rank, type, id), each a dict with 'type', 'rank', the
+        fields of the discussion or comment and an HTML 'snippet' with the matched terms
+        in <mark> tags. Comments also have 'discussion_id', 'parent' and 'path'.
+    """
+    query = match_expression(text)
+    if query is None:
+        return []
+    results = []
+    for result_type in types:
+        results += [to_result(result_type, row) for row in search_type(result_type, query, after, limit)]
+    results.sort(key=lambda result: (result['rank'], result['type'], result['id']))
+    return results[:limit]
+
+
+def search_type(result_type, query, after, limit):
+    """Raw queryset of the best `limit` matches of one type after the keyset position."""
+    index, model, column = SEARCH_TYPES[result_type]
+    params = [query]
+    keyset = ''
+    if after is not None:
+        rank, last_type, last_id = after
+        if result_type > last_type:
+            keyset = 'AND idx.rank >= %s'
+            params.append(rank)
+        elif result_type < last_type:
+            keyset = 'AND idx.rank > %s'
+            params.append(rank)
+        else:
+            keyset = 'AND (idx.rank > %s OR (idx.rank = %s AND t.id > %s))'
+            params += [rank, rank, last_id]
+    params.append(limit)
+    return model.objects.raw(
+        f"""SELECT t.*, idx.rank AS rank,
+                   snippet({index}, 0, '{MATCH_START}', '{MATCH_END}', '…', {SNIPPET_TOKENS}) AS snippet
+            FROM {index} AS idx JOIN {model._meta.db_table} AS t ON t.id = idx.rowid
+            WHERE {index} MATCH %s {keyset}
+            ORDER BY idx.rank, t.id
+            LIMIT %s""",
+        params
+    )
+
+
+def to_result(result_type, instance):
+    result = {
+        'type': result_type,
+        'id': instance.id,
+        'rank': instance.rank,
+        'user': instance.user,
+        'created_at': instance.created_at,
+        'snippet': highlight(instance.snippet),
+    }
+    if result_type == 'discussion':
+        result['title'] = instance.title
+    else:
+        result['discussion_id'] = instance.discussion_id
+        result['parent'] = instance.parent_id
+        result['path'] = decode_tree_path(instance.tree_path)
+    return result
+
+
+def rebuild_index(optimize=False):
+    """
+    Rebuild the search indexes from the model tables, and optionally merge their segments.
+
+    Returns:
+        list: (index table, number of indexed rows) for each index.
+    """
+    counts = []
+    with connection.cursor() as cursor:
+        for index, model, _column in SEARCH_TYPES.values():
+            cursor.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+            if optimize:
+                cursor.execute(f"INSERT INTO {index} ({index}) VALUES ('optimize')")
+            counts.append((index, model.objects.count()))
+    return counts
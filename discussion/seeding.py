@@ -0,0 +1,112 @@
+"""
+Synthetic comment threads for load testing and benchmarks.
+
+Each shape stresses the tree queries differently:
+
+- random: every comment replies to a random earlier one (or is top level), a bushy tree
+  a few levels deep.
+- deep: long reply chains, up to max_depth levels, a few of them side by side.
+- wide: a few top level comments with every other comment replying directly to one.
+- power-law: preferential attachment, comments with more replies are more likely to get
+  the next one, so a handful of subthreads hold most of the comments.
+"""
+import itertools
+import random
+
+from django.db import transaction
+
+from .models import Comment, Discussion
+from .signals import comments_bulk_created
+
+SHAPES = ('random', 'deep', 'wide', 'power-law')
+
+
+def build_vocabulary(size=5000):
+    """Made up words of two or three syllables, in a fixed order, the first being the most common."""
+    syllables = ('ba', 'ce', 'di', 'fo', 'gu', 'ka', 'le', 'mi', 'no', 'pu', 'ra', 'se', 'ti', 'vo', 'zu', 'an', 'el', 'is', 'or', 'ut')
+    words = [''.join(parts) for length in (2, 3) for parts in itertools.product(syllables, repeat=length)]
+    random.Random(0).shuffle(words)
+    return words[:size]
+
+
+# Comment text draws words from VOCABULARY with Zipf frequencies, like natural language:
+# a few words appear in most comments, most words in very few. Search benchmarks rely on it.
+VOCABULARY = build_vocabulary()
+WORD_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+
+
+def comment_text(rng, min_words=4, max_words=30):
+    """Random comment text of made up words, see VOCABULARY."""
+    words = rng.choices(VOCABULARY, cum_weights=WORD_WEIGHTS, k=rng.randint(min_words, max_words))
+    return ' '.join(words).capitalize()
+
+
+def thread_items(comments, shape='random', max_depth=50, fan_out=5, seed=0):
+    """
+    Build the items of one synthetic thread, in the format of Comment.bulk_create_tree.
+
+    Args:
+        comments (int): Number of comments.
+        shape (str): One of SHAPES.
+        max_depth (int): Deepest level a comment may be at (0 is top level).
+        fan_out (int): Roughly one in fan_out comments is top level.
+        seed (int): Seed of the random generator, the same arguments give the same thread.
+
+    Returns:
+        list: Dicts with 'user', 'content' and 'parent_index' (None for top level comments).
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown shape {shape!r}, expected one of {', '.join(SHAPES)}")
+    rng = random.Random(seed)
+    parents = []  # parent index of every item so far
+    depths = []
+    roots = []
+    # power-law: every comment appears once, plus once more per reply it got
+    attachment = []
+
+    for index in range(comments):
+        top_level = not parents or rng.randrange(fan_out) == 0
+        if shape == 'deep':
+            # keep extending the newest chain until it hits max_depth
+            parent = None if not parents or depths[-1] >= max_depth else index - 1
+        elif top_level:
+            parent = None
+        elif shape == 'wide':
+            parent = rng.choice(roots)
+        elif shape == 'power-law':
+            parent = rng.choice(attachment)
+        else:
+            parent = rng.randrange(index)
+        if parent is not None and depths[parent] >= max_depth:
+            parent = None
+
+        parents.append(parent)
+        depths.append(0 if parent is None else depths[parent] + 1)
+        if parent is None:
+            roots.append(index)
+        attachment.append(index)
+        if parent is not None:
+            attachment.append(parent)
+
+    return [
+        {'user': f'user{rng.randrange(1000)}', 'content': comment_text(rng), 'parent_index': parent}
+        for parent in parents
+    ]
+
+
+def seed_discussion(comments, shape='random', max_depth=50, fan_out=5, seed=0, title=None):
+    """
+    Create a discussion holding a synthetic thread built by thread_items.
+
+    Returns:
+        Discussion
+    """
+    with transaction.atomic():
+        discussion = Discussion.objects.create(
+            user='seed',
+            title=title or f'Synthetic {shape} thread ({comments} comments)'
+        )
+        Comment.bulk_create_tree(discussion.id, thread_items(comments, shape, max_depth, fan_out, seed), {})
+    comments_bulk_created(discussion.id)
+    discussion.refresh_from_db()
+    return discussion
@@ -1,22 +1,100 @@
+from django.conf import settings
+from django.utils import timezone
+from django.utils.functional import cached_property
 from rest_framework import serializers
+from rest_framework.fields import empty
+from .metrics import timed
 from .models import Discussion, Comment
 
-class DiscussionSerializer(serializers.ModelSerializer):
+
+class TimedDataMixin:
+    """Counts building .data as serialization time of the current request (see discussion/metrics.py)."""
+
+    @property
+    def data(self):
+        with timed('serialize'):
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    """ListSerializer for many=True serializers of this module, timed like the single ones."""
+
+
+class ReadOnlyRepresentationMixin:
+    """
+    Helpers for serializers writing to_representation by hand.
+
+    Datetimes are formatted like DRF's DateTimeField does with the default settings
+    (ISO 8601 in the current time zone, 'Z' for UTC), looking the time zone up once per
+    serializer instead of once per value. With many=True the child serializer, and so
+    the lookup, is shared by every row.
+    """
+
+    @cached_property
+    def output_timezone(self):
+        return timezone.get_current_timezone() if settings.USE_TZ else None
+
+    def format_datetime(self, value):
+        if value is None:
+            return None
+        if self.output_timezone is not None and timezone.is_aware(value):
+            value = value.astimezone(self.output_timezone)
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+class DiscussionSerializer(TimedDataMixin, serializers.ModelSerializer):
     """Serializer for the Discussion model."""
 
     class Meta:
         model = Discussion
-        fields = ['id', 'user', 'title', 'created_at'] 
-        read_only_fields = ['id', 'created_at']
+        fields = ['id', 'user', 'title', 'created_at', 'comment_count', 'participant_count', 'last_activity_at']
+        read_only_fields = ['id', 'created_at', 'comment_count', 'participant_count', 'last_activity_at']
+        list_serializer_class = TimedListSerializer
         extra_kwargs = {
             'user': {'help_text': 'Username of the discussion creator'},
             'title': {'help_text': 'Title of the discussion'},
             'created_at': {'help_text': 'Timestamp when the discussion was created'},
+            'comment_count': {'help_text': 'Number of comments in the discussion, at any level'},
+            'participant_count': {'help_text': 'Number of distinct users who commented in the discussion'},
+            'last_activity_at': {'help_text': 'Timestamp of the newest comment, or of the discussion if it has none'},
         }
 
 
 
-class FlatCommentSerializer(serializers.ModelSerializer):
+class DiscussionReadSerializer(ReadOnlyRepresentationMixin, DiscussionSerializer):
+    """
+    Read only DiscussionSerializer for the list and detail responses.
+
+    Builds the representation directly instead of going through every field's
+    get_attribute / to_representation, and never builds the ModelSerializer fields.
+    The output is the same as DiscussionSerializer's, whose fields still describe it
+    in the API schema.
+
+    With 'fields' in the context (the ?fields= of the views) only those, and id, are
+    returned, and only those are read from the instance.
+    """
+    datetime_fields = ('created_at', 'last_activity_at')
+
+    def to_representation(self, instance):
+        fields = self.context.get('fields')
+        if fields is not None:
+            return {
+                name: self.format_datetime(getattr(instance, name)) if name in self.datetime_fields else getattr(instance, name)
+                for name in self.Meta.fields if name == 'id' or name in fields
+            }
+        return {
+            'id': instance.id,
+            'user': instance.user,
+            'title': instance.title,
+            'created_at': self.format_datetime(instance.created_at),
+            'comment_count': instance.comment_count,
+            'participant_count': instance.participant_count,
+            'last_activity_at': self.format_datetime(instance.last_activity_at),
+        }
+
+
+class FlatCommentSerializer(TimedDataMixin, serializers.ModelSerializer):
     """
     Serializer for the Comment model that includes tree structure information.
     
@@ -30,12 +108,110 @@ class FlatCommentSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Comment
-        fields = ['id', 'discussion', 'user', 'parent', 'content', 'created_at', 'level', 'path']
-        read_only_fields = ['id', 'created_at', 'level', 'path']
+        fields = ['id', 'discussion', 'user', 'parent', 'content', 'created_at', 'reply_count', 'descendant_count', 'level', 'path']
+        read_only_fields = ['id', 'created_at', 'reply_count', 'descendant_count', 'level', 'path']
+        list_serializer_class = TimedListSerializer
         extra_kwargs = {
             'discussion': {'help_text': 'ID of the discussion this comment belongs to'},
             'user': {'help_text': 'Username of the comment author'},
             'parent': {'help_text': 'Id of the parent comment if this is a reply, or null for top  level comments'},
             'content': {'help_text': 'Body of the comment'},
-            'created_at': {'help_text': 'Timestamp when the comment was created'}
+            'created_at': {'help_text': 'Timestamp when the comment was created'},
+            'reply_count': {'help_text': 'Number of direct replies to the comment'},
+            'descendant_count': {'help_text': 'Number of replies at any level below the comment'},
         }
+
+    def validate(self, attrs):
+        parent = attrs.get('parent')
+        discussion = attrs.get('discussion', getattr(self.instance, 'discussion', None))
+        if parent is not None and discussion is not None and parent.discussion_id != discussion.pk:
+            raise serializers.ValidationError({'parent': [f'Comment {parent.pk} does not exist in this discussion.']})
+        return attrs
+
+
+class FlatCommentReadSerializer(ReadOnlyRepresentationMixin, FlatCommentSerializer):
+    """
+    Read only FlatCommentSerializer for a saved comment, e.g. the body of a 201 response.
+
+    Same output as FlatCommentSerializer for a Comment instance (no level or path, the
+    model doesn't have them), built directly like DiscussionReadSerializer.
+    """
+    def to_representation(self, instance):
+        return {
+            'id': instance.id,
+            'discussion': instance.discussion_id,
+            'user': instance.user,
+            'parent': instance.parent_id,
+            'content': instance.content,
+            'created_at': self.format_datetime(instance.created_at),
+            'reply_count': instance.reply_count,
+            'descendant_count': instance.descendant_count,
+        }
+
+
+class BulkCommentListSerializer(serializers.ListSerializer):
+    """
+    Validates a whole batch of comments with set based queries.
+
+    Existing parents are checked with a single query instead of one lookup per comment,
+    and parents created earlier in the same batch are referenced by their index.
+    Expects 'discussion_id' in the serializer context.
+    """
+
+    def run_validation(self, data=empty):
+        items = super().run_validation(data)
+        # After the per item checks, so the errors keep their one-object-per-item shape
+        # (ListSerializer.validate errors are wrapped in non_field_errors)
+        return self.validate_batch(items)
+
+    def validate_batch(self, items):
+        errors = [{} for _ in items]
+
+        parent_ids = {item['parent'] for item in items if item.get('parent') is not None}
+        parents = {
+            comment_id: (tree_path, depth)
+            for comment_id, tree_path, depth in Comment.objects
+            .filter(id__in=parent_ids, discussion_id=self.context['discussion_id'])
+            .values_list('id', 'tree_path', 'depth')
+        }
+
+        for index, item in enumerate(items):
+            parent = item.get('parent')
+            parent_index = item.get('parent_index')
+            if parent is not None and parent not in parents:
+                errors[index]['parent'] = [f'Comment {parent} does not exist in this discussion.']
+            if parent_index is not None and parent_index >= index:
+                errors[index]['parent_index'] = ['Must point to an earlier comment in the batch.']
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        # handed to Comment.bulk_create_tree so it doesn't have to look the parents up again
+        self.existing_parents = parents
+        return items
+
+
+class BulkCommentSerializer(serializers.Serializer):
+    """
+    One comment of a bulk creation request.
+
+    A comment is top level, a reply to an existing comment ('parent'), or a reply to a
+    comment earlier in the same batch ('parent_index', its position in the array).
+    """
+    # Largest batch accepted by the bulk endpoint
+    MAX_BATCH_SIZE = 5000
+
+    user = serializers.CharField(max_length=100, help_text='Username of the comment author')
+    content = serializers.CharField(help_text='Body of the comment')
+    parent = serializers.IntegerField(required=False, allow_null=True,
+                                      help_text='Id of an existing comment this replies to')
+    parent_index = serializers.IntegerField(required=False, allow_null=True, min_value=0,
+                                            help_text='Position in the batch of an earlier comment this replies to')
+
+    class Meta:
+        list_serializer_class = BulkCommentListSerializer
+
+    def validate(self, attrs):
+        if attrs.get('parent') is not None and attrs.get('parent_index') is not None:
+            raise serializers.ValidationError("Set either 'parent' or 'parent_index', not both.")
+        return attrs
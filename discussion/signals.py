@@ -0,0 +1,75 @@
+from django.db import transaction
+
+from .cache import comment_tree_cache
+from .events import publish_comments
+from .models import Comment, Discussion
+
+
+def invalidate_discussion_tree(discussion_id):
+    """
+    Bump the tree version of a discussion now and again once the transaction commits.
+
+    The second bump covers readers that cached the old tree under the new version
+    between the first bump and the commit.
+    """
+    comment_tree_cache.bump(discussion_id)
+    transaction.on_commit(lambda: comment_tree_cache.bump(discussion_id), robust=True)
+
+
+def discussion_saved(sender, instance, created, **kwargs):
+    # A new discussion may reuse the id of a deleted one, start it on a fresh version
+    if created:
+        comment_tree_cache.bump(instance.id)
+
+
+def comment_saved(sender, instance, created, **kwargs):
+    """
+    A comment was saved: move the discussion's change marker and drop its cached trees.
+
+    New comments are also pushed to the discussion's live streams once committed.
+    """
+    # Inserts move the marker along with the counters in Comment.save
+    if created:
+        publish_comments([instance])
+    else:
+        Discussion.mark_changed(instance.discussion_id)
+    invalidate_discussion_tree(instance.discussion_id)
+
+
+def comment_deleting(sender, instance, **kwargs):
+    """
+    A comment is about to be deleted: measure its subtree while it still exists.
+
+    Only for the comment delete() was called on, the replies going with it in the
+    cascade are then accounted for all at once by comment_deleted.
+    """
+    if kwargs.get('origin') is instance:
+        instance.deleted_subtree = instance.subtree_stats()
+
+
+def comment_deleted(sender, instance, **kwargs):
+    """
+    A comment was deleted: update the counters and drop the discussion's cached trees.
+
+    Handled here rather than in Comment.delete() because cascades and queryset deletes
+    never call it, but do send post_delete for every row. When the comment goes because
+    its discussion is deleted, neither is left to update. A comment deleted with its
+    replies updates them once for the whole subtree, its replies are skipped.
+    """
+    origin = kwargs.get('origin')
+    if isinstance(origin, Discussion) or getattr(origin, 'model', None) is Discussion:
+        return
+    if isinstance(origin, Comment) and origin is not instance:
+        return
+    if origin is instance:
+        deleted, newest = instance.deleted_subtree
+        instance.count_delete(deleted, newest)
+    else:
+        instance.count_delete()
+    invalidate_discussion_tree(instance.discussion_id)
+
+
+def comments_bulk_created(discussion_id, comments=()):
+    """Counterpart of comment_saved for Comment.bulk_create_tree, which sends no signals."""
+    invalidate_discussion_tree(discussion_id)
+    publish_comments(comments)
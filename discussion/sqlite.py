@@ -0,0 +1,32 @@
+"""
+Connection profile for SQLite databases.
+
+apply_sqlite_pragmas runs on connection_created (see DiscussionConfig.ready) and sets the
+PRAGMAs from the SQLITE_PRAGMAS setting on every new SQLite connection, in order. With
+persistent connections (CONN_MAX_AGE) that happens once per connection, not per request.
+"""
+import re
+
+from django.conf import settings
+
+# PRAGMA names and values are interpolated into SQL, so only allow plain words and numbers
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+PRAGMA_VALUE = re.compile(r'^(-?\d+|[A-Za-z_]+)$')
+
+
+def sqlite_pragmas():
+    """The configured PRAGMAs as a list of (name, value), validated."""
+    pragmas = list(getattr(settings, 'SQLITE_PRAGMAS', {}).items())
+    for name, value in pragmas:
+        if not PRAGMA_NAME.match(name) or not PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f"Invalid SQLITE_PRAGMAS entry {name!r}: {value!r}")
+    return pragmas
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """connection_created receiver applying SQLITE_PRAGMAS to SQLite connections."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in sqlite_pragmas():
+            cursor.execute(f'PRAGMA {name} = {value}')
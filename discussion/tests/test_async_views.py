@@ -0,0 +1,114 @@
+# api/tests/test_async_views.py
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import resolve, reverse
+from discussion.models import Discussion, Comment
+from discussion.views import encode_since_token
+
+
+async def read_body(response):
+    if response.streaming:
+        return b''.join([chunk async for chunk in response.streaming_content])
+    return response.content
+
+
+@override_settings(ROOT_URLCONF='config.urls_asgi')
+class AsyncReadViewTests(TestCase):
+    """Tests the async read endpoints used under ASGI answer exactly like the DRF views"""
+
+    def setUp(self):
+        """Create test data that will be used by the test methods"""
+        self.discussion = Discussion.objects.create(user="test_user", title="Test Discussion")
+        Discussion.objects.create(user="other_user", title="Other Discussion")
+        self.comment = Comment.objects.create(discussion=self.discussion, user="user", content="Top")
+        self.reply = Comment.objects.create(discussion=self.discussion, user="user", content="Reply", parent=self.comment)
+        Comment.objects.create(discussion=self.discussion, user="user", content="Nested", parent=self.reply)
+        # out of the current second, so both paths send the same Last-Modified
+        Discussion.objects.update(changed_at=F('changed_at') - timedelta(seconds=2))
+
+    def async_get(self, url, headers=None):
+        async def get():
+            response = await self.async_client.get(url, headers=headers)
+            return response, await read_body(response)
+        return async_to_sync(get)()
+
+    def sync_get(self, url, **extra):
+        with self.settings(ROOT_URLCONF='config.urls'):
+            response = self.client.get(url, **extra)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            return response, body
+
+    def test_read_urls_resolve_to_async_views(self):
+        """Test the read endpoints are native coroutines in the ASGI urlconf"""
+        for name, args in [('discussion-list', []), ('discussion-detail', [1]),
+                           ('discussion-comments', [1]), ('comment-replies', [1, 2])]:
+            self.assertTrue(iscoroutinefunction(resolve(reverse(name, args=args)).func), name)
+
+    def test_same_responses_as_sync_views(self):
+        """Test status, body and headers match the DRF views"""
+        comments_url = reverse('discussion-comments', args=[self.discussion.id])
+        replies_url = reverse('comment-replies', args=[self.discussion.id, self.comment.id])
+        urls = [
+            reverse('discussion-list'),
+            reverse('discussion-list') + '?page_size=1',
+            reverse('discussion-list') + '?cursor=garbage',
+            reverse('discussion-detail', args=[self.discussion.id]),
+            reverse('discussion-detail', args=[99999]),
+            comments_url,
+            f"{comments_url}?level=0",
+            f"{comments_url}?level=x",
+            f"{comments_url}?limit=1",
+            f"{comments_url}?stream=true",
+            f"{comments_url}?children=1",
+            f"{comments_url}?children=0",
+            f"{comments_url}?sort=most_replies&level=1",
+            f"{replies_url}?sort=newest",
+            reverse('discussion-comments', args=[99999]),
+            replies_url,
+            f"{replies_url}?level=0&stream=true",
+            reverse('comment-replies', args=[self.discussion.id, 99999]),
+            f"{comments_url}?since={encode_since_token(self.discussion, self.comment.id)}",
+            f"{replies_url}?level=0&since={encode_since_token(self.discussion, 0)}",
+            f"{comments_url}?since=garbage",
+            f"{comments_url}?fields=level,path",
+            f"{comments_url}?children=1&fields=user",
+            f"{comments_url}?fields=secret",
+            f"{replies_url}?fields=content&stream=true",
+            reverse('discussion-list') + '?fields=title&ordering=active',
+            reverse('discussion-detail', args=[self.discussion.id]) + '?fields=comment_count,last_activity_at',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                sync_response, sync_body = self.sync_get(url)
+                async_response, async_body = self.async_get(url)
+                self.assertEqual(async_response.status_code, sync_response.status_code)
+                self.assertEqual(async_body, sync_body)
+                for header in ['Content-Type', 'Allow', 'ETag', 'Last-Modified', 'Sync-Token']:
+                    self.assertEqual(async_response.get(header), sync_response.get(header), header)
+                # DRF also varies on Cookie because it loads the session to authenticate, the async path never does
+                self.assertIn('Accept', async_response['Vary'])
+
+    def test_conditional_get(self):
+        """Test a matching If-None-Match gives 304 on the async path too"""
+        url = reverse('discussion-comments', args=[self.discussion.id])
+        response, _ = self.async_get(url)
+        response, body = self.async_get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+
+    def test_writes_and_browsable_api_use_drf_views(self):
+        """Test POSTs and HTML requests are handed to the DRF views"""
+        url = reverse('discussion-comments', args=[self.discussion.id])
+
+        async def post():
+            return await self.async_client.post(url, {'user': 'new user', 'content': 'New'}, content_type='application/json')
+        response = async_to_sync(post)()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Comment.objects.filter(discussion=self.discussion).count(), 4)
+
+        response, body = self.async_get(url, headers={'Accept': 'text/html'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'<html', body)
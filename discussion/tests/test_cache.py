@@ -0,0 +1,106 @@
+# api/tests/test_cache.py
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from discussion.cache import CommentTreeCache, comment_tree_cache
+from discussion.models import Discussion, Comment
+
+
+class CommentTreeCacheTests(TestCase):
+    """Unit tests for the versioned CommentTreeCache"""
+
+    def setUp(self):
+        caches['comment_trees'].clear()
+        self.tree_cache = CommentTreeCache()
+
+    def test_get_or_build_caches_the_tree(self):
+        """Test the tree is only built on the first read"""
+        calls = []
+        build = lambda: calls.append(1) or [{'id': 1}]
+
+        self.assertEqual(self.tree_cache.get_or_build(1, ('comments', None), build), [{'id': 1}])
+        self.assertEqual(self.tree_cache.get_or_build(1, ('comments', None), build), [{'id': 1}])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.tree_cache.stats()['hits'], 1)
+        self.assertEqual(self.tree_cache.stats()['misses'], 1)
+
+    def test_bump_invalidates_every_variant(self):
+        """Test bumping the version drops all trees of that discussion only"""
+        self.tree_cache.get_or_build(1, ('comments', None), lambda: ['old'])
+        self.tree_cache.get_or_build(1, ('comments', 0), lambda: ['old'])
+        self.tree_cache.get_or_build(2, ('comments', None), lambda: ['other'])
+
+        self.tree_cache.bump(1)
+
+        self.assertEqual(self.tree_cache.get_or_build(1, ('comments', None), lambda: ['new']), ['new'])
+        self.assertEqual(self.tree_cache.get_or_build(1, ('comments', 0), lambda: ['new']), ['new'])
+        self.assertEqual(self.tree_cache.get_or_build(2, ('comments', None), lambda: ['new']), ['other'])
+
+    def test_lost_version_does_not_revive_old_trees(self):
+        """Test a version counter dropped from the cache restarts past the old versions"""
+        self.tree_cache.get_or_build(1, ('comments', None), lambda: ['old'])
+        old_version = self.tree_cache.get_version(1)
+        self.tree_cache.cache.delete(self.tree_cache.version_key(1))
+        self.assertGreater(self.tree_cache.get_version(1), old_version)
+
+    @override_settings(CACHES={
+        'comment_trees': {
+            'BACKEND': 'discussion.cache.CountingLocMemCache',
+            'LOCATION': 'comment-trees-small',
+            'OPTIONS': {'MAX_ENTRIES': 5, 'CULL_FREQUENCY': 5},
+        },
+    })
+    def test_evictions_are_counted(self):
+        """Test the LRU bound evicts entries and counts them"""
+        for discussion_id in range(10):
+            self.tree_cache.get_or_build(discussion_id, ('comments', None), lambda: [])
+        self.assertGreater(self.tree_cache.stats()['evictions'], 0)
+        self.assertLessEqual(len(self.tree_cache.cache._cache), 5)
+
+
+class CommentTreeCacheViewTests(APITestCase):
+    """Tests the comment endpoints read through and invalidate the cache"""
+
+    def setUp(self):
+        caches['comment_trees'].clear()
+        self.discussion = Discussion.objects.create(user="test_user", title="Test Discussion")
+        self.comment = Comment.objects.create(discussion=self.discussion, user="user", content="Top")
+        self.comments_url = reverse('discussion-comments', args=[self.discussion.id])
+        self.replies_url = reverse('comment-replies', args=[self.discussion.id, self.comment.id])
+
+    def test_repeated_reads_skip_the_tree_query(self):
+        """Test a cached tree only costs the discussion lookup"""
+        self.client.get(self.comments_url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.comments_url)
+        self.assertEqual([c['id'] for c in response.data], [self.comment.id])
+
+    def test_create_invalidates_cached_trees(self):
+        """Test readers see a new comment right after it is created"""
+        self.assertEqual(len(self.client.get(self.comments_url).data), 1)
+        self.assertEqual(len(self.client.get(self.replies_url).data), 0)
+
+        response = self.client.post(
+            self.comments_url,
+            {'user': 'replier', 'content': 'Reply', 'parent': self.comment.id},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(len(self.client.get(self.comments_url).data), 2)
+        self.assertEqual([c['id'] for c in self.client.get(self.replies_url).data], [response.data['id']])
+
+    def test_cache_stats_requires_staff(self):
+        """Test the stats endpoint is only available to staff users"""
+        url = reverse('cache-stats')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        staff = User.objects.create_user('staff', password='password', is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'hits', 'misses', 'evictions'})
+        self.assertEqual(response.data, comment_tree_cache.stats())
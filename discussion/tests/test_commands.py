@@ -0,0 +1,95 @@
+# api/tests/test_commands.py
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from discussion.models import Discussion, Comment
+from discussion.search import search
+from discussion.seeding import thread_items
+
+
+class RecomputeCountersTests(TestCase):
+    """Tests the recompute_counters management command"""
+
+    def setUp(self):
+        self.discussion = Discussion.objects.create(user="testuser", title="Test Discussion")
+        self.comment = Comment.objects.create(discussion=self.discussion, user="user", content="Comment")
+        self.reply = Comment.objects.create(discussion=self.discussion, user="user", content="Reply", parent=self.comment)
+
+    def test_no_drift(self):
+        """Test counters kept by the models are reported as correct"""
+        out = StringIO()
+        call_command('recompute_counters', stdout=out)
+        self.assertIn('Fixed drift in 0 discussion(s) and 0 comment(s)', out.getvalue())
+
+    def test_fixes_drift(self):
+        """Test drifted counters are reported, left alone on dry runs and fixed otherwise"""
+        Comment.objects.filter(pk=self.comment.pk).update(reply_count=5, descendant_count=0)
+        Discussion.objects.filter(pk=self.discussion.pk).update(comment_count=0)
+
+        out = StringIO()
+        call_command('recompute_counters', '--dry-run', stdout=out)
+        self.assertIn('Found drift in 1 discussion(s) and 1 comment(s)', out.getvalue())
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).reply_count, 5)
+
+        call_command('recompute_counters', '--discussion', str(self.discussion.id), stdout=StringIO())
+        self.comment.refresh_from_db()
+        self.discussion.refresh_from_db()
+        self.assertEqual((self.comment.reply_count, self.comment.descendant_count), (1, 1))
+        self.assertEqual(self.discussion.comment_count, 2)
+
+
+class SeedDiscussionsTests(TestCase):
+    """Tests the seed_discussions management command and the thread shapes behind it"""
+
+    def test_seeds_every_shape(self):
+        """Test one discussion per shape is created with the requested number of comments"""
+        call_command('seed_discussions', '--shape', 'all', '--comments', '60', '--max-depth', '8', stdout=StringIO())
+        self.assertEqual(Discussion.objects.count(), 4)
+        for discussion in Discussion.objects.all():
+            self.assertEqual(discussion.comments.count(), 60)
+            self.assertEqual(discussion.comment_count, 60)
+            self.assertLessEqual(max(discussion.comments.values_list('depth', flat=True)), 8)
+
+    def test_shapes(self):
+        """Test deep threads reach max_depth, wide ones stay flat and seeds are reproducible"""
+        def depths(items):
+            levels = []
+            for item in items:
+                levels.append(0 if item['parent_index'] is None else levels[item['parent_index']] + 1)
+            return levels
+
+        self.assertEqual(max(depths(thread_items(100, 'deep', max_depth=30))), 30)
+        self.assertEqual(max(depths(thread_items(100, 'wide'))), 1)
+        self.assertEqual(thread_items(50, 'power-law', seed=3), thread_items(50, 'power-law', seed=3))
+
+
+class RebuildSearchIndexTests(TestCase):
+    """Tests the rebuild_search_index management command"""
+
+    def test_rebuild(self):
+        """Test the index is rebuilt from the tables"""
+        discussion = Discussion.objects.create(user="user", title="Title")
+        Comment.objects.create(discussion=discussion, user="user", content="Findable")
+        out = StringIO()
+        call_command('rebuild_search_index', '--optimize', stdout=out)
+        self.assertIn('discussion_comment_search: 1 rows indexed', out.getvalue())
+        self.assertEqual([r['id'] for r in search('findable')], [Comment.objects.get().id])
+
+
+class OptimizeDatabaseTests(TransactionTestCase):
+    """Tests the optimize_database management command (outside a transaction, like cron runs it)"""
+
+    def test_optimize(self):
+        """Test PRAGMA optimize runs by default"""
+        out = StringIO()
+        call_command('optimize_database', stdout=out)
+        self.assertIn('PRAGMA optimize', out.getvalue())
+
+    def test_analyze_and_checkpoint(self):
+        """Test --analyze collects statistics for the indexes and --checkpoint checkpoints the WAL"""
+        Comment.objects.create(discussion=Discussion.objects.create(user="user", title="Title"), user="user", content="Comment")
+        out = StringIO()
+        call_command('optimize_database', '--analyze', '--checkpoint', stdout=out)
+        self.assertIn('ANALYZE', out.getvalue())
+        self.assertIn('PRAGMA wal_checkpoint(TRUNCATE)', out.getvalue())
+        self.assertRegex(out.getvalue(), r'sqlite_stat1 holds statistics for [1-9]\d* indexes')
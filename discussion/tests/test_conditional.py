@@ -0,0 +1,95 @@
+# api/tests/test_conditional.py
+from datetime import timedelta
+from unittest import mock
+
+from django.db.models import F
+from django.urls import reverse
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.test import APITestCase
+from discussion.models import Discussion, Comment
+
+
+class ConditionalGetTests(APITestCase):
+    """Tests ETag / Last-Modified handling on the discussion and comment endpoints"""
+
+    def setUp(self):
+        """Create test data that will be used by the test methods"""
+        self.discussion = Discussion.objects.create(user="test_user", title="Test Discussion")
+        self.comment = Comment.objects.create(discussion=self.discussion, user="user", content="Top")
+        self.detail_url = reverse('discussion-detail', args=[self.discussion.id])
+        self.comments_url = reverse('discussion-comments', args=[self.discussion.id])
+        self.replies_url = reverse('comment-replies', args=[self.discussion.id, self.comment.id])
+        # Last-Modified is only sent once the second of the last change is over
+        Discussion.objects.update(changed_at=F('changed_at') - timedelta(seconds=2))
+
+    def test_validators_on_every_endpoint(self):
+        """Test each endpoint returns ETag and Last-Modified, and a matching If-None-Match gives 304"""
+        for url in [self.detail_url, self.comments_url, self.replies_url, f"{self.comments_url}?limit=10"]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('ETag', response)
+            self.assertIn('Last-Modified', response)
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertIn('ETag', response)
+
+    def test_not_modified_skips_the_tree_query(self):
+        """Test a 304 only costs the lookup of the change marker"""
+        etag = self.client.get(self.comments_url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.comments_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        etag = self.client.get(self.replies_url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.replies_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_new_comment_changes_validators(self):
+        """Test a comment write makes the old ETag stale"""
+        etag = self.client.get(self.comments_url)['ETag']
+        self.client.post(self.comments_url, {'user': 'user', 'content': 'New'}, format='json')
+
+        response = self.client.get(self.comments_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.data), 2)
+
+    def test_etag_differs_per_query(self):
+        """Test different representations of the same discussion get different ETags"""
+        full = self.client.get(self.comments_url)['ETag']
+        top_level = self.client.get(f"{self.comments_url}?level=0")['ETag']
+        self.assertNotEqual(full, top_level)
+
+        response = self.client.get(f"{self.comments_url}?level=0", HTTP_IF_NONE_MATCH=full)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_if_modified_since(self):
+        """Test If-Modified-Since with the returned Last-Modified gives 304"""
+        last_modified = self.client.get(self.detail_url)['Last-Modified']
+        response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 1970 00:00:00 GMT')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_if_modified_since_same_second_write(self):
+        """Test a comment written in the second of a client's Last-Modified still gives 200"""
+        self.client.post(self.comments_url, {'user': 'user', 'content': 'New'}, format='json')
+        changed_at = Discussion.objects.get(pk=self.discussion.pk).changed_at
+        # what a response from earlier in the comment's second carried before
+        last_modified = http_date(int(changed_at.timestamp()))
+
+        with mock.patch('discussion.conditional.timezone.now', return_value=changed_at):
+            response = self.client.get(self.comments_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertNotIn('Last-Modified', response)
+
+        # once the second is over, the header is sent and can be used again
+        with mock.patch('discussion.conditional.timezone.now', return_value=changed_at + timedelta(seconds=1)):
+            last_modified = self.client.get(self.comments_url)['Last-Modified']
+            response = self.client.get(self.comments_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
@@ -0,0 +1,105 @@
+# api/tests/test_db_routers.py
+import time
+from collections import Counter
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from discussion.db_routers import (
+    PRIMARY, STICKY_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware, RoutingState,
+    read_from_primary, routing_state,
+)
+from discussion.models import Comment
+
+REPLICAS = {'replica1': 1, 'replica2': 1}
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS)
+class ReplicaRouterTests(SimpleTestCase):
+    """Tests which alias ReplicaRouter picks for reads and writes"""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        token = routing_state.set(RoutingState(use_replicas=True))
+        self.addCleanup(routing_state.reset, token)
+
+    def reads(self, count):
+        return [self.router.db_for_read(Comment) for _ in range(count)]
+
+    def test_round_robin(self):
+        """Test replicas take turns"""
+        self.assertEqual(self.reads(4), ['replica1', 'replica2', 'replica1', 'replica2'])
+
+    @override_settings(DATABASE_REPLICAS={'replica1': 3, 'replica2': 1}, DATABASE_REPLICA_SELECTION='weighted')
+    def test_weighted(self):
+        """Test replicas are picked in proportion to their weights"""
+        counts = Counter(self.reads(2000))
+        self.assertEqual(set(counts), {'replica1', 'replica2'})
+        self.assertGreater(counts['replica1'], 2 * counts['replica2'])
+
+    def test_writes_go_to_primary_and_pin_later_reads(self):
+        """Test a write goes to the primary and so do the request's reads after it"""
+        self.assertNotEqual(self.router.db_for_read(Comment), PRIMARY)
+        self.assertEqual(self.router.db_for_write(Comment), PRIMARY)
+        self.assertEqual(self.reads(3), [PRIMARY] * 3)
+
+    def test_read_from_primary(self):
+        """Test reads inside read_from_primary() use the primary"""
+        with read_from_primary():
+            self.assertEqual(self.reads(2), [PRIMARY] * 2)
+        self.assertNotEqual(self.router.db_for_read(Comment), PRIMARY)
+
+    def test_outside_requests(self):
+        """Test reads without a routing state, e.g. in management commands, use the primary"""
+        token = routing_state.set(None)
+        self.addCleanup(routing_state.reset, token)
+        self.assertEqual(self.reads(2), [PRIMARY] * 2)
+
+    @override_settings(DATABASE_REPLICAS={})
+    def test_no_replicas(self):
+        """Test everything uses the primary when no replicas are configured"""
+        self.assertEqual(self.reads(2), [PRIMARY] * 2)
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS, DATABASE_PRIMARY_STICKY_SECONDS=10)
+class ReplicaRoutingMiddlewareTests(SimpleTestCase):
+    """Tests ReplicaRoutingMiddleware's per request routing and stickiness"""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def handle(self, request, write=False):
+        """Run a request through the middleware, returning the response and the alias of a read"""
+        seen = {}
+
+        def view(request):
+            if write:
+                self.router.db_for_write(Comment)
+            seen['read'] = self.router.db_for_read(Comment)
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(request)
+        return response, seen['read']
+
+    def test_get_reads_from_replica(self):
+        response, alias = self.handle(self.factory.get('/api/discussions/'))
+        self.assertIn(alias, REPLICAS)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_post_uses_primary_and_sets_cookie(self):
+        """Test unsafe methods use the primary and a write pins the client to it"""
+        response, alias = self.handle(self.factory.post('/api/discussions/1/comments/'), write=True)
+        self.assertEqual(alias, PRIMARY)
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 10)
+        self.assertTrue(cookie['httponly'])
+
+    def test_sticky_cookie_pins_reads(self):
+        """Test GETs read from the primary while the cookie's window lasts"""
+        request = self.factory.get('/api/discussions/')
+        request.COOKIES[STICKY_COOKIE] = str(int(time.time()) + 10)
+        self.assertEqual(self.handle(request)[1], PRIMARY)
+
+        request = self.factory.get('/api/discussions/')
+        request.COOKIES[STICKY_COOKIE] = str(int(time.time()) - 1)
+        self.assertIn(self.handle(request)[1], REPLICAS)
@@ -0,0 +1,118 @@
+# api/tests/test_events.py
+import asyncio
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from discussion.events import get_backend
+from discussion.models import Comment, Discussion
+
+
+@override_settings(ROOT_URLCONF='config.urls_asgi', COMMENT_STREAM_HEARTBEAT_SECONDS=5)
+class CommentStreamTests(TestCase):
+    """Tests the Server-Sent Events stream of new comments"""
+
+    def setUp(self):
+        self.discussion = Discussion.objects.create(user='alice', title='Live')
+        self.top = Comment.objects.create(discussion=self.discussion, user='alice', content='Top')
+        self.url = reverse('comment-stream', kwargs={'discussion_id': self.discussion.id})
+
+    def create(self, content, parent=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Comment.objects.create(discussion=self.discussion, user='bob', content=content, parent=parent)
+
+    def stream(self, read, url=None, headers=None):
+        """Open the stream and return what read(response, next_message) returns, closing the stream after."""
+        async def run():
+            response = await self.async_client.get(url or self.url, headers=headers)
+            messages = aiter(response.streaming_content)
+
+            async def next_message():
+                return (await asyncio.wait_for(anext(messages), 2)).decode()
+            try:
+                return await read(response, next_message)
+            finally:
+                await messages.aclose()
+        return async_to_sync(run)()
+
+    def test_new_comments_are_pushed(self):
+        """Test a comment created while connected arrives as an event with its level and path"""
+        async def read(response, next_message):
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            self.assertTrue((await next_message()).startswith('retry: '))
+            reply = await sync_to_async(self.create)('Reply', self.top)
+            return reply, await next_message()
+
+        reply, message = self.stream(read)
+        self.assertIn(f'id: {reply.id}\nevent: comment\ndata: ', message)
+        self.assertIn('"level":1', message)
+        self.assertIn(f'"path":"{self.top.id},{reply.id}"', message)
+        self.assertEqual(get_backend().subscriber_count(), 0)
+
+    def test_resume_from_last_event_id(self):
+        """Test a reconnecting client first gets the comments it missed, and each only once"""
+        first = self.create('Missed one')
+        second = self.create('Missed two')
+
+        async def read(response, next_message):
+            await next_message()
+            backfill = [await next_message(), await next_message()]
+            live = await sync_to_async(self.create)('Live')
+            return backfill, live, await next_message()
+
+        backfill, live, message = self.stream(read, headers={'Last-Event-ID': str(self.top.id)})
+        self.assertTrue(backfill[0].startswith(f'id: {first.id}\n'))
+        self.assertTrue(backfill[1].startswith(f'id: {second.id}\n'))
+        self.assertTrue(message.startswith(f'id: {live.id}\n'))
+
+    def test_resume_too_far_behind(self):
+        """Test a client missing too many comments is told to reload instead"""
+        latest = self.create('Newest')
+
+        async def read(response, next_message):
+            await next_message()
+            return await next_message()
+
+        with mock.patch('discussion.async_views.SINCE_MAX_COMMENTS', 0):
+            message = self.stream(read, url=f'{self.url}?last_event_id=0')
+        self.assertTrue(message.startswith(f'id: {latest.id}\nevent: reset\n'))
+
+    @override_settings(COMMENT_STREAM_HEARTBEAT_SECONDS=0.01)
+    def test_heartbeat(self):
+        """Test an idle stream sends heartbeat comments"""
+        async def read(response, next_message):
+            await next_message()
+            return await next_message()
+
+        self.assertEqual(self.stream(read), ': heartbeat\n\n')
+
+    @override_settings(COMMENT_STREAM_BUFFER=2)
+    def test_slow_client_is_dropped(self):
+        """Test a client whose buffer overflows is unsubscribed and its stream ends"""
+        async def read(response, next_message):
+            await next_message()
+            for number in range(3):
+                await sync_to_async(self.create)(f'Comment {number}')
+            await asyncio.sleep(0)  # let the pushes land in the buffer
+            self.assertEqual(get_backend().subscriber_count(), 0)
+            with self.assertRaises(StopAsyncIteration):
+                await next_message()
+
+        self.stream(read)
+
+    def test_publish_failure_keeps_the_comment(self):
+        """Test a failing stream backend is logged, not raised to the writer of the committed comment"""
+        with mock.patch('discussion.events.get_backend', side_effect=RuntimeError('backend down')), \
+                self.assertLogs('django.test', 'ERROR'):
+            comment = self.create('Still saved')
+        self.assertTrue(Comment.objects.filter(pk=comment.pk).exists())
+
+    def test_errors(self):
+        """Test the stream of a missing discussion is a 404 and a malformed Last-Event-ID a 400"""
+        async def status(url, headers=None):
+            return (await self.async_client.get(url, headers=headers)).status_code
+
+        missing = reverse('comment-stream', kwargs={'discussion_id': 999})
+        self.assertEqual(async_to_sync(status)(missing), 404)
+        self.assertEqual(async_to_sync(status)(self.url, {'Last-Event-ID': 'abc'}), 400)
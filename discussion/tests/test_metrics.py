@@ -0,0 +1,75 @@
+# api/tests/test_metrics.py
+import re
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from discussion.metrics import registry
+from discussion.models import Discussion, Comment
+
+
+def server_timing(response):
+    """Parse a Server-Timing header into {name: (duration ms, description)}"""
+    timings = {}
+    for entry in response['Server-Timing'].split(', '):
+        name, *params = entry.split(';')
+        params = dict(param.split('=', 1) for param in params)
+        timings[name] = (float(params['dur']), params.get('desc', '').strip('"'))
+    return timings
+
+
+class RequestMetricsTests(TestCase):
+    """Tests the Server-Timing header and the Prometheus metrics endpoint"""
+
+    def setUp(self):
+        """Create test data that will be used by the test methods"""
+        registry.reset()
+        self.discussion = Discussion.objects.create(user="test_user", title="Test Discussion")
+        self.comment = Comment.objects.create(discussion=self.discussion, user="user", content="Top")
+        self.url = reverse('discussion-comments', args=[self.discussion.id])
+
+    def test_server_timing_header(self):
+        """Test the header reports SQL, serialization, render and total times with DEBUG off"""
+        response = self.client.get(reverse('discussion-detail', args=[self.discussion.id]))
+        timings = server_timing(response)
+
+        self.assertEqual(list(timings), ['sql', 'serialize', 'render', 'total'])
+        # the discussion lookup, nothing else
+        self.assertEqual(timings['sql'][1], '1 queries')
+        self.assertGreater(timings['serialize'][0], 0)
+        self.assertGreater(timings['render'][0], 0)
+        self.assertGreaterEqual(timings['total'][0], timings['sql'][0] + timings['render'][0])
+
+    @override_settings(SERVER_TIMING=False)
+    def test_server_timing_can_be_disabled(self):
+        """Test no header is sent when SERVER_TIMING is off"""
+        self.assertNotIn('Server-Timing', self.client.get(self.url))
+
+    def test_metrics_endpoint_is_opt_in(self):
+        """Test the metrics URL is a 404 unless METRICS_ENABLED is on"""
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_metrics_endpoint(self):
+        """Test requests are aggregated per endpoint in the Prometheus text format"""
+        self.client.get(self.url)
+        self.client.get(self.url)
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        labels = 'view="discussion-comments",method="GET"'
+        self.assertIn('# TYPE discussion_request_duration_seconds histogram', body)
+        self.assertIn(f'discussion_request_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'discussion_request_sql_queries_bucket{{{labels},le="+Inf"}} 2', body)
+        self.assertRegex(body, re.escape(f'discussion_request_sql_duration_seconds_sum{{{labels}}} ') + r'\d+\.\d+')
+
+    @override_settings(ROOT_URLCONF='config.urls_asgi')
+    def test_async_views(self):
+        """Test the async read views are measured, including queries run in the ORM's threads"""
+        async def get():
+            return await self.async_client.get(self.url, headers={'Accept': 'application/json'})
+
+        timings = server_timing(async_to_sync(get)())
+        self.assertEqual(timings['sql'][1], '2 queries')
+        self.assertGreater(timings['render'][0], 0)
@@ -1,7 +1,35 @@
 # api/tests/test_models.py
+from contextlib import contextmanager
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.core.exceptions import ValidationError
-from discussion.models import Discussion, Comment
+from discussion.models import Discussion, Comment, CommentClosure
+
+@contextmanager
+def count_sqlite_steps(granularity=10):
+    """Count SQLite virtual machine steps (in units of granularity) run inside the block"""
+    connection.ensure_connection()
+    counter = {'steps': 0}
+
+    def tick():
+        counter['steps'] += 1
+        return 0  # keep going
+
+    connection.connection.set_progress_handler(tick, granularity)
+    try:
+        yield counter
+    finally:
+        connection.connection.set_progress_handler(None, granularity)
+
+
+def add_subtree(discussion, parent, width, depth):
+    """Hang `width` chains of `depth` nested replies under parent"""
+    for _ in range(width):
+        node = parent
+        for _ in range(depth):
+            node = Comment.objects.create(discussion=discussion, user="filler", content="filler", parent=node)
+
 
 class DiscussionModelTests(TestCase):
     """Testing discussion model"""
@@ -73,6 +101,86 @@ class DiscussionModelTests(TestCase):
         
         self.assertEqual(c1['level'], 0)  # Top level comment
         self.assertEqual(c3['level'], 1)  # Reply should have level 1
+        self.assertEqual(c3['path'], f"{comment1.id},{comment3.id}")
+
+    def test_get_comments_flat_tree_order(self):
+        """Test comments come back depth first, with siblings in numeric id order"""
+        root = Comment.objects.create(discussion=self.discussion, user="user1", content="Root")
+        # enough replies that the ids cross a power of ten, which a string sort of '1,10' vs '1,2' gets wrong
+        replies = [
+            Comment.objects.create(discussion=self.discussion, user="user2", content=f"Reply {i}", parent=root)
+            for i in range(12)
+        ]
+        nested = Comment.objects.create(discussion=self.discussion, user="user3", content="Nested", parent=replies[0])
+        other_root = Comment.objects.create(discussion=self.discussion, user="user4", content="Other root")
+
+        flat_comments = self.discussion.get_comments_flat()
+
+        expected_ids = [root.id, replies[0].id, nested.id] + [r.id for r in replies[1:]] + [other_root.id]
+        self.assertEqual([c['id'] for c in flat_comments], expected_ids)
+        paths = [[int(i) for i in c['path'].split(',')] for c in flat_comments]
+        self.assertEqual(paths, sorted(paths))
+
+    def test_get_comments_flat_max_level(self):
+        """Test max_level limits how deep get_comments_flat goes"""
+        root = Comment.objects.create(discussion=self.discussion, user="user1", content="Root")
+        reply = Comment.objects.create(discussion=self.discussion, user="user2", content="Reply", parent=root)
+        Comment.objects.create(discussion=self.discussion, user="user3", content="Nested", parent=reply)
+
+        self.assertEqual([c['id'] for c in self.discussion.get_comments_flat(max_level=0)], [root.id])
+        self.assertEqual([c['id'] for c in self.discussion.get_comments_flat(max_level=1)], [root.id, reply.id])
+
+    def test_get_comments_flat_sorted(self):
+        """Test sort modes reorder siblings and keep the list depth-first"""
+        first = Comment.objects.create(discussion=self.discussion, user="user", content="First")
+        second = Comment.objects.create(discussion=self.discussion, user="user", content="Second")
+        first_reply = Comment.objects.create(discussion=self.discussion, user="user", content="Reply", parent=first)
+        second_replies = [Comment.objects.create(discussion=self.discussion, user="user", content="Reply", parent=second).id for _ in range(2)]
+
+        def ids(**kwargs):
+            return [c['id'] for c in self.discussion.get_comments_flat(**kwargs)]
+
+        self.assertEqual(ids(sort='oldest'), [first.id, first_reply.id, second.id, *second_replies])
+        self.assertEqual(ids(sort='newest'), [second.id, *second_replies[::-1], first.id, first_reply.id])
+        self.assertEqual(ids(sort='most_replies'), [second.id, *second_replies, first.id, first_reply.id])
+        self.assertEqual(ids(sort='newest', max_level=0), [second.id, first.id])
+        self.assertEqual([c['id'] for c in second.get_replies_flat(sort='newest')], second_replies[::-1])
+
+    def test_get_comments_collapsed(self):
+        """Test collapsing keeps the first replies per comment, with stubs to continue from"""
+        roots = [Comment.objects.create(discussion=self.discussion, user="user", content="Root") for _ in range(3)]
+        replies = [Comment.objects.create(discussion=self.discussion, user="user", content="Reply", parent=roots[0]) for _ in range(4)]
+        hidden_nested = Comment.objects.create(discussion=self.discussion, user="user", content="Hidden", parent=replies[3])
+
+        tree = self.discussion.get_comments_collapsed(2)
+        self.assertEqual([item.get('id', item.get('type')) for item in tree],
+                         [roots[0].id, replies[0].id, replies[1].id, 'more', roots[1].id, 'more'])
+        reply_stub, root_stub = tree[3], tree[5]
+        self.assertEqual((reply_stub['parent'], reply_stub['level'], reply_stub['hidden_count']), (roots[0].id, 1, 2))
+        self.assertEqual((root_stub['parent'], root_stub['level'], root_stub['hidden_count']), (None, 0, 1))
+
+        rest = self.discussion.get_comments_collapsed(2, after=reply_stub['after'])
+        self.assertEqual([c['id'] for c in rest], [replies[2].id, replies[3].id, hidden_nested.id])
+        self.assertEqual([c['id'] for c in self.discussion.get_comments_collapsed(2, after=root_stub['after'])], [roots[2].id])
+        self.assertEqual(len(self.discussion.get_comments_collapsed(2, max_level=0)), 3)  # 2 roots and a stub
+
+    def test_get_comments_flat_max_level_cost_is_bounded(self):
+        """Test level limited reads only touch the levels they return, however deep the tree is"""
+        roots = [Comment.objects.create(discussion=self.discussion, user="user", content="Root") for _ in range(5)]
+
+        with count_sqlite_steps() as before:
+            shallow = self.discussion.get_comments_flat(max_level=0)
+
+        for root in roots:
+            add_subtree(self.discussion, root, width=10, depth=10)
+
+        with count_sqlite_steps() as after:
+            deep = self.discussion.get_comments_flat(max_level=0)
+
+        self.assertEqual(len(deep), len(shallow))
+        self.assertEqual(Comment.objects.count(), 505)
+        # 100x more rows in the discussion, a full scan would take roughly 100x the steps
+        self.assertLess(after['steps'], before['steps'] * 2)
 
 
 class CommentModelTests(TestCase):
@@ -143,6 +251,22 @@ class CommentModelTests(TestCase):
         # Check reverse relationship
         self.assertEqual(self.comment.replies.first(), reply)
     
+    def test_tree_position_set_on_create(self):
+        """Test tree_path and depth are filled in when a comment is saved"""
+        reply = Comment.objects.create(
+            discussion=self.discussion,
+            user="reply_user",
+            content="This is a reply",
+            parent=self.comment
+        )
+        reply.refresh_from_db()
+        self.comment.refresh_from_db()
+
+        self.assertEqual(self.comment.depth, 0)
+        self.assertEqual(self.comment.tree_path, str(self.comment.id).zfill(10))
+        self.assertEqual(reply.depth, 1)
+        self.assertEqual(reply.tree_path, self.comment.tree_path + str(reply.id).zfill(10))
+
     def test_get_replies_flat(self):
         """Test the get_replies_flat method returns correct srtucture"""
         # creating nested replies
@@ -183,4 +307,148 @@ class CommentModelTests(TestCase):
         print('rr', rr)
         # Check levels
         self.assertEqual(r1['level'], 0)  # Direct reply
-        self.assertEqual(rr['level'], 1)  # Reply to a  reply
\ No newline at end of file
+        self.assertEqual(rr['level'], 1)  # Reply to a  reply
+        # Paths are relative to the comment we asked for
+        self.assertEqual(r1['path'], str(reply1.id))
+        self.assertEqual(rr['path'], f"{reply1.id},{reply_to_reply.id}")
+        self.assertEqual([r['id'] for r in replies], [reply1.id, reply_to_reply.id, reply2.id])
+
+    def test_get_replies_flat_max_level(self):
+        """Test max_level limits get_replies_flat relative to the comment and keeps the cost bounded"""
+        reply = Comment.objects.create(discussion=self.discussion, user="user1", content="Reply", parent=self.comment)
+        nested = Comment.objects.create(discussion=self.discussion, user="user2", content="Nested", parent=reply)
+
+        self.assertEqual([r['id'] for r in self.comment.get_replies_flat(max_level=0)], [reply.id])
+        self.assertEqual([r['id'] for r in self.comment.get_replies_flat(max_level=1)], [reply.id, nested.id])
+
+        with count_sqlite_steps() as before:
+            self.comment.get_replies_flat(max_level=1)
+        add_subtree(self.discussion, nested, width=20, depth=10)
+        with count_sqlite_steps() as after:
+            rows = self.comment.get_replies_flat(max_level=1)
+
+        self.assertEqual(len(rows), 2)
+        self.assertLess(after['steps'], before['steps'] * 2)
+
+    def test_counters_follow_creates(self):
+        """Test reply, descendant and comment counters are kept in sync on create"""
+        reply = Comment.objects.create(discussion=self.discussion, user="user1", content="Reply", parent=self.comment)
+        nested = Comment.objects.create(discussion=self.discussion, user="user2", content="Nested", parent=reply)
+        Comment.objects.create(discussion=self.discussion, user="user3", content="Second reply", parent=self.comment)
+        self.comment.refresh_from_db()
+        reply.refresh_from_db()
+        self.discussion.refresh_from_db()
+
+        self.assertEqual((self.comment.reply_count, self.comment.descendant_count), (2, 3))
+        self.assertEqual((reply.reply_count, reply.descendant_count), (1, 1))
+        nested.refresh_from_db()
+        self.assertEqual((nested.reply_count, nested.descendant_count), (0, 0))
+        self.assertEqual((self.discussion.comment_count, self.discussion.participant_count), (4, 4))
+        self.assertEqual(self.discussion.last_activity_at, Comment.objects.latest('created_at').created_at)
+
+    def test_counters_follow_deletes(self):
+        """Test deleting a comment, including its cascaded replies, decrements the counters"""
+        reply = Comment.objects.create(discussion=self.discussion, user="user1", content="Reply", parent=self.comment)
+        Comment.objects.create(discussion=self.discussion, user="user2", content="Nested", parent=reply)
+        reply.delete()
+        self.comment.refresh_from_db()
+        self.discussion.refresh_from_db()
+
+        self.assertEqual((self.comment.reply_count, self.comment.descendant_count), (0, 0))
+        self.assertEqual((self.discussion.comment_count, self.discussion.participant_count), (1, 1))
+        self.assertEqual(self.discussion.last_activity_at, self.comment.created_at)
+
+    def test_discussion_delete_skips_counters(self):
+        """Test deleting a discussion costs the same queries however many comments cascade with it"""
+        def delete_queries(discussion, comments):
+            top = Comment.objects.create(discussion=discussion, user="user1", content="Top")
+            for number in range(comments):
+                Comment.objects.create(discussion=discussion, user=f"user{number}", content=f"Reply {number}", parent=top)
+            with CaptureQueriesContext(connection) as queries:
+                discussion.delete()
+            return len(queries)
+
+        few = delete_queries(self.discussion, 2)
+        many = delete_queries(Discussion.objects.create(user="user1", title="Long thread"), 20)
+        self.assertEqual(few, many)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_subtree_delete_queries(self):
+        """Test deleting a comment costs the same queries and commit hooks however many replies go with it"""
+        def delete_cost(replies):
+            reply = Comment.objects.create(discussion=self.discussion, user="user1", content="Reply", parent=self.comment)
+            for number in range(replies):
+                Comment.objects.create(discussion=self.discussion, user=f"user{number}", content=f"Nested {number}", parent=reply)
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+                reply.delete()
+            return len(queries), len(callbacks)
+
+        self.assertEqual(delete_cost(2), delete_cost(30))
+        self.comment.refresh_from_db()
+        self.discussion.refresh_from_db()
+        self.assertEqual((self.comment.reply_count, self.comment.descendant_count), (0, 0))
+        self.assertEqual((self.discussion.comment_count, self.discussion.participant_count), (1, 1))
+        self.assertEqual(self.discussion.last_activity_at, self.comment.created_at)
+
+    def test_participants_follow_repeat_authors(self):
+        """Test a user is counted once however many comments they write, and until their last one is gone"""
+        reply = Comment.objects.create(discussion=self.discussion, user="user1", content="Reply", parent=self.comment)
+        Comment.objects.create(discussion=self.discussion, user="user1", content="Nested", parent=reply)
+        Comment.objects.create(discussion=self.discussion, user="user1", content="Elsewhere")
+        self.discussion.refresh_from_db()
+        self.assertEqual(self.discussion.participant_count, 2)
+
+        reply.delete()  # two of user1's comments in one cascade
+        self.discussion.refresh_from_db()
+        self.assertEqual(self.discussion.participant_count, 2)
+        Comment.objects.get(content="Elsewhere").delete()
+        self.discussion.refresh_from_db()
+        self.assertEqual(self.discussion.participant_count, 1)
+
+    def test_counters_follow_bulk_create(self):
+        """Test bulk_create_tree updates counters of new and existing comments"""
+        Comment.bulk_create_tree(self.discussion.id, [
+            {'user': 'u', 'content': 'Reply', 'parent': self.comment.id},
+            {'user': 'u', 'content': 'Nested', 'parent_index': 0},
+            {'user': 'u', 'content': 'Root'},
+        ], existing_parents={self.comment.id: (self.comment.tree_path, self.comment.depth)})
+        self.comment.refresh_from_db()
+        self.discussion.refresh_from_db()
+        reply = Comment.objects.get(content='Reply')
+
+        self.assertEqual((self.comment.reply_count, self.comment.descendant_count), (1, 2))
+        self.assertEqual((reply.reply_count, reply.descendant_count), (1, 1))
+        self.assertEqual((self.discussion.comment_count, self.discussion.participant_count), (4, 2))
+
+    def test_closure_rows(self):
+        """Test the closure table links every comment to itself and its ancestors, after save and bulk create"""
+        reply = Comment.objects.create(discussion=self.discussion, user="user1", content="Reply", parent=self.comment)
+        nested, = Comment.bulk_create_tree(self.discussion.id, [
+            {'user': 'u', 'content': 'Nested', 'parent': reply.id},
+        ], existing_parents={reply.id: (reply.tree_path, reply.depth)})
+        links = set(CommentClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        self.assertEqual(links, {
+            (self.comment.id, self.comment.id, 0),
+            (self.comment.id, reply.id, 1), (reply.id, reply.id, 0),
+            (self.comment.id, nested.id, 2), (reply.id, nested.id, 1), (nested.id, nested.id, 0),
+        })
+
+        reply.delete()
+        self.assertEqual(list(CommentClosure.objects.values_list('descendant_id', flat=True)), [self.comment.id])
+
+    def test_get_context_flat(self):
+        """Test ancestors, the comment and a limited number of reply levels"""
+        reply = Comment.objects.create(discussion=self.discussion, user="user1", content="Reply", parent=self.comment)
+        nested = Comment.objects.create(discussion=self.discussion, user="user2", content="Nested", parent=reply)
+        deeper = Comment.objects.create(discussion=self.discussion, user="user3", content="Deeper", parent=nested)
+
+        context = reply.get_context_flat(1)
+        self.assertEqual([c['id'] for c in context['ancestors']], [self.comment.id])
+        self.assertEqual(context['comment']['id'], reply.id)
+        self.assertEqual([c['id'] for c in context['replies']], [nested.id])
+        self.assertEqual((context['replies'][0]['level'], context['replies'][0]['path']),
+                         (2, f"{self.comment.id},{reply.id},{nested.id}"))
+
+        self.assertEqual([c['id'] for c in reply.get_context_flat(5)['replies']], [nested.id, deeper.id])
+        self.assertEqual(reply.get_context_flat(0)['replies'], [])
+        self.assertEqual(self.comment.get_context_flat(0)['ancestors'], [])
@@ -0,0 +1,130 @@
+# api/tests/test_query_plans.py
+import re
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from discussion.models import Discussion, Comment
+from discussion.views import encode_since_token
+
+# Seed data: discussions, each with this many comments in a tree three replies wide
+SEED_DISCUSSIONS = 20
+SEED_COMMENTS = 60
+
+# SCAN steps that read a subquery, Django's QUALIFY wrapper or the FTS index, not a table
+NOT_A_TABLE = re.compile(r'SCAN (\(subquery-\d+\)|qualify\b|\w+ VIRTUAL TABLE)')
+# An ORDER BY with a LIMIT after it, which ends an ordered index walk early
+BOUNDED = re.compile(r'\bORDER BY\b.*\bLIMIT\b', re.DOTALL)
+
+
+class QueryPlanTests(APITestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on every query issued by the models and views and fails if
+    any of them reads a whole table, or walks a whole index without an ORDER BY ... LIMIT
+    bounding it.
+    """
+
+    def setUp(self):
+        """Create a tree to query among a few hundred comments in other discussions, with statistics"""
+        self.discussion = Discussion.objects.create(user="test_user", title="Test Discussion")
+        self.comment = Comment.objects.create(discussion=self.discussion, user="user", content="Top")
+        self.reply = Comment.objects.create(discussion=self.discussion, user="user", content="Reply", parent=self.comment)
+        Comment.objects.create(discussion=self.discussion, user="user", content="Nested", parent=self.reply)
+        # The planner picks differently on near empty tables, and without ANALYZE it has to
+        # guess the selectivity of every index
+        for number in range(SEED_DISCUSSIONS):
+            discussion = self.discussion if number == 0 else Discussion.objects.create(user="seed", title=f"Seed {number}")
+            Comment.bulk_create_tree(discussion.id, [
+                {'user': f"user{index % 7}", 'content': f"Seed comment {index}", 'parent_index': index // 3}
+                if index >= 10 else {'user': f"user{index % 7}", 'content': f"Seed comment {index}"}
+                for index in range(SEED_COMMENTS)
+            ], existing_parents={})
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def bad_steps(self, queries, search_only=False):
+        """
+        Return (sql, plan step) for every step of the captured queries that reads too much.
+
+        A SCAN of a table is a full table scan. A SCAN ... USING [COVERING] INDEX walks an
+        index in order, which is only fine when ORDER BY ... LIMIT stops it early, and
+        not at all with search_only, for lookups that must SEARCH an index.
+        """
+        steps = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                for _, _, _, detail in cursor.fetchall():
+                    if not detail.startswith('SCAN ') or NOT_A_TABLE.match(detail):
+                        continue
+                    if 'INDEX' not in detail or search_only or not BOUNDED.search(sql):
+                        steps.append((sql, detail))
+        return steps
+
+    def assertNoFullScans(self, queries, search_only=False):
+        steps = self.bad_steps(queries, search_only)
+        self.assertEqual(steps, [], "Queries scanning a whole table or index")
+
+    def test_model_queries(self):
+        """Test the flat tree methods and comment creation"""
+        with CaptureQueriesContext(connection) as queries:
+            self.discussion.get_comments_flat()
+            self.discussion.get_comments_flat(max_level=1)
+            self.discussion.get_comments_flat(after=self.comment.tree_path, limit=10)
+            self.comment.get_replies_flat()
+            self.comment.get_replies_flat(max_level=0)
+            self.reply.get_context_flat(2)
+            list(self.comment.replies.all())
+            Comment.objects.create(discussion=self.discussion, user="user", content="Another", parent=self.reply)
+        self.assertNoFullScans(queries, search_only=True)
+
+    def test_view_queries(self):
+        """Test the queries behind each endpoint, the tree and replies reads only SEARCH"""
+        comments_url = reverse('discussion-comments', args=[self.discussion.id])
+        replies_url = reverse('comment-replies', args=[self.discussion.id, self.comment.id])
+        tree_urls = [
+            comments_url,
+            f"{comments_url}?level=1",
+            f"{comments_url}?limit=1",
+            f"{comments_url}?children=1&level=2",
+            f"{comments_url}?sort=newest",
+            f"{comments_url}?sort=most_replies&level=1",
+            f"{replies_url}?sort=newest",
+            replies_url,
+            f"{replies_url}?level=0",
+            reverse('comment-context', args=[self.discussion.id, self.reply.id]),
+            f"{comments_url}?since={encode_since_token(self.discussion, self.comment.id)}",
+            f"{comments_url}?level=1&since={encode_since_token(self.discussion, self.comment.id)}",
+            f"{replies_url}?since={encode_since_token(self.discussion, 0)}",
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            for url in tree_urls:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            # second page of the comment tree
+            self.client.get(self.client.get(f"{comments_url}?limit=1").data['next'])
+        self.assertNoFullScans(queries, search_only=True)
+
+        with CaptureQueriesContext(connection) as queries:
+            for url in [reverse('discussion-list'), reverse('discussion-list') + "?ordering=active",
+                        reverse('discussion-detail', args=[self.discussion.id]), reverse('search') + "?q=reply"]:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            # second page of the discussion list
+            self.client.get(self.client.get(reverse('discussion-list') + "?page_size=1").data['next'])
+            self.client.get(self.client.get(reverse('discussion-list') + "?ordering=active&page_size=1").data['next'])
+            self.client.post(comments_url, {'user': 'user', 'content': 'New', 'parent': self.reply.id}, format='json')
+            self.client.post(
+                reverse('discussion-comments-bulk', args=[self.discussion.id]),
+                [{'user': 'user', 'content': 'Bulk', 'parent': self.reply.id}, {'user': 'user', 'content': 'Bulk', 'parent_index': 0}],
+                format='json'
+            )
+        self.assertNoFullScans(queries)
+
+    def test_cascade_delete_queries(self):
+        """Test deleting a discussion finds its comments and their replies through indexes"""
+        with CaptureQueriesContext(connection) as queries:
+            self.discussion.delete()
+        self.assertNoFullScans(queries)
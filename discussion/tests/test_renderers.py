@@ -0,0 +1,43 @@
+# api/tests/test_renderers.py
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest import mock
+from django.test import SimpleTestCase
+from rest_framework.renderers import JSONRenderer
+from discussion import renderers
+from discussion.renderers import FastJSONRenderer
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """Tests FastJSONRenderer renders the same bytes as DRF's JSONRenderer"""
+
+    data = [
+        {
+            'id': 1,
+            'parent_id': None,
+            'content': 'café \u2028 line \u2029 "quoted" \U0001F600',
+            'created_at': datetime(2025, 1, 2, 3, 4, 5, 678, tzinfo=timezone.utc),
+            'whole_second': datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+            'decimal': Decimal('1.50'),
+            'path': '1,2',
+            'level': 1,
+        },
+        {1: 'int key', 'nested': {'list': [1, 2.5, True, False]}},
+    ]
+
+    def test_matches_json_renderer(self):
+        """Test the orjson output is byte for byte the JSONRenderer output"""
+        self.assertIsNotNone(renderers.orjson, 'orjson is in requirements.txt')
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_falls_back_without_orjson(self):
+        """Test the stdlib encoder is used when orjson isn't installed"""
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_indent_and_unsupported_values(self):
+        """Test indented output and values orjson rejects go through JSONRenderer"""
+        media_type = 'application/json; indent=4'
+        self.assertEqual(FastJSONRenderer().render(self.data, media_type), JSONRenderer().render(self.data, media_type))
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70}), b'{"big":1180591620717411303424}')
+        self.assertEqual(FastJSONRenderer().render(None), b'')
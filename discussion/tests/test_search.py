@@ -0,0 +1,82 @@
+# api/tests/test_search.py
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from discussion.models import Discussion, Comment
+from discussion.search import match_expression, search
+
+
+class SearchTests(APITestCase):
+    """Tests the full text search index and endpoint"""
+
+    def setUp(self):
+        """Create discussions and comments with known words"""
+        self.discussion = Discussion.objects.create(user="test_user", title="Gardening tips for tomatoes")
+        self.other = Discussion.objects.create(user="test_user", title="Baking bread")
+        self.comment = Comment.objects.create(discussion=self.discussion, user="user", content="Water your tomatoes <b>daily</b>")
+        self.reply = Comment.objects.create(discussion=self.discussion, user="user", content="Tomatoes need sun", parent=self.comment)
+        self.url = reverse('search')
+
+    def ids(self, text, **kwargs):
+        return [(result['type'], result['id']) for result in search(text, **kwargs)]
+
+    def test_finds_discussions_and_comments(self):
+        """Test every word must match, stemmed, across both types"""
+        self.assertCountEqual(self.ids('tomato'), [
+            ('discussion', self.discussion.id), ('comment', self.comment.id), ('comment', self.reply.id),
+        ])
+        self.assertEqual(self.ids('tomatoes sun'), [('comment', self.reply.id)])
+        self.assertEqual(self.ids('bread'), [('discussion', self.other.id)])
+        self.assertCountEqual(self.ids('tomatoes', types=('comment',)), [('comment', self.comment.id), ('comment', self.reply.id)])
+        self.assertEqual(self.ids('"); DROP TABLE'), [])
+
+    def test_index_follows_writes(self):
+        """Test the triggers index new, changed, bulk created and deleted rows"""
+        Comment.objects.filter(pk=self.comment.pk).update(content="Prune the roses")
+        self.assertEqual(self.ids('roses'), [('comment', self.comment.id)])
+        self.assertEqual(self.ids('water'), [])
+
+        created, = Comment.bulk_create_tree(self.other.id, [{'user': 'u', 'content': 'Sourdough starter'}], {})
+        self.assertEqual(self.ids('sourdough'), [('comment', created.id)])
+
+        self.comment.delete()  # and its reply, by cascade
+        self.assertEqual(self.ids('sun'), [])
+        self.assertEqual(self.ids('roses'), [])
+
+    def test_match_expression(self):
+        """Test words are quoted so query syntax in the text is taken literally"""
+        self.assertEqual(match_expression('tomato OR "sun*'), '"tomato" "OR" "sun"')
+        self.assertIsNone(match_expression(' -*" '))
+
+    def test_search_endpoint(self):
+        """Test result fields and escaped, highlighted snippets"""
+        response = self.client.get(self.url, {'q': 'daily'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        result, = response.data['results']
+        self.assertEqual(result['type'], 'comment')
+        self.assertEqual((result['id'], result['discussion_id'], result['path']),
+                         (self.comment.id, self.discussion.id, str(self.comment.id)))
+        self.assertIn('&lt;b&gt;<mark>daily</mark>&lt;/b&gt;', result['snippet'])
+        self.assertNotIn('rank', result)
+
+        response = self.client.get(self.url, {'q': 'tomatoes', 'type': 'discussion'})
+        self.assertEqual([r['id'] for r in response.data['results']], [self.discussion.id])
+        self.assertEqual(response.data['results'][0]['title'], self.discussion.title)
+
+    def test_search_pagination(self):
+        """Test following next links returns every result once, in rank order"""
+        everything = [(r['type'], r['id']) for r in self.client.get(self.url, {'q': 'tomatoes'}).data['results']]
+        seen = []
+        response = self.client.get(self.url, {'q': 'tomatoes', 'page_size': 1})
+        while True:
+            seen += [(r['type'], r['id']) for r in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(len(everything), 3)
+        self.assertEqual(seen, everything)
+
+    def test_search_invalid_params(self):
+        for params in [{}, {'q': '  '}, {'q': 'tomatoes', 'type': 'user'}, {'q': 'tomatoes', 'cursor': 'garbage'}]:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
@@ -1,7 +1,8 @@
 # api/tests/test_serializers.py
 from django.test import TestCase
 from discussion.models import Discussion, Comment
-from discussion.serializers import DiscussionSerializer, FlatCommentSerializer
+from discussion.serializers import (DiscussionReadSerializer, DiscussionSerializer, FlatCommentReadSerializer,
+                                    FlatCommentSerializer)
 from rest_framework.exceptions import ValidationError
 
 class DiscussionSerializerTests(TestCase):
@@ -21,9 +22,13 @@ class DiscussionSerializerTests(TestCase):
         data = self.serializer.data
         self.assertCountEqual(
             data.keys(), 
-            ['id', 'user', 'title', 'created_at']
+            ['id', 'user', 'title', 'created_at', 'comment_count', 'participant_count', 'last_activity_at']
         )
     
+    def test_read_serializer_matches(self):
+        """Test the read only serializer gives the same output as the model serializer"""
+        self.assertEqual(DiscussionReadSerializer(self.discussion).data, self.serializer.data)
+
     def test_field_content(self):
         """Test that the serialized values match the model values """
         data = self.serializer.data
@@ -87,9 +92,13 @@ class FlatCommentSerializerTests(TestCase):
         data = self.serializer.data
         self.assertCountEqual(
             data.keys(),
-            ['id', 'discussion', 'user', 'parent', 'content', 'created_at']
+            ['id', 'discussion', 'user', 'parent', 'content', 'created_at', 'reply_count', 'descendant_count']
         )
     
+    def test_read_serializer_matches(self):
+        """Test the read only serializer gives the same output as the model serializer"""
+        self.assertEqual(FlatCommentReadSerializer(self.comment).data, self.serializer.data)
+
     def test_field_content(self):
         """Test that the serialized values match the model values"""
         data = self.serializer.data
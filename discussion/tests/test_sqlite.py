@@ -0,0 +1,43 @@
+# api/tests/test_sqlite.py
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from discussion.sqlite import apply_sqlite_pragmas, sqlite_pragmas
+
+
+class SQLiteProfileTests(TestCase):
+    """Tests the SQLITE_PRAGMAS connection profile"""
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_to_connections(self):
+        """Test the configured PRAGMAs are set on the connection"""
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('cache_size'), -64000)
+        self.assertEqual(self.pragma('temp_store'), 2)  # MEMORY
+
+    def test_pragmas_follow_the_setting(self):
+        """Test the receiver applies whatever SQLITE_PRAGMAS holds, in order"""
+        with self.settings(SQLITE_PRAGMAS={'cache_size': -1000, 'busy_timeout': 100}):
+            apply_sqlite_pragmas(sender=None, connection=connection)
+        self.assertEqual(self.pragma('cache_size'), -1000)
+        self.assertEqual(self.pragma('busy_timeout'), 100)
+        with self.settings(SQLITE_PRAGMAS={'cache_size': -64000, 'busy_timeout': 5000}):
+            apply_sqlite_pragmas(sender=None, connection=connection)
+
+
+class SQLitePragmaValidationTests(SimpleTestCase):
+    """Tests SQLITE_PRAGMAS entries are checked before being put into SQL"""
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'wal; DROP TABLE discussion_comment'})
+    def test_rejects_invalid_values(self):
+        with self.assertRaises(ValueError):
+            sqlite_pragmas()
+
+    @override_settings(SQLITE_PRAGMAS={'wal_checkpoint(TRUNCATE)': 1})
+    def test_rejects_invalid_names(self):
+        with self.assertRaises(ValueError):
+            sqlite_pragmas()
@@ -1,8 +1,13 @@
 # api/tests/test_views.py
+from unittest import mock
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from discussion.models import Discussion, Comment
+from discussion.renderers import stream_json_array
 
 # import json
 
@@ -24,8 +29,74 @@ class DiscussionViewSetTests(APITestCase):
         """Test listing all discussions"""
         response = self.client.get(self.list_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['title'], "Test Discussion")
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['title'], "Test Discussion")
+        self.assertIsNone(response.data['next'])
+
+    def test_list_discussions_pagination(self):
+        """Test following next links returns every discussion newest first, without OFFSET"""
+        created_at = self.discussion.created_at
+        for i in range(6):
+            Discussion.objects.create(user="test_user", title=f"Discussion {i}")
+        # share a timestamp so the id tiebreaker has to do the work
+        Discussion.objects.update(created_at=created_at)
+        expected = list(Discussion.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        seen = []
+        url = f"{self.list_url}?page_size=3"
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertLessEqual(len(response.data['results']), 3)
+                seen.extend(d['id'] for d in response.data['results'])
+                url = response.data['next']
+
+        self.assertEqual(seen, expected)
+        self.assertFalse(any('OFFSET' in q['sql'] for q in queries.captured_queries))
+
+    def test_list_discussions_by_activity(self):
+        """Test ordering=active lists the most recently commented discussions first, with their activity"""
+        newer = Discussion.objects.create(user="test_user", title="Newer")
+        Comment.objects.create(discussion=self.discussion, user="alice", content="First")
+        Comment.objects.create(discussion=self.discussion, user="alice", content="Second")
+        Comment.objects.create(discussion=self.discussion, user="bob", content="Third")
+
+        response = self.client.get(f"{self.list_url}?ordering=active&page_size=1")
+        first = response.data['results'][0]
+        self.assertEqual(first['id'], self.discussion.id)
+        self.assertEqual((first['comment_count'], first['participant_count']), (3, 2))
+        response = self.client.get(response.data['next'])
+        self.assertEqual([d['id'] for d in response.data['results']], [newer.id])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(f"{self.list_url}?ordering=popular")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_discussion_fields(self):
+        """Test ?fields= limits the discussion fields returned and read, id always included"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"{self.list_url}?fields=title,comment_count")
+        self.assertEqual(response.data['results'], [{'id': self.discussion.id, 'title': "Test Discussion", 'comment_count': 0}])
+        self.assertNotIn('"user"', queries.captured_queries[-1]['sql'])
+
+        response = self.client.get(f"{self.detail_url}?fields=last_activity_at")
+        self.assertEqual(set(response.data), {'id', 'last_activity_at'})
+        self.assertEqual(self.client.get(f"{self.detail_url}?fields=password").status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_discussions_page_size_cap(self):
+        """Test the page size can't go over the server limit"""
+        Discussion.objects.bulk_create(
+            [Discussion(user="test_user", title=f"Discussion {i}") for i in range(110)]
+        )
+        response = self.client.get(f"{self.list_url}?page_size=500")
+        self.assertEqual(len(response.data['results']), 100)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_list_discussions_invalid_cursor(self):
+        """Test an invalid cursor is rejected"""
+        response = self.client.get(f"{self.list_url}?cursor=garbage")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
     
     def test_retrieve_discussion(self):
         """Test retrieving a specific discussion"""
@@ -137,6 +208,16 @@ class CommentViewSetTests(APITestCase):
         created_reply = Comment.objects.get(id=response.data['id'])
         self.assertEqual(created_reply.parent, self.comment)
     
+    def test_create_reply_to_other_discussion(self):
+        """Test a reply can't point at a comment of another discussion"""
+        other = Discussion.objects.create(user="test_user", title="Other")
+        elsewhere = Comment.objects.create(discussion=other, user="user", content="Elsewhere")
+        data = {'user': 'new replier', 'content': 'New reply', 'parent': elsewhere.id}
+        response = self.client.post(self.discussion_comments_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('parent', response.data)
+        self.assertEqual(Comment.objects.count(), 3)  # Original + reply + elsewhere
+
     def test_create_comment_invalid_data(self):
         """Test creating a comment with invalid data"""
         data = {
@@ -155,6 +236,310 @@ class CommentViewSetTests(APITestCase):
         self.assertEqual(response.data[0]['id'], self.reply.id)
         self.assertEqual(response.data[0]['content'], "This is a reply")
     
+    def test_comment_context(self):
+        """Test a comment with its ancestors and depth limited replies"""
+        nested = Comment.objects.create(discussion=self.discussion, user="nested user", content="Nested", parent=self.reply)
+        Comment.objects.create(discussion=self.discussion, user="deeper user", content="Deeper", parent=nested)
+        url = reverse('comment-context', args=[self.discussion.id, self.reply.id])
+
+        response = self.client.get(f"{url}?depth=1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['id'] for c in response.data['ancestors']], [self.comment.id])
+        self.assertEqual(response.data['comment']['id'], self.reply.id)
+        self.assertEqual(response.data['comment']['level'], 1)
+        self.assertEqual([c['id'] for c in response.data['replies']], [nested.id])
+        self.assertIn('ETag', response)
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.data['replies']), 2)
+
+        self.assertEqual(self.client.get(f"{url}?depth=-1").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(f"{url}?depth=abc").status_code, status.HTTP_400_BAD_REQUEST)
+        # more levels than SQLite can compare are the same as all of them
+        response = self.client.get(f"{url}?depth=99999999999999999999")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['replies']), 2)
+        other = Discussion.objects.create(user="test_user", title="Other")
+        response = self.client.get(reverse('comment-context', args=[other.id, self.reply.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_sorted_comments(self):
+        """Test ?sort= on both flat tree endpoints"""
+        later = Comment.objects.create(discussion=self.discussion, user="user", content="Later")
+        response = self.client.get(f"{self.discussion_comments_url}?sort=newest")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['id'] for c in response.data], [later.id, self.comment.id, self.reply.id])
+        response = self.client.get(f"{self.comment_replies_url}?sort=most_replies")
+        self.assertEqual([c['id'] for c in response.data], [self.reply.id])
+
+        for query in ['sort=random', 'sort=newest&limit=5', 'sort=newest&children=1', 'sort=most_replies&stream=true']:
+            response = self.client.get(f"{self.discussion_comments_url}?{query}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+
+    def test_collapsed_comments(self):
+        """Test ?children= collapses replies and stub cursors fetch the rest"""
+        more = [Comment.objects.create(discussion=self.discussion, user="user", content="More", parent=self.comment) for _ in range(2)]
+        response = self.client.get(f"{self.discussion_comments_url}?children=1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item.get('id') for item in response.data], [self.comment.id, self.reply.id, None])
+        stub = response.data[2]
+        self.assertEqual((stub['type'], stub['parent'], stub['hidden_count']), ('more', self.comment.id, 2))
+
+        response = self.client.get(f"{self.discussion_comments_url}?children=1&cursor={stub['cursor']}")
+        self.assertEqual([item.get('id') for item in response.data], [more[0].id, None])
+        response = self.client.get(f"{self.discussion_comments_url}?children=1&cursor={response.data[1]['cursor']}")
+        self.assertEqual([item.get('id') for item in response.data], [more[1].id])
+
+        response = self.client.get(f"{self.discussion_comments_url}?children=99999999999999999999")
+        self.assertEqual(len(response.data), 4)
+
+        for query in ['children=0', 'children=x', 'children=1&limit=5', 'children=1&cursor=bad']:
+            response = self.client.get(f"{self.discussion_comments_url}?{query}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+
+    def test_sparse_fields(self):
+        """Test ?fields= returns the tree fields plus the requested ones, without selecting the others"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"{self.discussion_comments_url}?fields=level,path")
+        self.assertEqual(response.data, [
+            {'id': self.comment.id, 'parent_id': None, 'level': 0, 'path': f"{self.comment.id}"},
+            {'id': self.reply.id, 'parent_id': self.comment.id, 'level': 1, 'path': f"{self.comment.id},{self.reply.id}"},
+        ])
+        tree_query = queries.captured_queries[-1]['sql']
+        self.assertIn('"tree_path"', tree_query)
+        self.assertNotIn('"content"', tree_query)
+
+        response = self.client.get(f"{self.comment_replies_url}?fields=content,user")
+        self.assertEqual(response.data, [{
+            'id': self.reply.id, 'user': "reply user", 'parent_id': self.comment.id,
+            'content': "This is a reply", 'level': 0, 'path': f"{self.reply.id}",
+        }])
+
+        response = self.client.get(f"{self.discussion_comments_url}?fields=content,secret")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_sparse_fields_with_sibling_sort(self):
+        """Test a sort on columns ?fields= leaves out still works on the level limited reads"""
+        second = Comment.objects.create(discussion=self.discussion, user="user", content="Second", parent=self.comment)
+        for url, expected in [
+            (f"{self.discussion_comments_url}?sort=newest&level=1&fields=id", [self.comment.id, second.id, self.reply.id]),
+            (f"{self.discussion_comments_url}?sort=most_replies&level=1&fields=content", [self.comment.id, self.reply.id, second.id]),
+            (f"{self.comment_replies_url}?sort=newest&level=1&fields=id", [second.id, self.reply.id]),
+        ]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual([comment['id'] for comment in response.data], expected)
+                self.assertFalse(any(key.startswith('sort_') or key in ('created_at', 'reply_count')
+                                     for comment in response.data for key in comment))
+
+    def test_delta_sync(self):
+        """Test ?since= returns only the comments added after the Sync-Token, with level and path"""
+        response = self.client.get(self.discussion_comments_url)
+        token = response['Sync-Token']
+        response = self.client.get(f"{self.discussion_comments_url}?since={token}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(response.data['sync_token'], token)
+
+        nested = Comment.objects.create(discussion=self.discussion, user="user", content="Nested", parent=self.reply)
+        top = Comment.objects.create(discussion=self.discussion, user="user", content="Top")
+        response = self.client.get(f"{self.discussion_comments_url}?since={token}")
+        self.assertEqual([(c['id'], c['level'], c['path']) for c in response.data['results']], [
+            (nested.id, 2, f"{self.comment.id},{self.reply.id},{nested.id}"),
+            (top.id, 0, str(top.id)),
+        ])
+        response = self.client.get(f"{self.discussion_comments_url}?since={response.data['sync_token']}")
+        self.assertEqual(response.data['results'], [])
+
+        # replies, relative to the comment and limited by level
+        token = self.client.get(f"{self.comment_replies_url}?level=0")['Sync-Token']
+        direct = Comment.objects.create(discussion=self.discussion, user="user", content="Direct", parent=self.comment)
+        Comment.objects.create(discussion=self.discussion, user="user", content="Deeper", parent=self.reply)
+        response = self.client.get(f"{self.comment_replies_url}?level=0&since={token}")
+        self.assertEqual([(c['id'], c['level'], c['path']) for c in response.data['results']], [(direct.id, 0, str(direct.id))])
+
+        for query in ['since=garbage', f'since={token}&limit=5', f'since={token}&sort=newest', f'since={token}&stream=true']:
+            response = self.client.get(f"{self.discussion_comments_url}?{query}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+        other = Discussion.objects.create(user="user", title="Other")
+        response = self.client.get(reverse('discussion-comments', args=[other.id]) + f"?since={token}")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_delta_sync_token_too_old(self):
+        """Test a token from before an edit or delete, or too far behind, is refused with 410"""
+        token = self.client.get(self.discussion_comments_url)['Sync-Token']
+        self.reply.content = "Edited"
+        self.reply.save()
+        response = self.client.get(f"{self.discussion_comments_url}?since={token}")
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+        token = self.client.get(self.discussion_comments_url)['Sync-Token']
+        self.reply.delete()
+        self.assertEqual(self.client.get(f"{self.discussion_comments_url}?since={token}").status_code, status.HTTP_410_GONE)
+
+        token = self.client.get(self.discussion_comments_url)['Sync-Token']
+        with mock.patch('discussion.views.SINCE_MAX_COMMENTS', 1):
+            Comment.objects.create(discussion=self.discussion, user="user", content="One")
+            self.assertEqual(self.client.get(f"{self.discussion_comments_url}?since={token}").status_code, status.HTTP_200_OK)
+            Comment.objects.create(discussion=self.discussion, user="user", content="Two")
+            self.assertEqual(self.client.get(f"{self.discussion_comments_url}?since={token}").status_code, status.HTTP_410_GONE)
+
+    def test_list_comments_invalid_level(self):
+        """Test the level query parameter must be a non-negative integer"""
+        for level in ['abc', '-1']:
+            response = self.client.get(f"{self.discussion_comments_url}?level={level}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_comment_replies_with_level_filter(self):
+        """Test limiting replies by level, relative to the comment"""
+        nested = Comment.objects.create(
+            discussion=self.discussion,
+            user="nested user",
+            content="Reply to the reply",
+            parent=self.reply
+        )
+        response = self.client.get(f"{self.comment_replies_url}?level=0")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['id'] for c in response.data], [self.reply.id])
+
+        response = self.client.get(f"{self.comment_replies_url}?level=1")
+        self.assertEqual([c['id'] for c in response.data], [self.reply.id, nested.id])
+        self.assertEqual(response.data[1]['level'], 1)
+
+        response = self.client.get(f"{self.comment_replies_url}?level=x")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_paginated_comments_match_unpaginated_order(self):
+        """Test walking the next links returns every comment in tree order, without OFFSET"""
+        for i in range(4):
+            top = Comment.objects.create(discussion=self.discussion, user="user", content=f"Top {i}")
+            Comment.objects.create(discussion=self.discussion, user="user", content=f"Reply {i}", parent=top)
+        expected = [c['id'] for c in self.client.get(self.discussion_comments_url).data]
+
+        seen = []
+        url = f"{self.discussion_comments_url}?limit=3"
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertLessEqual(len(response.data['results']), 3)
+                seen.extend(c['id'] for c in response.data['results'])
+                url = response.data['next']
+
+        self.assertEqual(seen, expected)
+        self.assertFalse(any('OFFSET' in q['sql'] for q in queries.captured_queries))
+
+    def test_paginated_comments_with_level_filter(self):
+        """Test pagination combined with the level filter"""
+        response = self.client.get(f"{self.discussion_comments_url}?level=0&limit=5")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['id'] for c in response.data['results']], [self.comment.id])
+        self.assertIsNone(response.data['next'])
+
+    def test_paginated_comments_invalid_params(self):
+        """Test invalid limit and cursor values are rejected"""
+        for query in ['limit=0', 'limit=abc', 'cursor=not-a-cursor']:
+            response = self.client.get(f"{self.discussion_comments_url}?{query}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_streamed_comments_are_byte_identical(self):
+        """Test ?stream=true sends exactly the same body as the regular response"""
+        Comment.objects.create(
+            discussion=self.discussion,
+            user="unicode user",
+            content="caf\u00e9 \u2028 line separator, \"quotes\"",
+            parent=self.reply
+        )
+        for url in [self.discussion_comments_url, self.comment_replies_url]:
+            for query in ['', 'level=0']:
+                regular = self.client.get(f"{url}?{query}")
+                streamed = self.client.get(f"{url}?{query}&stream=true")
+                self.assertFalse(regular.streaming)
+                self.assertTrue(streamed.streaming)
+                self.assertEqual(b''.join(streamed.streaming_content), regular.content)
+                self.assertEqual(streamed['Content-Type'], regular['Content-Type'])
+                self.assertIn('ETag', streamed)
+
+    def test_streamed_comments_in_batches(self):
+        """Test streaming a tree bigger than one batch keeps the array well formed"""
+        for i in range(5):
+            Comment.objects.create(discussion=self.discussion, user="user", content=f"Top {i}")
+        regular = self.client.get(self.discussion_comments_url)
+        renderer = regular.accepted_renderer
+        streamed = stream_json_array(self.discussion.iter_comments_flat(chunk_size=2), renderer, batch_size=2)
+        self.assertEqual(b''.join(streamed.streaming_content), regular.content)
+
+        empty = stream_json_array(iter([]), renderer)
+        self.assertEqual(b''.join(empty.streaming_content), b'[]')
+
+    def test_bulk_create_comments(self):
+        """Test a batch with replies to existing and to in-batch comments builds the right tree"""
+        url = reverse('discussion-comments-bulk', args=[self.discussion.id])
+        data = [
+            {'user': 'a', 'content': 'New top level'},
+            {'user': 'b', 'content': 'Reply to existing', 'parent': self.reply.id},
+            {'user': 'c', 'content': 'Reply to item 0', 'parent_index': 0},
+            {'user': 'd', 'content': 'Reply to item 2', 'parent_index': 2},
+        ]
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 4)
+        ids = [c['id'] for c in response.data]
+        self.assertEqual([c['level'] for c in response.data], [0, 2, 1, 2])
+        self.assertEqual(response.data[1]['path'], f"{self.comment.id},{self.reply.id},{ids[1]}")
+        self.assertEqual(response.data[3]['path'], f"{ids[0]},{ids[2]},{ids[3]}")
+        self.assertEqual(response.data[3]['parent'], ids[2])
+
+        # the tree endpoint agrees with what the bulk endpoint returned
+        tree = {c['id']: c for c in self.client.get(self.discussion_comments_url).data}
+        for created in response.data:
+            self.assertEqual(tree[created['id']]['path'], created['path'])
+            self.assertEqual(tree[created['id']]['level'], created['level'])
+
+    def test_bulk_create_query_count_is_constant(self):
+        """Test the number of queries doesn't grow with the batch size"""
+        url = reverse('discussion-comments-bulk', args=[self.discussion.id])
+        data = [{'user': 'user', 'content': f'Comment {i}', 'parent': self.comment.id} for i in range(200)]
+        data += [{'user': 'user', 'content': f'Reply {i}', 'parent_index': i} for i in range(200)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Comment.objects.count(), 402)
+        # includes the 1000 closure rows, a few INSERTs given SQLite's 999 parameter limit
+        self.assertLess(len(queries), 20)
+
+    def test_bulk_create_invalid_batch(self):
+        """Test invalid items reject the whole batch with per item errors"""
+        other = Discussion.objects.create(user="other", title="Other discussion")
+        other_comment = Comment.objects.create(discussion=other, user="user", content="Elsewhere")
+        url = reverse('discussion-comments-bulk', args=[self.discussion.id])
+        data = [
+            {'user': 'a', 'content': 'Fine'},
+            {'user': 'b', 'content': 'Wrong discussion', 'parent': other_comment.id},
+            {'user': 'c', 'content': 'Forward reference', 'parent_index': 3},
+            {'user': '', 'content': 'No user'},
+            {'user': 'e', 'content': 'Both', 'parent': self.comment.id, 'parent_index': 0},
+        ]
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('user', response.data[3])
+        self.assertEqual(Comment.objects.filter(discussion=self.discussion).count(), 2)
+
+        # errors that need the whole batch are reported once the items themselves are valid
+        response = self.client.post(url, data[:3], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('parent', response.data[1])
+        self.assertIn('parent_index', response.data[2])
+
+        response = self.client.post(url, [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('discussion-comments-bulk', args=[99999]), data[:1], format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Comment.objects.filter(discussion=self.discussion).count(), 2)
+
     def test_nonexistent_discussion(self):
         """Test requesting comments for a nonexistent discussion"""
         nonexistent_url = reverse('discussion-comments', args=[99999])  # This id should not exist
@@ -0,0 +1,136 @@
+# api/tests/test_write_queue.py
+from concurrent.futures import Future
+from unittest import mock
+
+from django.db import IntegrityError, transaction
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase, APITransactionTestCase
+from discussion.db_routers import STICKY_COOKIE
+from discussion.models import Comment, Discussion
+from discussion.write_queue import CommentWriteQueue, WriteTimeout, comment_write_queue, write_queue_enabled
+
+
+class WriteBatchTests(APITestCase):
+    """Tests how CommentWriteQueue writes a batch, without the writer thread"""
+
+    def setUp(self):
+        self.queue = CommentWriteQueue()
+        self.first = Discussion.objects.create(user='alice', title='First')
+        self.second = Discussion.objects.create(user='bob', title='Second')
+        self.parent = Comment.objects.create(discussion=self.first, user='alice', content='Parent')
+
+    def data(self, discussion, content, parent=None):
+        return {'discussion': discussion, 'user': 'carol', 'content': content, 'parent': parent}
+
+    def write(self, items):
+        batch = [(data, Future()) for data in items]
+        self.queue.write(batch)
+        return [future for _data, future in batch]
+
+    def test_batch_over_discussions(self):
+        """Test a batch is written in request order with tree positions and counters"""
+        futures = self.write([
+            self.data(self.first, 'Reply', self.parent),
+            self.data(self.second, 'Top level'),
+            self.data(self.first, 'Another top level'),
+        ])
+        reply, top, other = [future.result(0) for future in futures]
+        self.assertEqual((reply.content, reply.parent_id, reply.depth), ('Reply', self.parent.id, 1))
+        self.assertEqual((top.discussion_id, top.depth), (self.second.id, 0))
+        self.assertEqual(other.tree_path, Comment.objects.get(pk=other.pk).tree_path)
+
+        self.parent.refresh_from_db()
+        self.assertEqual((self.parent.reply_count, self.parent.descendant_count), (1, 1))
+        self.assertEqual(Discussion.objects.get(pk=self.first.pk).comment_count, 3)
+        self.assertEqual(Discussion.objects.get(pk=self.second.pk).comment_count, 1)
+        self.assertEqual((self.queue.batches, self.queue.comments), (1, 3))
+
+    def test_failure_is_isolated(self):
+        """Test a comment that can't be written fails alone and the rest of its batch is written"""
+        good, bad, other = self.write([
+            self.data(self.first, 'Fine'),
+            self.data(self.first, None),
+            self.data(self.second, 'Also fine'),
+        ])
+        self.assertEqual(good.result(0).content, 'Fine')
+        self.assertEqual(other.result(0).content, 'Also fine')
+        self.assertIsInstance(bad.exception(0), IntegrityError)
+        self.assertEqual(Comment.objects.count(), 3)
+
+    def test_cancelled_comments_are_skipped(self):
+        """Test a comment whose request gave up isn't written"""
+        future = Future()
+        future.cancel()
+        self.queue.write([(self.data(self.first, 'Too late'), future)])
+        self.assertFalse(Comment.objects.filter(content='Too late').exists())
+
+    def test_timeout(self):
+        """Test create() raises WriteTimeout and withdraws the comment when the writer doesn't take it"""
+        self.queue.start = lambda: None  # no writer thread
+        with self.assertRaises(WriteTimeout):
+            self.queue.create(self.data(self.first, 'Waiting'), timeout=0.01)
+        data, future = self.queue._queue.get_nowait()
+        self.assertTrue(future.cancelled())
+
+    @override_settings(COMMENT_WRITE_QUEUE=True)
+    def test_not_inside_transactions(self):
+        """Test comments created inside a transaction are written directly"""
+        with transaction.atomic():
+            self.assertFalse(write_queue_enabled())
+        written = comment_write_queue.comments
+        response = self.client.post(
+            reverse('discussion-comments', kwargs={'discussion_id': self.first.id}),
+            {'user': 'carol', 'content': 'Direct'}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(comment_write_queue.comments, written)
+
+
+@override_settings(COMMENT_WRITE_QUEUE=True)
+class WriterThreadTests(APITransactionTestCase):
+    """Tests comments going through the writer thread and committing"""
+
+    def setUp(self):
+        self.discussion = Discussion.objects.create(user='alice', title='Busy')
+
+    def test_create_through_queue(self):
+        """Test the API returns the committed comment written by the writer"""
+        self.addCleanup(comment_write_queue.stop)
+        written = comment_write_queue.comments
+        response = self.client.post(
+            reverse('discussion-comments', kwargs={'discussion_id': self.discussion.id}),
+            {'user': 'bob', 'content': 'Queued'}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Comment.objects.get(pk=response.data['id']).content, 'Queued')
+        self.assertEqual(comment_write_queue.comments, written + 1)
+        self.assertEqual(Discussion.objects.get(pk=self.discussion.pk).comment_count, 1)
+        # the write happened on the writer thread, the client is still pinned to the primary
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+    @override_settings(COMMENT_WRITE_BATCH_DELAY_MS=500)
+    def test_concurrent_comments_share_a_transaction(self):
+        """Test comments queued together are committed in one batch"""
+        queue = CommentWriteQueue()
+        self.addCleanup(queue.stop)
+        data = {'discussion': self.discussion, 'user': 'bob', 'parent': None}
+        futures = [queue.submit({**data, 'content': f'Comment {number}'}) for number in range(5)]
+        comments = [future.result(5) for future in futures]
+        self.assertEqual([comment.content for comment in comments], [f'Comment {number}' for number in range(5)])
+        self.assertEqual((queue.batches, queue.comments), (1, 5))
+        self.assertEqual(Comment.objects.filter(discussion=self.discussion).count(), 5)
+
+    def test_failing_commit_hook_writes_once(self):
+        """Test a hook failing after the COMMIT neither fails the batch nor writes it again"""
+        def fail():
+            raise RuntimeError('hook failed')
+
+        queue = CommentWriteQueue()
+        data = {'discussion': self.discussion, 'user': 'bob', 'parent': None}
+        batch = [({**data, 'content': f'Comment {number}'}, Future()) for number in range(3)]
+        with mock.patch('discussion.signals.publish_comments', side_effect=lambda comments: transaction.on_commit(fail)), \
+                self.assertLogs('discussion.write_queue', 'ERROR'):
+            queue.write(batch)
+        self.assertEqual([future.result(0).content for _data, future in batch], [f'Comment {number}' for number in range(3)])
+        self.assertEqual(Comment.objects.filter(discussion=self.discussion).count(), 3)
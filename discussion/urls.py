@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DiscussionViewSet, CommentViewSet
+from .views import DiscussionViewSet, CommentViewSet, cache_stats, search_view
 
 router = DefaultRouter()
 router.register(r'discussions', DiscussionViewSet)
@@ -13,5 +13,13 @@ urlpatterns = [
      name='discussion-comments'),
     path('discussions/<int:discussion_id>/comments/<int:comment_id>/replies/', 
      CommentViewSet.as_view(({'get': 'replies'})), 
-     name='comment-replies')
+     name='comment-replies'),
+    path('discussions/<int:discussion_id>/comments/<int:comment_id>/context/',
+     CommentViewSet.as_view({'get': 'context'}),
+     name='comment-context'),
+    path('discussions/<int:discussion_id>/comments/bulk/',
+     CommentViewSet.as_view({'post': 'bulk_create'}),
+     name='discussion-comments-bulk'),
+    path('stats/cache/', cache_stats, name='cache-stats'),
+    path('search/', search_view, name='search'),
 ]
\ No newline at end of file
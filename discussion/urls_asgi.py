@@ -0,0 +1,22 @@
+from django.urls import path, re_path
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+# Same URLs and names as discussion/urls.py, with the read endpoints served by native
+# async views. Used by config/asgi.py, anything not matched here falls through to the
+# regular DRF routes (API root, format suffixes, ...).
+urlpatterns = [
+    path('discussions/', async_views.discussion_list, name='discussion-list'),
+    re_path(r'^discussions/(?P<pk>[^/.]+)/$', async_views.discussion_detail, name='discussion-detail'),
+    path('discussions/<int:discussion_id>/comments/', 
+     async_views.discussion_comments, 
+     name='discussion-comments'),
+    path('discussions/<int:discussion_id>/comments/<int:comment_id>/replies/', 
+     async_views.comment_replies, 
+     name='comment-replies'),
+    # ASGI only, a stream held open would tie up a WSGI worker thread
+    path('discussions/<int:discussion_id>/comments/stream/',
+     async_views.comment_stream,
+     name='comment-stream'),
+    *sync_urlpatterns,
+]
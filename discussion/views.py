@@ -1,12 +1,293 @@
 # Create your views here.
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+
+from django.db import transaction
 from rest_framework import viewsets, mixins
-from .models import Discussion, Comment
-from rest_framework.decorators import action
+from .models import FLAT_COMMENT_FIELDS, SIBLING_ORDERINGS, Discussion, Comment, decode_tree_path
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from .serializers import DiscussionSerializer, FlatCommentSerializer
+from .cache import comment_tree_cache
+from .db_routers import record_write
+from .conditional import discussion_validators, not_modified_response, set_validators
+from .renderers import stream_json_array
+from .serializers import (BulkCommentSerializer, DiscussionReadSerializer, DiscussionSerializer,
+                          FlatCommentReadSerializer, FlatCommentSerializer)
+from .signals import comments_bulk_created
+from .pagination import CommentTreePagination, DiscussionPagination, SearchPagination
+from .search import SEARCH_TYPES, search, search_available
+from .write_queue import WriteTimeout, comment_write_queue, write_queue_enabled
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
+level_parameter = openapi.Parameter(
+    'level',
+    openapi.IN_QUERY,
+    description="Filter comments by nesting level (0 for top-level only)",
+    type=openapi.TYPE_INTEGER,
+    required=False
+)
+
+
+sort_parameter = openapi.Parameter(
+    'sort',
+    openapi.IN_QUERY,
+    description="Order of sibling comments, the list stays a depth-first tree",
+    type=openapi.TYPE_STRING,
+    enum=list(SIBLING_ORDERINGS),
+    default='oldest',
+    required=False
+)
+
+
+stream_parameter = openapi.Parameter(
+    'stream',
+    openapi.IN_QUERY,
+    description="Stream the tree from the database in batches (same JSON body, constant memory)",
+    type=openapi.TYPE_BOOLEAN,
+    required=False
+)
+
+
+since_parameter = openapi.Parameter(
+    'since',
+    openapi.IN_QUERY,
+    description="Sync-Token of an earlier response, returns only the comments added since (410 when too old)",
+    type=openapi.TYPE_STRING,
+    required=False
+)
+
+
+ordering_parameter = openapi.Parameter(
+    'ordering',
+    openapi.IN_QUERY,
+    description="Order of the discussions: newest created first, or most recently commented first",
+    type=openapi.TYPE_STRING,
+    enum=list(DiscussionPagination.orderings),
+    default='newest',
+    required=False
+)
+
+
+fields_parameter = openapi.Parameter(
+    'fields',
+    openapi.IN_QUERY,
+    description="Comma separated fields to return, only those are read from the database (id is always returned)",
+    type=openapi.TYPE_STRING,
+    required=False
+)
+
+
+# Fields of the flat comments that ?fields= can pick, the tree fields id, parent_id,
+# level and path are returned in any case
+COMMENT_FIELDS = (*FLAT_COMMENT_FIELDS, 'level', 'path')
+
+# Fields of a discussion that ?fields= can pick, id is returned in any case
+DISCUSSION_FIELDS = tuple(DiscussionSerializer.Meta.fields)
+
+
+def parse_fields(request, available):
+    """
+    Read the optional 'fields' query parameter, a comma separated list of field names.
+
+    Returns:
+        tuple: (fields, error_response). fields is None when the parameter is missing,
+        otherwise the requested names in the order of `available`, so requests asking
+        for the same fields share cache entries. error_response is a 400 Response for
+        names not in `available`.
+    """
+    fields_param = request.query_params.get('fields', None)
+    if fields_param is None:
+        return None, None
+    names = {name.strip() for name in fields_param.split(',') if name.strip()}
+    unknown = names.difference(available)
+    if unknown:
+        return None, Response({"error": f"Unknown fields {', '.join(sorted(unknown))}, fields must be among {', '.join(available)}"}, status=400)
+    return tuple(name for name in available if name in names), None
+
+
+def wants_stream(request):
+    """Whether the client asked for a streamed JSON body with ?stream=true."""
+    return (request.query_params.get('stream', '').lower() in ('1', 'true')
+            and request.accepted_renderer.format == 'json')
+
+
+# Upper bound of the level like query parameters (level, depth, children)
+MAX_LEVEL = 1_000_000
+
+
+def parse_level(request, name='level', default=None):
+    """
+    Read the optional 'level' query parameter, or another non-negative integer one.
+
+    Values above MAX_LEVEL are clamped to it: no thread is that deep, so the result is
+    the same, and the value stays within what SQLite's integers can compare.
+
+    Returns:
+        tuple: (max_level, error_response). max_level is default when the parameter is
+        missing, error_response is a 400 Response when it isn't a non-negative integer.
+    """
+    level_param = request.query_params.get(name, None)
+    if level_param is None:
+        return default, None
+
+    try:
+        max_level = int(level_param)
+    except ValueError:
+        return None, Response({"error": f"{name.capitalize()} must be a valid integer"}, status=400)
+    if max_level < 0:
+        return None, Response({"error": f"{name.capitalize()} must be a non-negative integer"}, status=400)
+    return min(max_level, MAX_LEVEL), None
+
+
+def parse_ordering(request):
+    """
+    Check the optional 'ordering' query parameter of the discussion list.
+
+    Returns:
+        Response: A 400 Response for an unknown ordering, None when it is fine.
+    """
+    ordering = request.query_params.get('ordering', 'newest')
+    if ordering not in DiscussionPagination.orderings:
+        return Response({"error": f"Ordering must be one of {', '.join(DiscussionPagination.orderings)}"}, status=400)
+    return None
+
+
+def parse_sort(request):
+    """
+    Read the optional 'sort' query parameter, 'oldest' when missing.
+
+    Returns:
+        tuple: (sort, error_response). error_response is a 400 Response for an unknown
+        mode, or when a mode other than 'oldest' is combined with parameters that walk
+        the tree in tree_path order (pagination, collapsing, streaming).
+    """
+    sort = request.query_params.get('sort', 'oldest')
+    if sort not in SIBLING_ORDERINGS:
+        return None, Response({"error": f"Sort must be one of {', '.join(SIBLING_ORDERINGS)}"}, status=400)
+    if sort != 'oldest' and (wants_stream(request) or
+                             any(param in request.query_params for param in ('limit', 'cursor', 'children'))):
+        return None, Response({"error": f"Sort {sort} can't be combined with limit, cursor, children or stream"}, status=400)
+    return sort, None
+
+
+def parse_children(request, paginator):
+    """
+    Read the 'children' query parameter of a collapsed comment list, and its cursor.
+
+    Returns:
+        tuple: (children, after, error_response). after is the tree_path in the cursor,
+        None without one. error_response is a 400 Response for invalid parameters.
+    """
+    children, error = parse_level(request, 'children')
+    if error:
+        return None, None, error
+    if children == 0:
+        return None, None, Response({"error": "Children must be a positive integer"}, status=400)
+    if paginator.limit_query_param in request.query_params or wants_stream(request):
+        return None, None, Response({"error": "Children can't be combined with limit or stream"}, status=400)
+    try:
+        after = paginator.decode_cursor(request)
+    except ValueError as e:
+        return None, None, Response({"error": str(e)}, status=400)
+    return children, after, None
+
+
+def with_stub_cursors(comments, paginator):
+    """Replace the tree_path of every 'more' stub with an opaque cursor, like the paginator's."""
+    for item in comments:
+        if item.get('type') == 'more':
+            item['cursor'] = paginator.encode_cursor(item.pop('after'))
+    return comments
+
+
+# Levels of replies returned by the context endpoint without ?depth=
+CONTEXT_DEFAULT_DEPTH = 3
+
+# Most comments a ?since= delta returns, a client further behind gets a 410 and refetches
+SINCE_MAX_COMMENTS = 1000
+
+
+def encode_since_token(discussion, last_id):
+    """Opaque delta sync token: the discussion, the newest comment sent and the discussion's rewrite_count."""
+    return urlsafe_b64encode(json.dumps([discussion.id, last_id, discussion.rewrite_count]).encode()).decode('ascii')
+
+
+def decode_since_token(token):
+    """Inverse of encode_since_token, raises ValueError for anything it didn't produce."""
+    try:
+        values = json.loads(urlsafe_b64decode(token.encode('ascii')))
+    except (Base64Error, UnicodeError, ValueError):
+        raise ValueError("Invalid since token")
+    if not (isinstance(values, list) and len(values) == 3
+            and all(type(value) is int and value >= 0 for value in values)):
+        raise ValueError("Invalid since token")
+    return values
+
+
+def parse_since(request, discussion):
+    """
+    Read the optional 'since' query parameter of a delta request.
+
+    Returns:
+        tuple: (last_id, error_response). last_id is the newest comment the client has,
+        None when the parameter is missing. error_response is a 400 Response for a token
+        that is malformed, from another discussion or combined with parameters deltas
+        don't support, or a 410 Response when comments were edited or deleted since the
+        token was issued, which a delta can't express.
+    """
+    token = request.query_params.get('since', None)
+    if token is None:
+        return None, None
+    if (wants_stream(request) or request.query_params.get('sort', 'oldest') != 'oldest'
+            or any(param in request.query_params for param in ('limit', 'cursor', 'children'))):
+        return None, Response({"error": "Since can't be combined with limit, cursor, children, sort or stream"}, status=400)
+    try:
+        discussion_id, last_id, rewrite_count = decode_since_token(token)
+    except ValueError as e:
+        return None, Response({"error": str(e)}, status=400)
+    if discussion_id != discussion.id:
+        return None, Response({"error": "Invalid since token"}, status=400)
+    if rewrite_count != discussion.rewrite_count:
+        return None, Response({"error": "Comments were edited or deleted since the token, fetch the comments again"}, status=410)
+    return last_id, None
+
+
+def delta_response(discussion, last_id, comments):
+    """
+    Response of a ?since= request, from up to SINCE_MAX_COMMENTS + 1 new comments in id order.
+
+    The body has the new comments in 'results' and the token for the next request in
+    'sync_token'. More than SINCE_MAX_COMMENTS new comments is a 410, refetching the
+    whole list is cheaper than catching up.
+    """
+    if len(comments) > SINCE_MAX_COMMENTS:
+        return Response({"error": "Too many comments were added since the token, fetch the comments again"}, status=410)
+    last_id = comments[-1]['id'] if comments else last_id
+    return Response({'results': comments, 'sync_token': encode_since_token(discussion, last_id)})
+
+
+def with_sync_token(response, discussion, comments):
+    """
+    Add the Sync-Token header to a response with a complete comment list.
+
+    The newest comment in the list is enough: ids are assigned in commit order, so the
+    list holds every comment of its scope up to that id and a ?since= request with the
+    token returns the rest. The discussion (and its rewrite_count) was read before the
+    list, so an edit or delete racing the read makes the token too old, never wrong.
+    """
+    response['Sync-Token'] = encode_since_token(discussion, max((comment['id'] for comment in comments), default=0))
+    return response
+
+
+def discussion_columns(queryset, fields):
+    """Limit a discussion queryset to the columns of `fields`, plus those the list and detail read for themselves."""
+    # changed_at for the ETag, created_at and last_activity_at for the list's cursors
+    return queryset.only(*fields, 'changed_at', 'created_at', 'last_activity_at')
+
+
 class DiscussionViewSet(mixins.CreateModelMixin,
                          mixins.RetrieveModelMixin,
                          mixins.ListModelMixin,
@@ -18,6 +299,62 @@ class DiscussionViewSet(mixins.CreateModelMixin,
     """
     queryset = Discussion.objects.all()
     serializer_class = DiscussionSerializer
+    pagination_class = DiscussionPagination
+    # ?fields= of list and retrieve, None for every field
+    fields = None
+
+    def get_serializer_class(self):
+        # Reads skip the per field ModelSerializer machinery
+        if self.action in ('list', 'retrieve'):
+            return DiscussionReadSerializer
+        return DiscussionSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.fields is not None:
+            return discussion_columns(queryset, self.fields)
+        return queryset
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'fields': self.fields}
+
+    @swagger_auto_schema(manual_parameters=[ordering_parameter, fields_parameter])
+    def list(self, request, *args, **kwargs):
+        """
+        List discussions with their activity: comment and participant counts and last activity.
+
+        The counts are stored on each discussion, so a page is a single indexed query.
+        'ordering=active' lists the most recently commented discussions first, 'fields'
+        limits the fields returned (and read).
+        """
+        error = parse_ordering(request)
+        if error:
+            return error
+        self.fields, error = parse_fields(request, DISCUSSION_FIELDS)
+        if error:
+            return error
+        return super().list(request, *args, **kwargs)
+
+    @swagger_auto_schema(manual_parameters=[fields_parameter])
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieve a discussion.
+
+        Responses carry ETag and Last-Modified headers. Sending them back in
+        If-None-Match / If-Modified-Since returns 304 Not Modified when nothing changed.
+        'fields' limits the fields returned (and read).
+        """
+        self.fields, error = parse_fields(request, DISCUSSION_FIELDS)
+        if error:
+            return error
+        discussion = self.get_object()
+        etag, last_modified = discussion_validators(request, discussion)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
+
+        serializer = self.get_serializer(discussion)
+        return set_validators(Response(serializer.data), etag, last_modified)
 
 
 class CommentViewSet(mixins.CreateModelMixin,
@@ -31,6 +368,7 @@ class CommentViewSet(mixins.CreateModelMixin,
     queryset = Comment.objects.all()
     serializer_class = FlatCommentSerializer
 
+    @swagger_auto_schema(manual_parameters=[level_parameter, sort_parameter, stream_parameter, since_parameter, fields_parameter])
     @action(detail=True, methods=['get'])
     def replies(self, request, discussion_id=None, comment_id=None):
         """
@@ -38,22 +376,134 @@ class CommentViewSet(mixins.CreateModelMixin,
         
         Returns a flat list of all descendant comments (replies, replies to replies, etc.)
         with their level and path information.
+
+        Responses carry ETag and Last-Modified headers, a matching If-None-Match or
+        If-Modified-Since returns 304 Not Modified without reading the tree.
+
+        The whole list carries a Sync-Token header. Passing it back as 'since' (with the
+        same level) returns only the replies added since, see discussion_comments.
         
         Parameters:
         - discussion_id: ID of the discussion the comment belongs to
         - comment_id: ID of the comment to get replies for
+        - level (query): Optional. If provided, only returns replies up to this nesting level.
+          Level 0 returns only direct replies, level 1 includes replies to those, etc.
+        - sort (query): Optional. Order of sibling replies: oldest (default), newest or
+          most_replies. The list stays depth-first.
+        - stream (query): Optional. 'true' streams the replies from the database in batches,
+          the JSON body is the same.
+        - since (query): Optional. Sync token of an earlier response, returns
+          {"results": [new replies], "sync_token": "..."}.
+        - fields (query): Optional. Comma separated fields of each reply to return, see
+          discussion_comments.
         
         Returns:
         - 200 OK: List of reply comments
+        - 304 Not Modified: If the client's copy is still current
+        - 400 Bad Request: If level is not a non-negative integer, or sort, since or fields is invalid
         - 404 Commentn not found: If the comment doesn't exist or doesn't belong to the specified discussion
+        - 410 Gone: If the since token is too old to catch up from, fetch the replies again
         """
+        max_level, error = parse_level(request)
+        if error:
+            return error
+        sort, error = parse_sort(request)
+        if error:
+            return error
+        fields, error = parse_fields(request, COMMENT_FIELDS)
+        if error:
+            return error
+
         try:
-            comment = Comment.objects.get(pk=comment_id, discussion_id=discussion_id)
+            comment = Comment.objects.select_related('discussion').get(pk=comment_id, discussion_id=discussion_id)
         except Comment.DoesNotExist:
             return Response({"error": "Comment not found"}, status=404)
+        since, error = parse_since(request, comment.discussion)
+        if error:
+            return error
+
+        etag, last_modified = discussion_validators(request, comment.discussion)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
+
+        if since is not None:
+            replies = comment.get_replies_since(since, max_level=max_level, limit=SINCE_MAX_COMMENTS + 1, fields=fields)
+            return set_validators(delta_response(comment.discussion, since, replies), etag, last_modified)
+
+        if wants_stream(request):
+            response = stream_json_array(comment.iter_replies_flat(max_level=max_level, fields=fields), request.accepted_renderer)
+            return set_validators(response, etag, last_modified)
             
-        descendants = comment.get_replies_flat()
-        return Response(descendants)
+        descendants = comment_tree_cache.get_or_build(
+            comment.discussion_id,
+            ('replies', comment.id, max_level, sort, fields),
+            lambda: comment.get_replies_flat(max_level=max_level, sort=sort, fields=fields)
+        )
+        response = with_sync_token(Response(descendants), comment.discussion, descendants)
+        return set_validators(response, etag, last_modified)
+
+    @swagger_auto_schema(
+        manual_parameters=[openapi.Parameter(
+            'depth',
+            openapi.IN_QUERY,
+            description=f"Levels of replies to include (0 for none, default {CONTEXT_DEFAULT_DEPTH})",
+            type=openapi.TYPE_INTEGER,
+            required=False
+        )],
+        responses={200: openapi.Response(
+            'The comment with its ancestors and replies',
+            openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+                'ancestors': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                'comment': openapi.Schema(type=openapi.TYPE_OBJECT),
+                'replies': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+            })
+        )}
+    )
+    def context(self, request, discussion_id=None, comment_id=None):
+        """
+        Show a comment in context, e.g. for a permalink to a deeply nested comment.
+
+        Returns the chain of ancestors from the top level comment down, the comment itself
+        and its replies up to 'depth' levels below it, all as flat comments with level and
+        path relative to the discussion (like the discussion's comment list). Built from the
+        comment closure table with two indexed queries, whatever the depth of the comment.
+
+        Responses carry ETag and Last-Modified headers, a matching If-None-Match or
+        If-Modified-Since returns 304 Not Modified without reading the tree.
+
+        Parameters:
+        - discussion_id: ID of the discussion the comment belongs to
+        - comment_id: ID of the comment
+        - depth (query): Optional. Levels of replies to include, 0 for none, 1 for direct
+          replies only. Defaults to 3.
+
+        Returns:
+        - 200 OK: {"ancestors": [...], "comment": {...}, "replies": [...]}
+        - 304 Not Modified: If the client's copy is still current
+        - 400 Bad Request: If depth is not a non-negative integer
+        - 404 Comment not found: If the comment doesn't exist or doesn't belong to the specified discussion
+        """
+        depth, error = parse_level(request, 'depth', default=CONTEXT_DEFAULT_DEPTH)
+        if error:
+            return error
+
+        try:
+            comment = Comment.objects.select_related('discussion').get(pk=comment_id, discussion_id=discussion_id)
+        except Comment.DoesNotExist:
+            return Response({"error": "Comment not found"}, status=404)
+
+        etag, last_modified = discussion_validators(request, comment.discussion)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
+
+        context = comment_tree_cache.get_or_build(
+            comment.discussion_id,
+            ('context', comment.id, depth),
+            lambda: comment.get_context_flat(depth)
+        )
+        return set_validators(Response(context), etag, last_modified)
 
     def create(self, request, discussion_id=None, *args, **kwargs):
         """
@@ -70,9 +520,15 @@ class CommentViewSet(mixins.CreateModelMixin,
         - content: Text content of the comment
         - parent: (Optional) ID of the parent comment if this is a reply
         
+        With COMMENT_WRITE_QUEUE on, the comment is written by the write queue together
+        with those of concurrent requests, the response is still only sent once it is
+        committed.
+
         Returns:
         - 201 Created: Successfully created comment
         - 400 Bad Request: Invalid request data
+        - 503 Service Unavailable: The write queue didn't get to the comment within
+          COMMENT_WRITE_TIMEOUT, it wasn't created
         """
         # Make a mutable copy of request.data
         data = request.data.copy()
@@ -83,20 +539,113 @@ class CommentViewSet(mixins.CreateModelMixin,
         # Create a serializer with the modified data
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
-        
-        headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=201, headers=headers)
+        if write_queue_enabled():
+            try:
+                serializer.instance = comment_write_queue.create(serializer.validated_data)
+            except WriteTimeout:
+                return Response({"error": "Too many comments are being written, try again"}, status=503)
+            # written on the writer thread, which the router couldn't tie to this request
+            record_write()
+        else:
+            self.perform_create(serializer)
+
+        data = FlatCommentReadSerializer(serializer.instance).data
+        headers = self.get_success_headers(data)
+        return Response(data, status=201, headers=headers)
+
+    @swagger_auto_schema(
+        request_body=BulkCommentSerializer(many=True),
+        responses={201: openapi.Response(
+            'Created comments, in request order',
+            openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    'id': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'parent': openapi.Schema(type=openapi.TYPE_INTEGER, x_nullable=True),
+                    'level': openapi.Schema(type=openapi.TYPE_INTEGER),
+                    'path': openapi.Schema(type=openapi.TYPE_STRING),
+                }
+            ))
+        )}
+    )
+    def bulk_create(self, request, discussion_id=None):
+        """
+        Create many comments for a discussion in one request and one transaction.
+
+        The body is an array of comments. Each one is top level, a reply to an existing
+        comment of the discussion ('parent'), or a reply to a comment earlier in the same
+        array ('parent_index', its position in the array). The whole batch is validated
+        with a couple of queries and inserted with bulk INSERTs, either every comment is
+        created or none is.
+
+        Parameters:
+        - discussion_id: ID of the discussion to add the comments to
+
+        Request Body: array of
+        - user: name of the author of the comment
+        - content: Text content of the comment
+        - parent: (Optional) ID of an existing comment this replies to
+        - parent_index: (Optional) Position in the array of an earlier comment this replies to
+
+        Returns:
+        - 201 Created: id, parent, level and path of every created comment, in request order
+        - 400 Bad Request: Invalid request data, with one error object per comment
+        - 404 Discussion not Found: If the discussion doesn't exist
+        """
+        if not Discussion.objects.filter(id=discussion_id).exists():
+            return Response({"error": "Discussion not found"}, status=404)
+
+        serializer = BulkCommentSerializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=BulkCommentSerializer.MAX_BATCH_SIZE,
+            context={'discussion_id': discussion_id}
+        )
+        with transaction.atomic():
+            # validated inside the transaction so the parents can't go away before the insert
+            serializer.is_valid(raise_exception=True)
+            comments = Comment.bulk_create_tree(discussion_id, serializer.validated_data, serializer.existing_parents)
+        comments_bulk_created(discussion_id, comments)
+
+        return Response([
+            {
+                'id': comment.id,
+                'parent': comment.parent_id,
+                'level': comment.depth,
+                'path': decode_tree_path(comment.tree_path),
+            }
+            for comment in comments
+        ], status=201)
 
     @swagger_auto_schema(
         manual_parameters=[
+            level_parameter,
+            sort_parameter,
+            stream_parameter,
+            openapi.Parameter(
+                'limit',
+                openapi.IN_QUERY,
+                description="Page size (enables pagination, capped by the server)",
+                type=openapi.TYPE_INTEGER,
+                required=False
+            ),
             openapi.Parameter(
-                'level', 
-                openapi.IN_QUERY, 
-                description="Filter comments by nesting level (0 for top-level only)", 
+                'cursor',
+                openapi.IN_QUERY,
+                description="Opaque cursor from the 'next' link of the previous page, or from a 'more' stub",
+                type=openapi.TYPE_STRING,
+                required=False
+            ),
+            openapi.Parameter(
+                'children',
+                openapi.IN_QUERY,
+                description="Collapse the tree to this many replies per comment, with 'more' stubs for the rest",
                 type=openapi.TYPE_INTEGER,
                 required=False
-            )
+            ),
+            since_parameter,
+            fields_parameter,
         ]
     )
     def discussion_comments(self, request, discussion_id=None):
@@ -108,15 +657,57 @@ class CommentViewSet(mixins.CreateModelMixin,
 
         The 'path' variable represents the hierarchical ancestry of each comment,
         stored as a comma separated string of comment Ids (for example: '1,3,9').
+
+        Passing 'limit' and/or 'cursor' paginates the tree. The response is then an object
+        with the page of comments in 'results' and a 'next' link (null on the last page),
+        in the same order as the unpaginated list.
+
+        Passing 'children' collapses the tree: only the first N replies of each comment (and
+        the first N top level comments) are returned. After the last shown reply of a
+        comment with more, a stub {"type": "more", "parent", "level", "hidden_count",
+        "cursor"} takes the place of the rest. Requesting the same URL with that cursor
+        returns the following replies of that comment, collapsed the same way.
+
+        Responses carry ETag and Last-Modified headers, a matching If-None-Match or
+        If-Modified-Since returns 304 Not Modified without reading the tree.
+
+        The whole list (not pages, collapsed or streamed responses) carries a Sync-Token
+        header. Passing it back as 'since', with the same level, returns only the comments
+        added since: {"results": [...], "sync_token": "..."}, the new comments with level
+        and path in the order they were created, and the token for the next request. When
+        comments were edited or deleted since the token, or more than 1000 were added, the
+        delta would be wrong or not worth it and the response is 410 Gone: fetch the whole
+        list again.
+
+        Passing 'fields' returns only those fields of each comment, e.g. 'fields=level,path'
+        for a skeleton of the tree. The tree fields id, parent_id, level and path are always
+        returned. Only the columns behind the requested fields are selected, so leaving out
+        'content' saves reading it as well as sending it.
         
         Parameters:
         - discussion_id: ID of the discussion to get comments for
         - level (query): Optional. If provided, only returns comments up to this nesting level.
           Level 0 returns only top-level comments, level 1 includes their direct replies, etc.
+        - sort (query): Optional. Order of sibling comments: oldest (default), newest or
+          most_replies. The list stays depth-first. Other modes than oldest can't be
+          combined with limit, cursor, children or stream.
+        - limit (query): Optional. Number of comments per page.
+        - cursor (query): Optional. Cursor taken from a previous page's 'next' link, or with
+          'children', from a stub.
+        - children (query): Optional. Replies shown per comment, a positive integer. Can't be
+          combined with 'limit' or 'stream'.
+        - stream (query): Optional. 'true' streams the whole tree from the database in batches
+          instead of building it in memory, the JSON body is the same. Ignored for paginated requests.
+        - since (query): Optional. Sync-Token of an earlier response. Can only be combined
+          with 'level' and 'fields'.
+        - fields (query): Optional. Comma separated fields of each comment to return.
         
         Returns:
         - 200 OK: List of comments
+        - 304 Not Modified: If the client's copy is still current
+        - 400 Bad Request: If level, limit, cursor, children, sort, since or fields are invalid
         - 404 Discussion not Found: If the discussion doesn't exist
+        - 410 Gone: If the since token is too old to catch up from
         """
 
         # Check if discussion exists
@@ -124,17 +715,136 @@ class CommentViewSet(mixins.CreateModelMixin,
         if not discussion:
             return Response({"error": "Discussion not found"}, status=404)
         
-            # Check if level parameter is provided
-        level_param = request.query_params.get('level', None)
-        max_level = None
-        
-        if level_param is not None:
+        # Check if level parameter is provided
+        max_level, error = parse_level(request)
+        if error:
+            return error
+        sort, error = parse_sort(request)
+        if error:
+            return error
+        since, error = parse_since(request, discussion)
+        if error:
+            return error
+        fields, error = parse_fields(request, COMMENT_FIELDS)
+        if error:
+            return error
+
+        etag, last_modified = discussion_validators(request, discussion)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified:
+            return not_modified
+
+        if since is not None:
+            comments = discussion.get_comments_since(since, max_level=max_level, limit=SINCE_MAX_COMMENTS + 1, fields=fields)
+            return set_validators(delta_response(discussion, since, comments), etag, last_modified)
+
+        paginator = CommentTreePagination()
+        if 'children' in request.query_params:
+            return self.collapsed_comments(request, discussion, max_level, fields, paginator, etag, last_modified)
+
+        if paginator.is_requested(request):
             try:
-                max_level = int(level_param)
-                if max_level < 0:
-                    return Response({"error": "Level must be a non-negative integer"}, status=400)
-            except ValueError:
-                return Response({"error": "Level must be a valid integer"}, status=400)
-            
-        flat_comments = discussion.get_comments_flat(max_level=max_level)
-        return Response(flat_comments)
\ No newline at end of file
+                page = paginator.paginate_tree(
+                    lambda after, limit: comment_tree_cache.get_or_build(
+                        discussion.id,
+                        ('comments', max_level, after, limit, fields),
+                        lambda: discussion.get_comments_flat(max_level=max_level, after=after, limit=limit, fields=fields)
+                    ),
+                    request
+                )
+            except ValueError as e:
+                return Response({"error": str(e)}, status=400)
+            return set_validators(paginator.get_paginated_response(page), etag, last_modified)
+
+        if wants_stream(request):
+            # big trees skip the cache, holding them in memory is what streaming avoids
+            response = stream_json_array(discussion.iter_comments_flat(max_level=max_level, fields=fields), request.accepted_renderer)
+            return set_validators(response, etag, last_modified)
+
+        flat_comments = comment_tree_cache.get_or_build(
+            discussion.id,
+            ('comments', max_level, sort, fields),
+            lambda: discussion.get_comments_flat(max_level=max_level, sort=sort, fields=fields)
+        )
+        response = with_sync_token(Response(flat_comments), discussion, flat_comments)
+        return set_validators(response, etag, last_modified)
+
+    def collapsed_comments(self, request, discussion, max_level, fields, paginator, etag, last_modified):
+        """The ?children= variant of discussion_comments."""
+        children, after, error = parse_children(request, paginator)
+        if error:
+            return error
+        comments = comment_tree_cache.get_or_build(
+            discussion.id,
+            ('collapsed', children, max_level, after, fields),
+            lambda: with_stub_cursors(discussion.get_comments_collapsed(children, max_level=max_level, after=after, fields=fields), paginator)
+        )
+        return set_validators(Response(comments), etag, last_modified)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """
+    Hit, miss and eviction counters of the comment tree cache, for monitoring.
+
+    Counters are per process. Evictions are null when the configured backend doesn't report them.
+
+    Returns:
+    - 200 OK: {"hits": ..., "misses": ..., "evictions": ...}
+    - 403 Forbidden: If the user isn't staff
+    """
+    return Response(comment_tree_cache.stats())
+
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('q', openapi.IN_QUERY, description="Words to search for, all must match",
+                          type=openapi.TYPE_STRING, required=True),
+        openapi.Parameter('type', openapi.IN_QUERY, description="Only return this type of result",
+                          type=openapi.TYPE_STRING, enum=list(SEARCH_TYPES), required=False),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Results per page (at most 50)",
+                          type=openapi.TYPE_INTEGER, required=False),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from the 'next' link of the previous page",
+                          type=openapi.TYPE_STRING, required=False),
+    ]
+)
+@api_view(['GET'])
+def search_view(request):
+    """
+    Full text search over discussion titles and comment content.
+
+    Returns discussions and comments containing every word of 'q' (words are stemmed, so
+    'replies' also finds 'reply'), best matches first, in pages of {"next", "results"}.
+    Every result has a 'type' ('discussion' or 'comment'), the fields of the discussion or
+    comment, and a 'snippet' of the matching text, HTML escaped with the matched words in
+    <mark> tags. Comments also carry their 'discussion_id', 'parent' and 'path'.
+
+    Parameters:
+    - q (query): Words to search for.
+    - type (query): Optional. 'discussion' or 'comment' to only return one type of result.
+    - page_size (query): Optional. Results per page, default 20, at most 50.
+    - cursor (query): Optional. Cursor taken from the previous page's 'next' link.
+
+    Returns:
+    - 200 OK: A page of results
+    - 400 Bad Request: If q is missing or has no words, or type or cursor are invalid
+    - 501 Not Implemented: If the database isn't SQLite, which provides the search index
+    """
+    if not search_available():
+        return Response({"error": "Search requires SQLite FTS5"}, status=501)
+    text = request.query_params.get('q', '')
+    if not text.strip():
+        return Response({"error": "Query parameter q is required"}, status=400)
+    result_type = request.query_params.get('type', None)
+    if result_type is not None and result_type not in SEARCH_TYPES:
+        return Response({"error": f"Type must be one of {', '.join(SEARCH_TYPES)}"}, status=400)
+    types = (result_type,) if result_type else tuple(SEARCH_TYPES)
+
+    paginator = SearchPagination()
+    try:
+        page = paginator.paginate_search(lambda after, limit: search(text, after, limit, types), request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    return paginator.get_paginated_response(page)
@@ -0,0 +1,210 @@
+"""
+Group commit of new comments.
+
+With COMMENT_WRITE_QUEUE on, CommentViewSet.create hands its validated comment to the
+process's CommentWriteQueue instead of writing it itself. A single writer thread takes
+whatever has queued up, waiting up to COMMENT_WRITE_BATCH_DELAY_MS for more once the
+first comment arrives (or until COMMENT_WRITE_BATCH_SIZE are there), and saves the
+whole batch in one transaction. Only after the COMMIT is each request handed its
+comment, so a 201 still means the comment is stored.
+
+Concurrent requests then share one write transaction, one lock acquisition and one WAL
+sync, rather than queueing on SQLite's write lock one transaction each. Each process
+has its own writer, so with several server processes there are as many writers, still
+far fewer than there are request threads.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .models import Comment
+
+logger = logging.getLogger(__name__)
+
+# Put on the queue by stop(), the writer drains what is ahead of it and exits
+STOP = object()
+
+
+class WriteTimeout(Exception):
+    """The comment wasn't picked up by the writer within COMMENT_WRITE_TIMEOUT, nothing was written."""
+
+
+def write_queue_enabled():
+    """
+    Whether new comments go through the write queue.
+
+    Not from inside a transaction: the writer commits on its own connection, so it
+    could neither join the caller's transaction nor see what it wrote so far (and on
+    SQLite would wait for the caller's write lock while the caller waits for it).
+    """
+    return getattr(settings, 'COMMENT_WRITE_QUEUE', False) and not connection.in_atomic_block
+
+
+class CommentWriteQueue:
+    """
+    Queue of validated comments, written in batches by one background thread.
+
+    The thread is started by the first submit(), and again after a fork (threads don't
+    survive one). Counters of the batches written are kept in `batches` and `comments`.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.comments = 0
+
+    def create(self, validated_data, timeout=None):
+        """
+        Queue a comment and wait until it is committed.
+
+        Args:
+            validated_data (dict): FlatCommentSerializer.validated_data, with the
+                'discussion' and 'parent' instances.
+            timeout (float, optional): Seconds to wait for the writer to take the
+                comment, COMMENT_WRITE_TIMEOUT by default.
+
+        Returns:
+            Comment: The committed comment.
+
+        Raises:
+            WriteTimeout: The writer didn't get to the comment in time, it won't be written.
+            Exception: Whatever writing the comment raised, e.g. IntegrityError.
+        """
+        if timeout is None:
+            timeout = getattr(settings, 'COMMENT_WRITE_TIMEOUT', 10)
+        future = self.submit(validated_data)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise WriteTimeout() from None
+        # already part of a batch being written, its outcome is only a transaction away
+        return future.result()
+
+    def submit(self, validated_data):
+        """Queue a comment, returning a Future resolved with the Comment once it is committed."""
+        future = Future()
+        self.start()
+        self._queue.put((validated_data, future))
+        return future
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='comment-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """Write what is queued and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(STOP)
+            thread.join(timeout)
+
+    def run(self):
+        try:
+            while True:
+                batch, stopping = self.next_batch()
+                if batch:
+                    self.write(batch)
+                if stopping:
+                    return
+        finally:
+            connection.close()
+
+    def next_batch(self):
+        """Block for a first comment, then collect more until the batch is full or the delay is up."""
+        max_size = getattr(settings, 'COMMENT_WRITE_BATCH_SIZE', 200)
+        delay = getattr(settings, 'COMMENT_WRITE_BATCH_DELAY_MS', 2) / 1000
+        item = self._queue.get()
+        if item is STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + delay
+        while len(batch) < max_size:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def write(self, batch):
+        """Write a batch and resolve the futures of its comments."""
+        # a request that timed out cancelled its future, don't write those
+        batch = [(data, future) for data, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        # like at the start of a request, replace a connection that is broken or too old
+        close_old_connections()
+        try:
+            outcomes = self.write_together([data for data, _future in batch])
+        except Exception as error:
+            if len(batch) == 1:
+                outcomes = [error]
+            else:
+                # the COMMIT failed (e.g. a deferred foreign key check on a parent deleted
+                # since it was validated), write them one at a time so only that one fails
+                outcomes = []
+                for data, _future in batch:
+                    try:
+                        outcomes += self.write_together([data])
+                    except Exception as error:
+                        outcomes.append(error)
+        for (_data, future), outcome in zip(batch, outcomes):
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    def write_together(self, items):
+        """
+        Save comments in one transaction, each in a savepoint so one that fails is rolled back alone.
+
+        Comments are saved like FlatCommentSerializer.create() does, so tree positions,
+        counters, closure rows and post_save (which invalidates the cached trees) work as
+        on the direct path.
+
+        Returns:
+            list: The committed Comment, or the exception saving it raised, for each item.
+
+        Raises:
+            Exception: Whatever made the transaction fail, nothing was written then. An
+                on_commit hook failing after the COMMIT is logged instead, the comments are
+                stored and writing them again would duplicate them.
+        """
+        outcomes = []
+        committed = []
+        try:
+            with transaction.atomic():
+                # the first hook to run after the COMMIT, so any later failure is after it
+                transaction.on_commit(lambda: committed.append(True))
+                for data in items:
+                    try:
+                        with transaction.atomic():
+                            comment = Comment(**data)
+                            comment.save()
+                    except Exception as error:
+                        outcomes.append(error)
+                    else:
+                        outcomes.append(comment)
+        except Exception:
+            if not committed:
+                raise
+            logger.exception("An on_commit hook failed after a batch of comments was committed")
+        self.batches += 1
+        self.comments += sum(1 for outcome in outcomes if not isinstance(outcome, Exception))
+        return outcomes
+
+
+comment_write_queue = CommentWriteQueue()